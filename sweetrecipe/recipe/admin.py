@@ -18,9 +18,10 @@ class DessertAdmin(admin.ModelAdmin):
 
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'dessert_count')
     prepopulated_fields = {"slug": ("name", )}
-    fields = ('name', 'slug')
+    fields = ('name', 'slug', 'dessert_count')
+    readonly_fields = ('dessert_count',)
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -32,8 +33,25 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'name')
     fields = ('user', 'photo', 'name', 'date_of_birth', 'date_change_pass', 'sex', 'phone')
 
+class IngredientAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key')
+    search_fields = ('name',)
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'key', 'status', 'attempts', 'run_at', 'locked_until')
+    list_filter = ('status', 'task')
+    readonly_fields = ('time_create',)
+
+class DessertViewCountAdmin(admin.ModelAdmin):
+    list_display = ('dessert', 'day', 'views')
+    list_filter = ('day',)
+    raw_id_fields = ('dessert',)
+
 admin.site.register(Dessert, DessertAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Profile, ProfileAdmin)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Comment)
+admin.site.register(Ingredient, IngredientAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(DessertViewCount, DessertViewCountAdmin)
@@ -0,0 +1,299 @@
+"""JSON API только для чтения: /api/v1/.
+
+Десерты, категории, десерты пользователя и комментарии. Поля ответа
+выбираются параметром ?fields=id,title,..., по ним же строится запрос:
+загружаются только нужные столбцы, связи подтягиваются select_related и
+prefetch_related только если запрошены. Списки листаются курсором
+(?cursor=..., ?limit=...), ответы сжимаются gzip и кэшируются так же,
+как страницы сайта (CachedResponseMixin: ETag, 304, кэш для анонимных).
+
+/api/v1/export/desserts.ndjson отдает весь каталог потоком, по десерту на
+строку: десерты читаются .iterator(chunk_size=API_EXPORT_CHUNK_SIZE),
+категории и шаги подгружаются на каждую пачку, так что память не растет
+с размером каталога.
+"""
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+
+from . import formatting
+from .cache import CachedResponseMixin
+from .categories import registry as category_registry
+from .models import Category, Comment, Dessert, Profile, Recipe
+from .pagination import paginate_by_cursor
+from .views import COMMENT_ORDERING
+
+
+DESSERT_ORDERING = ('-time_create', '-id')
+
+
+def format_datetime(value):
+    if value is None:
+        return None
+    return formatting.format_datetime(value, settings.REST_FRAMEWORK['DATETIME_FORMAT'])
+
+
+def media_url(file, request):
+    return request.build_absolute_uri(file.url) if file else None
+
+
+def profile_data(profile, request):
+    return {
+        'slug': profile.slug,
+        'name': profile.name_or_username(),
+        'url': request.build_absolute_uri(profile.get_absolute_url()),
+    }
+
+
+class Field:
+    """Поле ответа: как получить значение и что для этого загрузить"""
+
+    def __init__(self, getter, only=(), select=(), prefetch=()):
+        self.getter = getter
+        self.only = only
+        self.select = select
+        self.prefetch = prefetch
+
+
+def model_field(name, format=None):
+    if format is None:
+        return Field(lambda obj, request: getattr(obj, name), only=(name,))
+    return Field(lambda obj, request: format(getattr(obj, name)), only=(name,))
+
+
+AUTHOR_FIELD = Field(
+    lambda obj, request: profile_data(obj.profile, request),
+    only=('profile__id', 'profile__slug', 'profile__name', 'profile__user__id', 'profile__user__username'),
+    select=('profile__user',),
+)
+
+DESSERT_FIELDS = {
+    'id': model_field('id'),
+    'slug': model_field('slug'),
+    'title': model_field('title'),
+    'url': Field(lambda d, request: request.build_absolute_uri(d.get_absolute_url()), only=('slug',)),
+    'photo': Field(lambda d, request: media_url(d.photo, request), only=('photo',)),
+    'cooking_time': model_field('cooking_time'),
+    'comment_count': model_field('comment_count'),
+    'time_create': model_field('time_create', format_datetime),
+    'time_update': model_field('time_update', format_datetime),
+    'ingredients': model_field('ingredients'),
+    'description': model_field('description'),
+    'author': AUTHOR_FIELD,
+    'categories': Field(
+        lambda d, request: [{'slug': c.slug, 'name': c.name} for c in d.category.all()],
+        prefetch=(Prefetch('category', queryset=Category.objects.only('id', 'name', 'slug')),),
+    ),
+    'steps': Field(
+        lambda d, request: [{'text': s.recipe_text, 'image': media_url(s.image, request)} for s in d.recipe.all()],
+        prefetch=(Prefetch('recipe', queryset=Recipe.objects.order_by('pk').only('id', 'dessert', 'recipe_text', 'image')),),
+    ),
+}
+DESSERT_LIST_FIELDS = (
+    'id', 'slug', 'title', 'url', 'photo', 'cooking_time', 'comment_count', 'time_create', 'author', 'categories',
+)
+
+CATEGORY_FIELDS = {
+    'id': model_field('id'),
+    'slug': model_field('slug'),
+    'name': model_field('name'),
+    'dessert_count': model_field('dessert_count'),
+    'url': Field(lambda c, request: request.build_absolute_uri(c.get_absolute_url())),
+}
+
+COMMENT_FIELDS = {
+    'id': model_field('id'),
+    'text': model_field('text'),
+    'time_create': model_field('time_create', format_datetime),
+    'author': AUTHOR_FIELD,
+}
+
+
+def select_fields(request, available, default):
+    """Поля из ?fields=..., по умолчанию default"""
+    value = request.GET.get('fields')
+    if not value:
+        return list(default)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}. Доступные: {", ".join(available)}')
+    return names
+
+
+def load_fields(queryset, available, names):
+    """Ограничивает queryset столбцами и связями, нужными для полей names"""
+    specs = [available[name] for name in names]
+    only = {'id'}.union(*(spec.only for spec in specs))
+    select = set().union(*(spec.select for spec in specs))
+    prefetch = [p for spec in specs for p in spec.prefetch]
+    queryset = queryset.only(*only)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def serialize(obj, available, names, request):
+    return {name: available[name].getter(obj, request) for name in names}
+
+
+def page_size(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def cursor_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri('?' + params.urlencode())
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+@method_decorator(gzip_page, name='dispatch')
+class ApiView(CachedResponseMixin, View):
+    """Ответы API: ошибки тоже в JSON"""
+    http_method_names = ['get', 'head', 'options']
+    replica_reads = True
+    available_fields = {}
+    default_fields = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except Http404 as e:
+            return json_response({'detail': str(e) or 'Не найдено'}, status=404)
+        except BadRequest as e:
+            return json_response({'detail': str(e)}, status=400)
+
+    def get_fields(self):
+        return select_fields(self.request, self.available_fields, self.default_fields or self.available_fields)
+
+    def paginated(self, queryset, ordering):
+        fields = self.get_fields()
+        queryset = load_fields(queryset, self.available_fields, fields)
+        try:
+            page = paginate_by_cursor(queryset, ordering, page_size(self.request), self.request.GET.get('cursor'))
+        except Http404 as e:
+            # Неверный курсор - ошибка запроса, а не отсутствующий ресурс
+            raise BadRequest(str(e))
+        return json_response({
+            'results': [serialize(obj, self.available_fields, fields, self.request) for obj in page],
+            'next': cursor_url(self.request, page.next_cursor),
+            'previous': cursor_url(self.request, page.previous_cursor),
+        })
+
+
+class DessertListApi(ApiView):
+    """Опубликованные десерты, новые сверху; ?category=<slug> - только из категории"""
+    cache_namespaces = ('desserts', 'categories', 'profiles')
+    available_fields = DESSERT_FIELDS
+    default_fields = DESSERT_LIST_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        desserts = Dessert.published.all()
+        if request.GET.get('category'):
+            category = category_registry.get(request.GET['category'])
+            if category is None:
+                raise Http404('Категория не найдена')
+            desserts = desserts.filter(category=category)
+        return self.paginated(desserts, DESSERT_ORDERING)
+
+
+class DessertDetailApi(ApiView):
+    """Десерт со всеми полями, включая ингредиенты и шаги рецепта"""
+    cache_namespaces = ('dessert:{recipe_slug}', 'categories', 'profiles')
+    available_fields = DESSERT_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        queryset = load_fields(Dessert.published.all(), DESSERT_FIELDS, fields)
+        dessert = get_object_or_404(queryset, slug=self.kwargs['recipe_slug'])
+        return json_response(serialize(dessert, DESSERT_FIELDS, fields, request))
+
+
+class DessertCommentsApi(ApiView):
+    """Комментарии к десерту, новые сверху"""
+    cache_namespaces = ('dessert:{recipe_slug}', 'profiles')
+    available_fields = COMMENT_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        dessert = get_object_or_404(Dessert.published.only('pk'), slug=self.kwargs['recipe_slug'])
+        return self.paginated(Comment.objects.filter(dessert=dessert), COMMENT_ORDERING)
+
+
+class UserDessertsApi(ApiView):
+    """Опубликованные десерты пользователя"""
+    cache_namespaces = ('desserts', 'categories', 'profiles')
+    available_fields = DESSERT_FIELDS
+    default_fields = DESSERT_LIST_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        profile = get_object_or_404(Profile.objects.only('pk'), slug=self.kwargs['username_slug'])
+        return self.paginated(Dessert.published.filter(profile=profile), DESSERT_ORDERING)
+
+
+class CategoryListApi(ApiView):
+    """Все категории с числом опубликованных десертов"""
+    cache_namespaces = ('categories', 'category_counts')
+    available_fields = CATEGORY_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        return json_response({
+            'results': [serialize(c, CATEGORY_FIELDS, fields, request) for c in category_registry.all()],
+        })
+
+
+def batches(iterator, size):
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@method_decorator(gzip_page, name='dispatch')
+class DessertExportApi(View):
+    """Весь каталог опубликованных десертов в NDJSON, потоком"""
+    http_method_names = ['get', 'head']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            fields = select_fields(request, DESSERT_FIELDS, DESSERT_FIELDS)
+        except BadRequest as e:
+            return json_response({'detail': str(e)}, status=400)
+        response = StreamingHttpResponse(self.lines(fields), content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="desserts.ndjson"'
+        return response
+
+    def lines(self, fields):
+        specs = [DESSERT_FIELDS[name] for name in fields]
+        prefetch = [p for spec in specs for p in spec.prefetch]
+        # prefetch_related не работает с iterator(), связи грузятся на каждую пачку отдельно
+        queryset = load_fields(Dessert.published.order_by('pk'), DESSERT_FIELDS, fields).prefetch_related(None)
+        chunk_size = settings.API_EXPORT_CHUNK_SIZE
+        for batch in batches(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            if prefetch:
+                prefetch_related_objects(batch, *prefetch)
+            yield ''.join(
+                json.dumps(serialize(dessert, DESSERT_FIELDS, fields, self.request), ensure_ascii=False) + '\n'
+                for dessert in batch
+            )
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RecipeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe'
+
+    def ready(self):
+        # Подключение обработчиков сигналов
+        from . import cache, categories, counters, db, images, ingredients, jobs, search, trending
+
+        # Шаблоны компилируются до первого запроса воркера
+        if settings.TEMPLATE_WARMUP:
+            from .warmup import warm_on_startup
+            warm_on_startup()
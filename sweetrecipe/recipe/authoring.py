@@ -0,0 +1,60 @@
+"""Сохранение десерта вместе с шагами рецепта.
+
+Десерт, категории и шаги сохраняются в одной транзакции. Новые шаги
+добавляются одним bulk_create, измененные - одним bulk_update только по
+измененным полям, неизмененные шаги не пишутся в базу вовсе. bulk-операции
+не отправляют post_save, поэтому time_update десерта, кэш, поиск и
+обработка фото шагов обновляются здесь явно.
+"""
+from django.db import transaction
+
+from .cache import touch_dessert
+from .images import schedule_processing
+from .models import Recipe
+from .search import schedule_index
+
+
+def save_dessert(main_form, formset, profile):
+    """Сохраняет десерт из main_form и шаги из formset, возвращает десерт"""
+    with transaction.atomic():
+        dessert = main_form.save(commit=False)
+        created = dessert.pk is None
+        dessert.profile = profile
+        if created or main_form.has_changed():
+            dessert.save()
+        if created or 'category' in main_form.changed_data:
+            # Связи с категориями добавляются одним INSERT в промежуточную таблицу
+            dessert.category.set(main_form.cleaned_data['category'])
+
+        new_steps, changed_steps, changed_fields, new_images = [], [], set(), []
+        for form in formset.forms:
+            if not form.has_changed():
+                continue
+            step = form.save(commit=False)
+            step.dessert = dessert
+            if step.pk is None:
+                new_steps.append(step)
+                continue
+            fields = form.changed_data
+            for name in fields:
+                # bulk_update не вызывает pre_save, новое фото сохраняется в хранилище здесь
+                Recipe._meta.get_field(name).pre_save(step, add=False)
+            changed_steps.append(step)
+            changed_fields.update(fields)
+            if 'image' in fields:
+                new_images.append(step)
+
+        if new_steps:
+            Recipe.objects.bulk_create(new_steps)
+        if changed_steps and changed_fields:
+            Recipe.objects.bulk_update(changed_steps, sorted(changed_fields))
+
+        if new_steps or changed_steps:
+            touch_dessert(dessert.pk, dessert.slug)
+            schedule_index(dessert.pk)
+            if new_steps and new_steps[0].pk is None:
+                # На SQLite bulk_create не возвращает id, новые шаги - все, кроме уже существовавших
+                existing = [form.instance.pk for form in formset.forms if form.instance.pk]
+                new_steps = list(Recipe.objects.filter(dessert=dessert).exclude(pk__in=existing).only('pk', 'image'))
+            schedule_processing(*new_steps, *new_images)
+    return dessert
@@ -0,0 +1,13 @@
+"""Нагрузочные замеры основных страниц.
+
+data.generate заполняет базу синтетическими пользователями, десертами,
+шагами рецептов и комментариями, runner.run_scenarios прогоняет страницы
+через тестовый клиент Django и считает перцентили времени ответа, число
+SQL-запросов и пропускную способность, explain.explain_views показывает
+планы их SQL-запросов, concurrency.run_concurrency нагружает базу
+параллельными чтениями и записями, render.run_render замеряет рендер
+карточки десерта, startup.run_startup - первый запрос нового процесса с
+прогревом шаблонов и без. Запуск - команды generate_fake_data,
+run_benchmark, explain_views, run_db_benchmark, run_render_benchmark и
+warm_templates --measure.
+"""
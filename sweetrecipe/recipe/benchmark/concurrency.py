@@ -0,0 +1,143 @@
+"""Конкурентная нагрузка на базу: чтение страниц рецептов и запись комментариев.
+
+Несколько потоков, у каждого свой клиент и свое соединение с базой,
+в течение duration секунд открывают страницы десертов и с вероятностью
+write_ratio оставляют комментарий. Страницы открываются от имени
+пользователя, так что кэш ответов не участвует и каждый запрос идет в базу.
+
+Режим 'default' повторяет настройки Django по умолчанию: соединение
+закрывается после каждого запроса (CONN_MAX_AGE=0), SQLite в режиме
+журнала DELETE. Режим 'tuned' - настройки из settings (постоянные
+соединения и SQLITE_PRAGMAS). Созданные комментарии в конце удаляются.
+"""
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections
+from django.db.utils import OperationalError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Dessert
+from .data import USERNAME_PREFIX
+from .runner import client_host, git_commit, percentile
+
+
+MODES = ('default', 'tuned')
+COMMENT_TEXT = 'Комментарий нагрузочного теста'
+
+# Настройки SQLite по умолчанию; journal_mode хранится в файле базы,
+# поэтому его нужно вернуть явно
+DEFAULT_SQLITE_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full', 'mmap_size': 0}
+
+
+def mode_settings(mode):
+    if mode == 'default':
+        pragmas = dict(DEFAULT_SQLITE_PRAGMAS, busy_timeout=settings.SQLITE_PRAGMAS.get('busy_timeout', 5000))
+        return 0, pragmas
+    return settings.DATABASES['default'].get('CONN_MAX_AGE', 0), settings.SQLITE_PRAGMAS
+
+
+def worker(mode, user, slugs, write_ratio, deadline, seed, results):
+    conn_max_age, _ = mode_settings(mode)
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    rnd = random.Random(seed)
+    client = Client(HTTP_HOST=client_host())
+    client.force_login(user)
+    reads, writes, errors = [], [], 0
+    try:
+        while time.perf_counter() < deadline:
+            path = reverse('recipe', kwargs={'recipe_slug': rnd.choice(slugs)})
+            write = rnd.random() < write_ratio
+            start = time.perf_counter()
+            try:
+                if write:
+                    response = client.post(path, {'text': COMMENT_TEXT})
+                else:
+                    response = client.get(path)
+                ok = response.status_code < 400
+            except OperationalError:
+                ok = False
+            finally:
+                # Тестовый клиент не закрывает соединения по request_finished,
+                # как это делает обработчик WSGI
+                close_old_connections()
+            elapsed = time.perf_counter() - start
+            if not ok:
+                errors += 1
+            (writes if write else reads).append(elapsed)
+    finally:
+        connection.close()
+        results.append((reads, writes, errors))
+
+
+def summary(durations, total_time):
+    if not durations:
+        return {'requests': 0}
+    return {
+        'requests': len(durations),
+        'throughput_rps': round(len(durations) / total_time, 1),
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'mean_ms': round(statistics.mean(durations) * 1000, 2),
+    }
+
+
+def run_mode(mode, threads, duration, write_ratio, seed):
+    users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk')[:threads])
+    slugs = list(
+        Dessert.objects.filter(is_published=True, profile__user__username__startswith=USERNAME_PREFIX)
+        .order_by('pk').values_list('slug', flat=True)[:500]
+    )
+    if not users or not slugs:
+        raise LookupError('Нет данных для замеров, сначала выполните generate_fake_data')
+
+    _, pragmas = mode_settings(mode)
+    results = []
+    with override_settings(SQLITE_PRAGMAS=pragmas):
+        # Соединения откроются заново уже с PRAGMA выбранного режима
+        connections.close_all()
+        deadline = time.perf_counter() + duration
+        pool = [
+            threading.Thread(target=worker, args=(mode, users[i % len(users)], slugs, write_ratio, deadline, seed + i, results))
+            for i in range(threads)
+        ]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        total_time = time.perf_counter() - start
+        connections.close_all()
+
+    reads = [d for r, _, _ in results for d in r]
+    writes = [d for _, w, _ in results for d in w]
+    return {
+        'throughput_rps': round((len(reads) + len(writes)) / total_time, 1),
+        'errors': sum(e for _, _, e in results),
+        'reads': summary(reads, total_time),
+        'writes': summary(writes, total_time),
+    }
+
+
+def run_concurrency(modes=MODES, threads=8, duration=10, write_ratio=0.2, seed=1):
+    """Прогоняет нагрузку в каждом режиме, возвращает результаты для сохранения в JSON"""
+    results = {}
+    try:
+        for mode in modes:
+            results[mode] = run_mode(mode, threads, duration, write_ratio, seed)
+    finally:
+        Comment.objects.filter(text=COMMENT_TEXT).delete()
+    return {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': connection.vendor,
+        'threads': threads,
+        'duration': duration,
+        'write_ratio': write_ratio,
+        'modes': results,
+    }
@@ -0,0 +1,162 @@
+"""Синтетические данные для замеров.
+
+Все строки создаются через bulk_create пачками, сигналы при этом не
+срабатывают, поэтому счетчики категорий, индексы ингредиентов и поиска
+и версии кэша обновляются в конце явно.
+"""
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .. import categories, ingredients, search
+from ..cache import bump
+from ..images import SIZES, generate_derivatives
+from ..models import Category, Comment, Dessert, Profile, Recipe
+from ..slugs import unique_slugs
+
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+PHOTO_NAME = 'photos/benchmark/dessert.jpg'
+
+CATEGORY_NAMES = ('Торты', 'Пироги', 'Печенье', 'Пирожные', 'Кексы', 'Муссы', 'Чизкейки', 'Блины')
+ADJECTIVES = ('Шоколадный', 'Медовый', 'Ягодный', 'Ореховый', 'Творожный', 'Лимонный', 'Карамельный', 'Ванильный')
+NOUNS = ('торт', 'пирог', 'кекс', 'десерт', 'рулет', 'чизкейк', 'тарт', 'пудинг')
+INGREDIENTS = (
+    'мука - 200 г', 'сахар - 150 г', 'яйца - 3 шт', 'масло сливочное - 100 г', 'молоко - 250 мл',
+    'какао - 2 ст. л.', 'мед - 3 ст. л.', 'творог - 400 г', 'сметана - 200 г', 'грецкие орехи - 100 г',
+    'лимон - 1 шт', 'ванилин - 1 ч. л.', 'разрыхлитель - 1 ч. л.', 'сливки - 200 мл', 'клубника - 300 г',
+)
+WORDS = (
+    'смешать', 'взбить', 'добавить', 'выпекать', 'остудить', 'тесто', 'крем', 'форму', 'духовку',
+    'минут', 'градусов', 'аккуратно', 'до', 'однородности', 'посыпать', 'сверху', 'подавать', 'охлажденным',
+)
+
+
+def sentence(rnd, words=12):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def ensure_photo():
+    """Одно фото со всеми копиями на все десерты, чтобы шаблоны рендерились как с настоящими.
+
+    Возвращает имя фото и описание его копий для полей *_variants.
+    """
+    if not default_storage.exists(PHOTO_NAME):
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), (222, 184, 135)).save(buffer, 'JPEG', quality=85)
+        default_storage.save(PHOTO_NAME, ContentFile(buffer.getvalue()))
+    variants, _ = generate_derivatives(PHOTO_NAME, SIZES)
+    return PHOTO_NAME, variants
+
+
+def ensure_categories():
+    existing = set(Category.objects.filter(name__in=CATEGORY_NAMES).values_list('name', flat=True))
+    for name in CATEGORY_NAMES:
+        if name not in existing:
+            Category.objects.create(name=name)
+    return list(Category.objects.filter(name__in=CATEGORY_NAMES).values_list('pk', flat=True))
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def create_profiles(count, batch_size):
+    # Номера продолжают уже созданных пользователей, повторный запуск добавляет новых
+    offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+    password = make_password(PASSWORD)
+    usernames = [f'{USERNAME_PREFIX}{offset + i}' for i in range(count)]
+    for chunk in batches(usernames, batch_size):
+        User.objects.bulk_create([User(username=name, email=f'{name}@example.com', password=password) for name in chunk])
+        users = list(User.objects.filter(username__in=chunk).only('pk', 'username'))
+        slugs = unique_slugs(Profile, [user.username for user in users])
+        Profile.objects.bulk_create([
+            Profile(user=user, slug=slug, name=user.username.replace('_', ' ').title())
+            for user, slug in zip(users, slugs)
+        ])
+    return list(Profile.objects.filter(user__username__in=usernames).values_list('pk', flat=True))
+
+
+def create_desserts(rnd, count, profile_ids, category_ids, photo, variants, batch_size):
+    offset = Dessert.objects.count()
+    through = Dessert.category.through
+    dessert_ids = []
+    for chunk in batches(range(offset, offset + count), batch_size):
+        titles = [f'{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} {n}' for n in chunk]
+        desserts = []
+        for title, slug in zip(titles, unique_slugs(Dessert, titles)):
+            desserts.append(Dessert(
+                title=title,
+                slug=slug,
+                ingredients='\n'.join(rnd.sample(INGREDIENTS, rnd.randint(3, 8))),
+                description=' '.join(sentence(rnd) for _ in range(rnd.randint(2, 5))),
+                photo=photo,
+                photo_variants=variants,
+                cooking_time=rnd.randint(10, 240),
+                is_published=rnd.random() > 0.05,
+                profile_id=rnd.choice(profile_ids),
+            ))
+        Dessert.objects.bulk_create(desserts)
+        ids = list(Dessert.objects.filter(slug__in=[d.slug for d in desserts]).values_list('pk', flat=True))
+        through.objects.bulk_create([
+            through(dessert_id=dessert_id, category_id=category_id)
+            for dessert_id in ids
+            for category_id in rnd.sample(category_ids, rnd.randint(1, min(3, len(category_ids))))
+        ])
+        dessert_ids.extend(ids)
+    return dessert_ids
+
+
+def create_steps(rnd, dessert_ids, steps, photo, variants, batch_size):
+    rows = [
+        Recipe(dessert_id=dessert_id, recipe_text=sentence(rnd, rnd.randint(10, 40)), image=photo,
+               image_variants=variants)
+        for dessert_id in dessert_ids
+        for _ in range(rnd.randint(max(1, steps // 2), steps))
+    ]
+    Recipe.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def create_comments(rnd, dessert_ids, profile_ids, comments, batch_size):
+    rows = [
+        Comment(dessert_id=dessert_id, profile_id=rnd.choice(profile_ids), text=sentence(rnd, rnd.randint(5, 25)))
+        for dessert_id in dessert_ids
+        for _ in range(rnd.randint(0, comments * 2))
+    ]
+    Comment.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def generate(users=50, desserts=1000, steps=6, comments=5, seed=1, batch_size=500, index=True):
+    """Создает синтетические данные, возвращает число созданных строк по моделям"""
+    rnd = random.Random(seed)
+    photo, variants = ensure_photo()
+    with transaction.atomic():
+        category_ids = ensure_categories()
+        profile_ids = create_profiles(users, batch_size)
+        dessert_ids = create_desserts(rnd, desserts, profile_ids, category_ids, photo, variants, batch_size)
+        step_count = create_steps(rnd, dessert_ids, steps, photo, variants, batch_size)
+        comment_count = create_comments(rnd, dessert_ids, profile_ids, comments, batch_size)
+
+        categories.recount()
+        if index:
+            for chunk in batches(dessert_ids, batch_size):
+                ingredients.index_desserts(Dessert.objects.filter(pk__in=chunk).only('pk', 'ingredients'))
+                for dessert_id in chunk:
+                    search.index_dessert(dessert_id)
+    bump('desserts', 'categories', 'profiles')
+    return {
+        'profiles': len(profile_ids),
+        'desserts': len(dessert_ids),
+        'steps': step_count,
+        'comments': comment_count,
+    }
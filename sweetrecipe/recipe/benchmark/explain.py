@@ -0,0 +1,76 @@
+"""Планы SQL-запросов основных страниц.
+
+Каждый сценарий чтения из runner выполняется один раз от имени
+пользователя (без кэша ответов), все SELECT этого запроса прогоняются
+через EXPLAIN QUERY PLAN (SQLite) или EXPLAIN (PostgreSQL). Отмечаются
+полные просмотры таблиц и сортировки без индекса.
+
+Планировщик выбирает план по размеру таблиц, поэтому запускать стоит на
+базе с данными generate_fake_data (на PostgreSQL - после ANALYZE), на
+пустой базе полный просмотр может быть дешевле индекса.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .runner import READ_SCENARIOS, Fixtures, build_request, client_host
+
+
+# Маленькие справочники, которые читаются целиком
+ALLOWED_SCANS = {'recipe_category'}
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+POSTGRESQL_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+def explain(sql):
+    """Строки плана запроса"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0] for row in cursor.fetchall()]
+    raise NotImplementedError(f'EXPLAIN не поддерживается для {connection.vendor}')
+
+
+def analyze_plan(plan):
+    """Полностью просматриваемые таблицы и признак сортировки без индекса"""
+    if connection.vendor == 'sqlite':
+        scans = [m.group(1) for m in map(SQLITE_SCAN_RE.match, plan) if m]
+        sort = any(line.startswith('USE TEMP B-TREE FOR') and 'DISTINCT' not in line for line in plan)
+    else:
+        scans = [m.group(1) for line in plan for m in POSTGRESQL_SCAN_RE.finditer(line)]
+        sort = any(line.lstrip(' ->').startswith('Sort ') for line in plan)
+    return sorted(set(scans) - ALLOWED_SCANS), sort
+
+
+def explain_scenario(client, name, fixtures):
+    method, path, data = build_request(name, fixtures, 0)
+    with CaptureQueriesContext(connection) as queries:
+        getattr(client, method)(path, data) if data else getattr(client, method)(path)
+
+    counts = {}
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            counts[sql] = counts.get(sql, 0) + 1
+
+    results = []
+    for sql, count in counts.items():
+        plan = explain(sql)
+        scans, sort = analyze_plan(plan)
+        results.append({'sql': sql, 'count': count, 'plan': plan, 'full_scans': scans, 'temp_sort': sort})
+    return results
+
+
+def explain_views(scenarios=READ_SCENARIOS):
+    """{сценарий: [{sql, count, plan, full_scans, temp_sort}, ...]}"""
+    fixtures = Fixtures()
+    client = Client(HTTP_HOST=client_host())
+    client.force_login(User.objects.get(pk=fixtures.profile.user_id))
+    return {name: explain_scenario(client, name, fixtures) for name in scenarios}
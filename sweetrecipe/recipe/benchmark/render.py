@@ -0,0 +1,104 @@
+"""Микробенчмарк рендера карточки десерта.
+
+Замеряется только форматирование карточки: время готовки, число
+комментариев и дата публикации. Карточки собираются в памяти, база не
+нужна. Вариант 'filters' - фильтры recipe.formatting, 'legacy' - прежний
+расчет окончания в Dessert.cooking_time_mod и фильтр date. Для 'filters'
+отдельно замеряется первый рендер с пустым кэшем pluralize.
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.template import engines
+from django.utils import timezone
+
+from .. import formatting
+from ..models import Dessert
+from .runner import git_commit
+
+
+CARD_TEMPLATES = {
+    'filters': (
+        '{% load recipe_tags %}{% for d in desserts %}'
+        '<p>{{ d.comment_count|comments }}</p>'
+        '<p>Время приготовления: {{ d.cooking_time|minutes }}</p>'
+        '<p>{{ d.time_create|short_date }}</p>'
+        '{% endfor %}'
+    ),
+    'legacy': (
+        '{% for d in desserts %}'
+        '<p>Комментариев: {{ d.comment_count }}</p>'
+        '<p>Время приготовления: {{ d.cooking_time_mod }}</p>'
+        '<p>{{ d.time_create|date:"d-m-Y" }}</p>'
+        '{% endfor %}'
+    ),
+}
+VARIANTS = tuple(CARD_TEMPLATES)
+
+
+class LegacyCard:
+    """Карточка с прежней реализацией cooking_time_mod"""
+
+    def __init__(self, dessert):
+        self.comment_count = dessert.comment_count
+        self.cooking_time = dessert.cooking_time
+        self.time_create = dessert.time_create
+
+    def cooking_time_mod(self) -> str:
+        minute = str(self.cooking_time)[-2:]
+
+        if int(minute) % 10 == 1 and int(minute) != 11:
+            minute = 'минута'
+        elif int(minute) % 10 in [2, 3, 4]:
+            minute = 'минуты'
+        else:
+            minute = 'минут'
+
+        return str(self.cooking_time) + ' ' + minute
+
+
+def make_cards(count, seed):
+    rnd = random.Random(seed)
+    now = timezone.now()
+    return [
+        Dessert(
+            title=f'Десерт {i}', cooking_time=rnd.randint(10, 240), comment_count=rnd.randint(0, 50),
+            time_create=now - timedelta(days=rnd.randint(0, 365), seconds=rnd.randint(0, 86400)),
+        )
+        for i in range(count)
+    ]
+
+
+def render_time(template, cards):
+    start = time.perf_counter()
+    template.render({'desserts': cards})
+    return time.perf_counter() - start
+
+
+def run_render(cards=1000, repeat=20, seed=1):
+    """Время рендера одной карточки в микросекундах по вариантам, результаты для сохранения в JSON"""
+    desserts = make_cards(cards, seed)
+    contexts = {'filters': desserts, 'legacy': [LegacyCard(d) for d in desserts]}
+    engine = engines['django']
+    results = {}
+    for variant in VARIANTS:
+        template = engine.from_string(CARD_TEMPLATES[variant])
+        cold = None
+        if variant == 'filters':
+            formatting.pluralize.cache_clear()
+            cold = render_time(template, contexts[variant])
+        durations = [render_time(template, contexts[variant]) for _ in range(repeat)]
+        results[variant] = {
+            'us_per_card': round(statistics.median(durations) / cards * 1e6, 2),
+            'min_us_per_card': round(min(durations) / cards * 1e6, 2),
+            'cold_us_per_card': round(cold / cards * 1e6, 2) if cold is not None else None,
+        }
+    return {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cards': cards,
+        'repeat': repeat,
+        'variants': results,
+    }
@@ -0,0 +1,211 @@
+"""Прогон страниц тестовым клиентом с замером времени и SQL-запросов.
+
+Сценарий называется по имени URL, build_request строит для него запрос.
+Сценарии добавления и редактирования рецепта выполняются в транзакции,
+которая откатывается, а загруженные фото пишутся во временный MEDIA_ROOT,
+так что прогон не меняет данные.
+"""
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack, nullcontext
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..metrics import RequestStats
+from ..models import Category, Comment, Dessert, Profile
+from .data import USERNAME_PREFIX
+
+
+READ_SCENARIOS = ('home', 'recipe', 'recipe_comments', 'showcategory', 'show_user_dessert', 'category_list', 'trending',
+                  'api_dessert_list', 'api_dessert_detail')
+WRITE_SCENARIOS = ('addrecipe', 'edit_recipe')
+
+
+class Fixtures:
+    """Объекты, на которых гоняются сценарии: самый комментируемый десерт, его автор и категория"""
+
+    def __init__(self):
+        self.dessert = (
+            Dessert.objects.filter(is_published=True, profile__user__username__startswith=USERNAME_PREFIX)
+            .annotate(comment_total=Count('dessert_comment'))
+            .order_by('-comment_total', '-pk').select_related('profile__user').first()
+        )
+        if self.dessert is None:
+            raise LookupError('Нет данных для замеров, сначала выполните generate_fake_data')
+        self.profile = self.dessert.profile
+        self.category = Category.objects.order_by('-dessert_count').first()
+        self.steps = list(self.dessert.recipe.order_by('pk'))
+
+
+def image_upload():
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), (200, 150, 100)).save(buffer, 'JPEG')
+    return SimpleUploadedFile('step.jpg', buffer.getvalue(), 'image/jpeg')
+
+
+def dessert_form_data(fixtures, title, steps, initial=0):
+    data = {
+        'title': title, 'ingredients': 'мука - 200 г\nсахар - 100 г', 'description': 'Описание',
+        'cooking_time': 45, 'category': [fixtures.category.pk], 'profile': fixtures.profile.pk,
+        'form-TOTAL_FORMS': len(steps), 'form-INITIAL_FORMS': initial, 'form-MAX_NUM_FORMS': 20,
+    }
+    for i, step in enumerate(steps):
+        data.update({f'form-{i}-{name}': value for name, value in step.items()})
+    return data
+
+
+def build_request(name, fixtures, iteration):
+    """(метод, путь, данные) для сценария name"""
+    if name == 'home':
+        return 'get', reverse('home'), None
+    if name == 'recipe':
+        return 'get', fixtures.dessert.get_absolute_url(), None
+    if name == 'showcategory':
+        return 'get', fixtures.category.get_absolute_url(), None
+    if name == 'show_user_dessert':
+        return 'get', fixtures.profile.get_absolute_url(), None
+    if name == 'recipe_comments':
+        return 'get', reverse('recipe_comments', kwargs={'recipe_slug': fixtures.dessert.slug}), None
+    if name == 'category_list':
+        return 'get', reverse('category_list'), None
+    if name == 'trending':
+        return 'get', reverse('trending'), None
+    if name == 'api_dessert_list':
+        return 'get', reverse('api_dessert_list'), None
+    if name == 'api_dessert_detail':
+        return 'get', reverse('api_dessert_detail', kwargs={'recipe_slug': fixtures.dessert.slug}), None
+    if name == 'addrecipe':
+        steps = [{'recipe_text': f'Шаг {i}', 'image': image_upload()} for i in range(5)]
+        data = dessert_form_data(fixtures, f'Замер {iteration}', steps)
+        data['photo'] = image_upload()
+        return 'post', reverse('addrecipe'), data
+    if name == 'edit_recipe':
+        steps = [{'id': step.pk, 'recipe_text': step.recipe_text} for step in fixtures.steps]
+        if steps:
+            steps[0]['recipe_text'] += f' {iteration}'
+        data = dessert_form_data(fixtures, fixtures.dessert.title, steps, len(steps))
+        data['category'] = list(fixtures.dessert.category.values_list('pk', flat=True))
+        return 'post', fixtures.dessert.get_edit_url(), data
+    raise ValueError(f'Неизвестный сценарий: {name}')
+
+
+def client_host():
+    """Хост для тестового клиента, который пропустит ALLOWED_HOSTS"""
+    return next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+
+
+def percentile(values, p):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+def measure(client, name, fixtures, requests, warmup):
+    """Прогоняет сценарий, возвращает сводку по времени, запросам и статусам"""
+    durations, queries, statuses = [], [], {}
+    rollback = name in WRITE_SCENARIOS
+    for i in range(warmup + requests):
+        method, path, data = build_request(name, fixtures, i)
+        stats = RequestStats(collect_sql=False)
+        with ExitStack() as stack:
+            if rollback:
+                stack.enter_context(transaction.atomic())
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(stats))
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data) if data else getattr(client, method)(path)
+            elapsed = time.perf_counter() - start
+            if rollback:
+                transaction.set_rollback(True)
+        if i < warmup:
+            continue
+        durations.append(elapsed)
+        queries.append(stats.queries)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    total = sum(durations)
+    return {
+        'requests': len(durations),
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'p99_ms': round(percentile(durations, 99) * 1000, 2),
+        'mean_ms': round(total / len(durations) * 1000, 2),
+        'queries_per_request': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+        'throughput_rps': round(len(durations) / total, 1) if total else None,
+        'statuses': statuses,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenarios(scenarios, requests=50, warmup=5, authenticated=False):
+    """Прогоняет сценарии, возвращает результаты для сохранения в JSON.
+
+    Анонимные страницы отдаются из кэша ответов, authenticated=True
+    замеряет полный рендер от имени автора десерта.
+    """
+    fixtures = Fixtures()
+    anonymous = Client(HTTP_HOST=client_host())
+    author = Client(HTTP_HOST=client_host())
+    # Автор десерта, чтобы ему было разрешено редактирование
+    author.force_login(User.objects.get(pk=fixtures.profile.user_id))
+
+    media_root = tempfile.mkdtemp()
+    results = {}
+    try:
+        for name in scenarios:
+            writes = name in WRITE_SCENARIOS
+            client = author if authenticated or writes else anonymous
+            with override_settings(MEDIA_ROOT=media_root) if writes else nullcontext():
+                results[name] = measure(client, name, fixtures, requests, warmup)
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    return {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': connection.vendor,
+        'authenticated': authenticated,
+        'requests': requests,
+        'data': {
+            'desserts': Dessert.objects.count(),
+            'profiles': Profile.objects.count(),
+            'comments': Comment.objects.count(),
+        },
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline):
+    """Строки сравнения с прошлым прогоном: изменение p50, p95 и числа запросов"""
+    lines = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'queries_per_request'):
+            if previous[key]:
+                changes.append(f'{key} {previous[key]} -> {current[key]} ({(current[key] / previous[key] - 1) * 100:+.0f}%)')
+        lines.append(f'{name}: ' + ', '.join(changes))
+    return lines
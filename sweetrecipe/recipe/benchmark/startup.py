@@ -0,0 +1,74 @@
+"""Первый запрос нового процесса с прогревом шаблонов и без него.
+
+Каждый замер - отдельный процесс manage.py warm_templates --first-request,
+запущенный с TEMPLATE_CACHE=True и TEMPLATE_WARMUP=False ('cold') или True
+('warm'). Процесс открывает страницу дважды от имени автора десерта (кэш
+ответов не участвует, страница рендерится полностью) и печатает время
+первого и второго запроса в JSON. Разница первых запросов - время разбора
+шаблонов страницы, которое прогрев переносит на запуск процесса.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client
+
+from .. import warmup
+from .runner import Fixtures, build_request, client_host, git_commit
+
+
+MODES = ('cold', 'warm')
+SCENARIOS = ('home', 'recipe', 'showcategory', 'show_user_dessert')
+
+
+def first_request(name) -> dict:
+    """Время первого и второго запроса страницы name в текущем процессе, мс"""
+    fixtures = Fixtures()
+    client = Client(HTTP_HOST=client_host())
+    client.force_login(User.objects.get(pk=fixtures.profile.user_id))
+    method, path, _ = build_request(name, fixtures, 0)
+    durations, status = [], None
+    for _ in range(2):
+        start = time.perf_counter()
+        status = getattr(client, method)(path).status_code
+        durations.append(round((time.perf_counter() - start) * 1000, 2))
+    return {
+        'first_ms': durations[0],
+        'second_ms': durations[1],
+        'status': status,
+        'warmup_ms': warmup.last_result['elapsed_ms'] if warmup.last_result else None,
+    }
+
+
+def run_process(name, mode) -> dict:
+    env = dict(os.environ, TEMPLATE_CACHE='True', TEMPLATE_WARMUP=str(mode == 'warm'))
+    result = subprocess.run(
+        [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'warm_templates', '--first-request', name],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_startup(scenarios=SCENARIOS, runs=3):
+    """Медианы первого и второго запроса по сценариям и режимам, результаты для сохранения в JSON"""
+    results = {}
+    for name in scenarios:
+        results[name] = {}
+        for mode in MODES:
+            samples = [run_process(name, mode) for _ in range(runs)]
+            results[name][mode] = {
+                key: statistics.median(s[key] for s in samples)
+                for key in ('first_ms', 'second_ms', 'warmup_ms') if samples[0][key] is not None
+            }
+            results[name][mode]['statuses'] = sorted({s['status'] for s in samples})
+    return {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': runs,
+        'scenarios': results,
+    }
@@ -0,0 +1,275 @@
+"""Кэширование страниц и фрагментов шаблонов.
+
+Ключи кэша содержат версии пространств имен ('desserts', 'categories',
+'profiles', 'dessert:<slug>', 'comments:<id>', 'user:<id>'). Версии хранятся
+в том же кэше, поэтому общий файловый или database-кэш инвалидируется сразу
+во всех процессах. Обработчики сигналов увеличивают только версии, которые
+затрагивает изменение, остальные страницы остаются в кэше. Вместе с
+версией bump() записывает время изменения, из него строится Last-Modified.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .db import first_in_atomic_block
+from .models import Category, Comment, Dessert, Profile, Recipe
+
+
+VERSION_PREFIX = 'version:'
+CHANGED_PREFIX = 'changed:'
+
+
+def get_versions(*names) -> dict:
+    """Текущие версии пространств имен одним обращением к кэшу"""
+    keys = {VERSION_PREFIX + name: name for name in names}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, name in keys.items():
+        if key not in found:
+            # Версия могла быть вытеснена из кэша, новая не должна совпасть со старой
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            found[key] = cache.get(key)
+        versions[name] = found[key]
+    return versions
+
+
+def bump(*names):
+    """Инвалидирует все ключи, построенные на версиях этих пространств имен"""
+    now = time.time()
+    for name in names:
+        key = VERSION_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(now * 1000), timeout=None)
+    cache.set_many({CHANGED_PREFIX + name: now for name in names}, timeout=None)
+
+
+def get_changed(*names):
+    """Время последнего изменения этих пространств имен (time.time()) или None, если имен нет"""
+    keys = [CHANGED_PREFIX + name for name in set(names)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Время могло быть вытеснено из кэша вместе с изменением: считаем, что изменение только что было
+            cache.add(key, time.time(), timeout=None)
+            found[key] = cache.get(key)
+    return max(found.values(), default=None)
+
+
+def changed_within(names, seconds) -> bool:
+    """Менялось ли какое-то из пространств имен за последние seconds секунд"""
+    changed = get_changed(*names)
+    return changed is not None and time.time() - changed < seconds
+
+
+class CacheVersions:
+    """Ленивый доступ к версиям из шаблона: {{ cache_versions.categories }}"""
+
+    def __init__(self, request):
+        self.request = request
+        self.versions = {}
+
+    def __getitem__(self, name):
+        if name == 'user':
+            name = f'user:{self.request.user.pk}'
+        if name not in self.versions:
+            self.versions.update(get_versions(name))
+        return self.versions[name]
+
+
+class CachedResponseMixin:
+    """Кэширует готовые ответы для анонимных пользователей и отвечает 304 на условные GET.
+
+    cache_namespaces - версии, от которых зависит страница, строки
+    форматируются аргументами URL, например 'dessert:{recipe_slug}'.
+    ETag строится из этих версий, поэтому меняется тогда же, когда
+    устаревает закэшированный ответ, а Last-Modified - из времени их
+    последнего изменения (get_last_modified). Анонимные ответы
+    помечаются Cache-Control: public на HTTP_CACHE_MAX_AGE секунд, чтобы их
+    мог отдавать обратный прокси, остальные - private, no-cache: браузер
+    каждый раз проверяет страницу и получает 304, если она не изменилась.
+    """
+    cache_namespaces = ()
+    cache_timeout = None
+
+    def get_namespace_names(self) -> list:
+        return [name.format(**self.kwargs) for name in self.cache_namespaces]
+
+    def get_namespace_versions(self) -> dict:
+        if not hasattr(self, '_namespace_versions'):
+            self._namespace_versions = get_versions(*self.get_namespace_names())
+        return self._namespace_versions
+
+    def get_last_modified(self):
+        """Время последнего изменения данных страницы в секундах или None.
+
+        Отдается, только когда секунда изменения уже закончилась: иначе
+        следующее изменение в ту же секунду не изменило бы Last-Modified, и
+        запрос с одним If-Modified-Since получил бы 304 с устаревшей страницей.
+        Удаление и снятие с публикации тоже вызывают bump(), поэтому время не
+        идет назад, как MAX(time_update).
+        """
+        names = self.get_namespace_names()
+        if self.request.user.is_authenticated:
+            names.append(f'user:{self.request.user.pk}')
+        changed = get_changed(*names)
+        if changed is None or int(changed) >= int(time.time()):
+            return None
+        return int(changed)
+
+    def get_etag(self):
+        versions = self.get_namespace_versions()
+        parts = [self.request.get_full_path(), *map(str, versions.values())]
+        user = self.request.user
+        if user.is_authenticated:
+            # В странице меню пользователя и CSRF-токен его формы
+            user_version = f'user:{user.pk}'
+            parts += [str(user.pk), str(get_versions(user_version)[user_version]),
+                      self.request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+        return 'W/"{}"'.format(hashlib.md5('|'.join(parts).encode()).hexdigest())
+
+    def get_response_cache_key(self):
+        versions = self.get_namespace_versions()
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return 'response:{}:{}'.format(path, '.'.join(str(version) for version in versions.values()))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        timestamp = self.get_last_modified()
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = self.cached_dispatch(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        if getattr(response, 'is_rendered', True):
+            self.patch_cache_control(response)
+        else:
+            response.add_post_render_callback(self.patch_cache_control)
+        return response
+
+    def patch_cache_control(self, response):
+        request = self.request
+        if request.user.is_authenticated or request.META.get('CSRF_COOKIE_USED') or response.cookies:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Cookie',))
+
+    def cached_dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_response_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        timeout = self.cache_timeout or settings.CACHE_PAGE_TIMEOUT
+
+        def store(response):
+            # Страницы, выставляющие cookie (например, csrftoken), не кэшируются
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+
+        if getattr(response, 'is_rendered', True):
+            store(response)
+        else:
+            response.add_post_render_callback(store)
+        return response
+
+
+# Инвалидация по сигналам
+# ↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓
+
+def touch_dessert(dessert_id, slug):
+    """Обновляет time_update десерта и версии его кэша, один раз за блок atomic().
+
+    Смена категорий и шагов рецепта не сохраняет сам десерт, а от time_update
+    зависят ключ фрагмента карточки и поле time_update в API. set() категорий
+    вызывает remove() и add(), сохранение рецепта меняет несколько шагов - и
+    все это дает один UPDATE.
+    """
+    if first_in_atomic_block(f'dessert:{dessert_id}'):
+        Dessert.objects.filter(pk=dessert_id).update(time_update=timezone.now())
+        bump('desserts', f'dessert:{slug}')
+
+
+@receiver(post_save, sender=Dessert)
+@receiver(post_delete, sender=Dessert)
+def dessert_changed(sender, instance, **kwargs):
+    # time_update уже обновлен save(), категории и шаги в том же atomic() его не трогают
+    first_in_atomic_block(f'dessert:{instance.pk}')
+    bump('desserts', f'dessert:{instance.slug}')
+
+
+@receiver(m2m_changed, sender=Dessert.category.through)
+def dessert_category_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        if pk_set:
+            Dessert.objects.filter(pk__in=pk_set).update(time_update=timezone.now())
+        if first_in_atomic_block(f'category:{instance.pk}:desserts'):
+            bump('desserts', 'categories')
+    else:
+        touch_dessert(instance.pk, instance.slug)
+
+
+def dessert_slug(instance):
+    """slug десерта шага рецепта или комментария без лишнего запроса, если десерт уже загружен"""
+    if type(instance).dessert.is_cached(instance):
+        return instance.dessert.slug
+    return Dessert.objects.filter(pk=instance.dessert_id).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    if instance.dessert_id:
+        touch_dessert(instance.dessert_id, dessert_slug(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, created=True, **kwargs):
+    if not instance.dessert_id:
+        return
+    names = [f'dessert:{dessert_slug(instance)}', f'comments:{instance.dessert_id}']
+    if created:
+        # Новый или удаленный комментарий меняет comment_count в карточках списков
+        names.append('desserts')
+    bump(*names)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    bump('categories')
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    bump('profiles', f'user:{instance.user_id}')
+
+# ^^^^^^^^^^^^^^^^^^^^^^^
+# Инвалидация по сигналам
@@ -0,0 +1,123 @@
+"""Реестр категорий в памяти процесса.
+
+Категорий мало и меняются они редко, поэтому список загружается один раз
+и хранится в процессе. Актуальность проверяется по версиям 'categories'
+и 'category_counts' в кэше, так что навигация по категориям не делает
+запросов к базе, а изменения из других процессов подхватываются сразу.
+
+Category.dessert_count - число опубликованных десертов категории,
+поддерживается F()-обновлениями по сигналам m2m_changed, удаления и
+снятия с публикации десерта.
+"""
+import threading
+
+from django.db.models import Count, F, Q
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump, get_versions
+from .models import Category, Dessert
+
+
+VERSION_NAMES = ('categories', 'category_counts')
+
+
+class CategoryRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = None
+        self._categories = ()
+        self._by_slug = {}
+
+    def _load(self):
+        versions = get_versions(*VERSION_NAMES)
+        if versions == self._versions:
+            return
+        with self._lock:
+            if versions == self._versions:
+                return
+            categories = tuple(Category.objects.order_by('name'))
+            self._by_slug = {c.slug: c for c in categories}
+            self._categories = categories
+            self._versions = versions
+
+    def all(self):
+        """Все категории, отсортированные по названию"""
+        self._load()
+        return self._categories
+
+    def get(self, slug):
+        """Категория по slug или None"""
+        self._load()
+        return self._by_slug.get(slug)
+
+
+registry = CategoryRegistry()
+
+
+def recount() -> int:
+    """Пересчитывает dessert_count всех категорий по данным базы, возвращает число исправленных"""
+    counts = Category.objects.annotate(published=Count('category', filter=Q(category__is_published=True)))
+    fixed = 0
+    for category in counts:
+        if category.dessert_count != category.published:
+            fixed += Category.objects.filter(pk=category.pk).update(dessert_count=category.published)
+    bump('category_counts')
+    return fixed
+
+
+def change_counts(category_ids, delta):
+    if category_ids and delta:
+        Category.objects.filter(pk__in=category_ids).update(dessert_count=F('dessert_count') + delta)
+        bump('category_counts')
+
+
+@receiver(post_save, sender=Dessert)
+def dessert_published_changed(sender, instance, created, raw=False, **kwargs):
+    # Смену публикации определяет counters.published_changed.
+    # Новый десерт еще без категорий, их учитывает m2m_changed
+    delta = getattr(instance, '_published_delta', 0)
+    if created or raw or not delta:
+        return
+    category_ids = list(instance.category.values_list('pk', flat=True))
+    change_counts(category_ids, delta)
+
+
+@receiver(pre_delete, sender=Dessert)
+def dessert_deleted(sender, instance, **kwargs):
+    # Связи удаляются каскадом без m2m_changed, поэтому счетчики уменьшаются здесь
+    if instance.is_published:
+        change_counts(list(instance.category.values_list('pk', flat=True)), -1)
+
+
+@receiver(m2m_changed, sender=Dessert.category.through)
+def dessert_category_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Dessert.category.through
+
+    if not reverse:
+        if action == 'pre_remove':
+            instance._removed_category_ids = list(
+                through.objects.filter(dessert=instance, category__in=pk_set).values_list('category_id', flat=True)
+            )
+        elif action == 'pre_clear':
+            instance._removed_category_ids = list(instance.category.values_list('pk', flat=True))
+        elif not instance.is_published:
+            return
+        elif action == 'post_add':
+            change_counts(pk_set, 1)
+        elif action in ('post_remove', 'post_clear'):
+            change_counts(getattr(instance, '_removed_category_ids', []), -1)
+        return
+
+    # Обратная сторона связи: instance - категория, pk_set - id десертов
+    if action == 'pre_remove':
+        instance._removed_published = through.objects.filter(
+            category=instance, dessert__in=pk_set, dessert__is_published=True).count()
+    elif action == 'pre_clear':
+        instance._removed_published = through.objects.filter(
+            category=instance, dessert__is_published=True).count()
+    elif action == 'post_add':
+        change_counts([instance.pk], Dessert.objects.filter(pk__in=pk_set, is_published=True).count())
+    elif action in ('post_remove', 'post_clear'):
+        change_counts([instance.pk], -getattr(instance, '_removed_published', 0))
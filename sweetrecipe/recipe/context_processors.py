@@ -0,0 +1,11 @@
+from django.conf import settings
+
+from .cache import CacheVersions
+
+
+def cache_versions(request):
+    """Версии и время жизни кэша для ключей фрагментов в шаблонах"""
+    return {
+        'cache_versions': CacheVersions(request),
+        'cache_timeout': settings.CACHE_PAGE_TIMEOUT,
+    }
@@ -0,0 +1,94 @@
+"""Денормализованные счетчики.
+
+Dessert.comment_count, Profile.dessert_count (опубликованные десерты) и
+Profile.comment_count поддерживаются F()-обновлениями по сигналам, поэтому
+страницы показывают числа без COUNT(*). Расхождения, например после
+изменений в обход ORM, исправляет manage.py reconcile_counters.
+
+Здесь же отслеживается смена публикации десерта: pre_save записывает в
+instance._published_delta +1, -1 или 0, этим пользуются и счетчики
+категорий.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Comment, Dessert, Profile
+
+
+def count_subquery(model, field, **filters):
+    """Подзапрос с числом строк model, ссылающихся на внешнюю строку через field"""
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+# Счетчик: (модель, поле, подзапрос с правильным значением)
+COUNTERS = (
+    (Dessert, 'comment_count', lambda: count_subquery(Comment, 'dessert')),
+    (Profile, 'dessert_count', lambda: count_subquery(Dessert, 'profile', is_published=True)),
+    (Profile, 'comment_count', lambda: count_subquery(Comment, 'profile')),
+)
+
+
+def recount() -> dict:
+    """Исправляет разошедшиеся счетчики одним UPDATE на счетчик, возвращает число исправленных строк"""
+    fixed = {}
+    for model, field, expected in COUNTERS:
+        name = f'{model._meta.model_name}.{field}'
+        fixed[name] = model.objects.exclude(**{field: expected()}).update(**{field: expected()})
+    return fixed
+
+
+def change(model, pk, field, delta):
+    if pk and delta:
+        rows = model.objects.filter(pk=pk)
+        if delta < 0:
+            rows = rows.filter(**{f'{field}__gte': -delta})
+        rows.update(**{field: F(field) + delta})
+
+
+@receiver(post_init, sender=Dessert)
+def remember_published(sender, instance, **kwargs):
+    if 'is_published' in instance.__dict__:
+        instance._published_on_load = instance.is_published
+
+
+@receiver(pre_save, sender=Dessert)
+def published_changed(sender, instance, raw=False, **kwargs):
+    loaded = getattr(instance, '_published_on_load', None)
+    if raw or instance._state.adding or loaded is None or loaded == instance.is_published:
+        instance._published_delta = 0
+    else:
+        instance._published_delta = 1 if instance.is_published else -1
+
+
+@receiver(post_save, sender=Dessert)
+def dessert_saved(sender, instance, created, raw=False, **kwargs):
+    instance._published_on_load = instance.is_published
+    if raw:
+        return
+    delta = int(instance.is_published) if created else instance._published_delta
+    change(Profile, instance.profile_id, 'dessert_count', delta)
+
+
+@receiver(post_delete, sender=Dessert)
+def dessert_deleted(sender, instance, **kwargs):
+    if instance.is_published:
+        change(Profile, instance.profile_id, 'dessert_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change(Dessert, instance.dessert_id, 'comment_count', 1)
+        change(Profile, instance.profile_id, 'comment_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    change(Dessert, instance.dessert_id, 'comment_count', -1)
+    change(Profile, instance.profile_id, 'comment_count', -1)
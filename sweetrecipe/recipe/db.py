@@ -0,0 +1,97 @@
+"""Настройка соединений с базой.
+
+Для SQLite каждое новое соединение получает PRAGMA из SQLITE_PRAGMAS:
+в режиме WAL чтение не блокируется записью, busy_timeout заставляет
+писателя ждать освобождения блокировки, а не падать с "database is
+locked", synchronous=normal в WAL убирает fsync на каждую транзакцию.
+
+Постоянные соединения (CONN_MAX_AGE) Django закрывает только по
+возрасту или после ошибки, поэтому соединение, оборванное сервером
+(перезапуск PostgreSQL, pgbouncer), всплыло бы ошибкой в запросе
+пользователя. Поэтому при DB_CONN_HEALTH_CHECKS (настройка проекта, в
+Django 3.2 такой проверки нет) в начале запроса проверяются соединения,
+оставшиеся открытыми с прошлых запросов; мертвое закрывается, и
+следующий запрос к базе откроет новое. Соединения, которые еще не
+открыты, и соединения с SQLite, где is_usable() всегда True, не
+проверяются, так что при CONN_MAX_AGE=0 проверки нет вовсе.
+
+first_in_atomic_block() и first_in_transaction() отмечают ключи в текущей
+транзакции (один UPDATE или одна задача на несколько изменений). Отметки
+хранятся в реестре на обертке соединения по точкам сохранения; Django
+держит их колбэком on_commit и выбрасывает вместе с откатываемым блоком
+или после коммита, а реестр ссылается на них слабо.
+"""
+import weakref
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(connection, pragmas):
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection, settings.SQLITE_PRAGMAS)
+
+
+@receiver(request_started)
+def check_reused_connections(**kwargs):
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    # Устаревшие по CONN_MAX_AGE уже закрыты close_old_connections, открытыми
+    # остались только соединения, которые запрос получит от прошлых
+    for connection in connections.all():
+        if connection.connection is None or connection.vendor == 'sqlite' or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+class AtomicMarks(set):
+    """Ключи, отмеченные в одном блоке atomic().
+
+    Регистрируется колбэком on_commit блока, так что живет, пока блок не
+    откачен и транзакция не завершена.
+    """
+
+    def __call__(self):
+        pass
+
+
+def mark_once(key, whole_transaction=False) -> bool:
+    """True, если key еще не отмечен в текущем блоке atomic() (или во всей транзакции)"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return True
+    registry = connection.__dict__.setdefault('atomic_marks', weakref.WeakValueDictionary())
+    # atomic(savepoint=False) (save(), set(), bulk-операции) добавляет в список None:
+    # такие блоки относятся к внешнему. Внутри транзакции id точек сохранения не повторяются.
+    savepoints = [sid for sid in connection.savepoint_ids if sid is not None]
+    block = savepoints[-1] if savepoints else ''
+    scopes = list(registry.values()) if whole_transaction else [registry.get(block, ())]
+    if any(key in marks for marks in scopes):
+        return False
+    marks = registry.get(block)
+    if marks is None:
+        marks = registry[block] = AtomicMarks()
+        transaction.on_commit(marks)
+    marks.add(key)
+    return True
+
+
+def first_in_atomic_block(key) -> bool:
+    """True, если key еще не встречался в текущем блоке atomic(); вне транзакции - всегда"""
+    return mark_once(key)
+
+
+def first_in_transaction(key) -> bool:
+    """True, если key еще не встречался в транзакции, не считая откаченных блоков"""
+    return mark_once(key, whole_transaction=True)
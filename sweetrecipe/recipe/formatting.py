@@ -0,0 +1,89 @@
+"""Форматирование чисел и дат для шаблонов.
+
+Форма слова после числа (1 минута, 2 минуты, 5 минут) определяется по
+остатку от деления на 100; номера форм для всех 100 остатков посчитаны
+заранее в PLURAL_FORMS. Готовые строки "<число> <слово>" запоминаются
+lru_cache: на страницах повторяются одни и те же значения (время готовки,
+число комментариев), так что почти все вызовы берутся из кэша.
+
+Фильтры шаблонов регистрируются в templatetags/recipe_tags.py.
+"""
+from functools import lru_cache
+
+from django.utils import timezone
+
+
+MINUTES = ('минута', 'минуты', 'минут')
+COMMENTS = ('комментарий', 'комментария', 'комментариев')
+RECIPES = ('рецепт', 'рецепта', 'рецептов')
+
+
+def plural_index(n: int) -> int:
+    """Номер формы: 0 - 1, 21, 101; 1 - 2-4, 22-24; 2 - 0, 5-20, 25-30"""
+    if 11 <= n % 100 <= 14:
+        return 2
+    last = n % 10
+    if last == 1:
+        return 0
+    if 2 <= last <= 4:
+        return 1
+    return 2
+
+
+PLURAL_FORMS = tuple(plural_index(n) for n in range(100))
+
+
+def plural_word(n: int, forms) -> str:
+    return forms[PLURAL_FORMS[abs(n) % 100]]
+
+
+@lru_cache(maxsize=2048)
+def pluralize(n: int, forms: tuple) -> str:
+    """Число со словом в нужной форме: pluralize(5, MINUTES) -> '5 минут'"""
+    return f'{n} {plural_word(n, forms)}'
+
+
+def minutes(n) -> str:
+    return pluralize(int(n or 0), MINUTES)
+
+
+def comments(n) -> str:
+    return pluralize(int(n or 0), COMMENTS)
+
+
+def recipes(n) -> str:
+    return pluralize(int(n or 0), RECIPES)
+
+
+@lru_cache(maxsize=128)
+def parse_forms(forms: str) -> tuple:
+    """'рецепт,рецепта,рецептов' -> кортеж форм для pluralize"""
+    parsed = tuple(form.strip() for form in forms.split(','))
+    if len(parsed) != 3:
+        raise ValueError(f'Нужны три формы слова через запятую: {forms}')
+    return parsed
+
+
+DATE_FORMAT = '%d-%m-%Y'
+DATETIME_FORMAT = '%d-%m-%Y %H:%M'
+
+
+def format_datetime(value, format=DATETIME_FORMAT) -> str:
+    """Дата или дата и время в местном часовом поясе, strftime вместо разбора формата фильтра date"""
+    if value is None or value == '':
+        return ''
+    if getattr(value, 'tzinfo', None) is not None:
+        value = timezone.localtime(value)
+    return value.strftime(format)
+
+
+def format_date(value) -> str:
+    return format_datetime(value, DATE_FORMAT)
+
+
+PHONE_FORMAT = '8 ({}{}{}) {}{}{}-{}{}-{}{}'
+
+
+def format_phone(digits: str) -> str:
+    """Десять цифр номера без кода страны в виде 8 (XXX) XXX-XX-XX"""
+    return PHONE_FORMAT.format(*digits)
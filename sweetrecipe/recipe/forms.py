@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordResetForm, SetPasswordForm
 from django.core.exceptions import ValidationError
+from django.template.loader import render_to_string
 from django.contrib.auth.models import User
 from django_currentuser.middleware import get_current_authenticated_user
 from datetime import datetime
@@ -8,6 +9,8 @@ from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
 
 
+from .formatting import format_phone
+from .jobs import enqueue
 from .models import *
 
 
@@ -70,21 +73,44 @@ class AddRecipeMainForm(forms.ModelForm):
 
 class AddRecipeForm(forms.ModelForm):
     """Форма для пошагового рецепта для десерта"""
+    # Десерт шагу назначает authoring.save_dessert
     class Meta:
         model = Recipe
-        fields = ['recipe_text', 'image', 'dessert']
+        fields = ['recipe_text', 'image']
 
         widgets = {
             'recipe_text': forms.Textarea(attrs=
             {'class': 'form-control', 'rows': 7}),
             'image': forms.FileInput(attrs=
             {'class': 'form-control'}),
-            'dessert': forms.HiddenInput
         }
 
-        labels = {
-            'dessert': ''
-        }
+
+class RecipeStepIdField(forms.ModelChoiceField):
+    """id шага, проверяется по шагам, уже загруженным формсетом"""
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        step = self.formset._existing_object(Recipe._meta.pk.to_python(value))
+        if step is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return step
+
+
+class BaseRecipeFormSet(forms.BaseModelFormSet):
+    """Формсет шагов рецепта без запроса к базе на каждый шаг при проверке"""
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        name = self.model._meta.pk.name
+        field = form.fields[name]
+        form.fields[name] = RecipeStepIdField(
+            self, field.queryset, initial=field.initial, required=False, widget=field.widget)
 
 
 class RegisterUserForm(UserCreationForm):
@@ -220,7 +246,7 @@ class UpdateUserPhoneForm(forms.ModelForm):
                 raise ValidationError('Номер должен начинаться на 7 или 8')
             else:
                 phone.pop(0)
-        return ('8 ({}{}{}) {}{}{}-{}{}-{}{}'.format(*''.join(phone)))
+        return format_phone(''.join(phone))
 
 
 class AuthUserPassForm(forms.ModelForm):
@@ -268,6 +294,14 @@ class PasswordResetViewForm(PasswordResetForm):
         model = User
         fields = ('email', )
 
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        """Письмо отправляет воркер, запрос не ждет SMTP-сервер"""
+        subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+        body = render_to_string(email_template_name, context)
+        html = render_to_string(html_email_template_name, context) if html_email_template_name else None
+        enqueue('mail.send', subject=subject, body=body, from_email=from_email, to=[to_email], html=html)
+
 
 class PasswordResetConfirmViewForm(SetPasswordForm):
     new_password1 = forms.CharField(label='Пароль', widget=forms.PasswordInput(attrs={'class': 'form-control', 'placeholder': 'Пароль должен содержать как минимум 8 символов'}))
@@ -305,4 +339,21 @@ class AddCategoryForm(forms.ModelForm):
         widgets = {
             'name': forms.TextInput(attrs=
             {'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+
+class IngredientSearchForm(forms.Form):
+    """Список ингредиентов через запятую или с новой строки"""
+    ingredients = forms.CharField(label='Ваши ингредиенты', widget=forms.Textarea(attrs=
+    {'class': 'form-control',
+    'rows': 4,
+    'placeholder': 'Например:\nмука пшеничная\nяйцо\nсгущенное молоко'}))
+
+    def clean_ingredients(self):
+        ingredients = [i.strip() for i in self.cleaned_data['ingredients'].replace(',', '\n').splitlines()]
+        ingredients = [i for i in ingredients if i]
+        if not ingredients:
+            raise ValidationError('Укажите хотя бы один ингредиент')
+        if len(ingredients) > 30:
+            raise ValidationError('Можно указать не более 30 ингредиентов')
+        return ingredients
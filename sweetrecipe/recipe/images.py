@@ -0,0 +1,315 @@
+"""Уменьшенные копии загруженных фото.
+
+Для каждого фото рядом с оригиналом сохраняются копии нескольких ширин в
+JPEG и WebP: photos/2022/11/28/cake.jpg -> cake.card-300.jpg,
+cake.card-600.webp, ... Тег {% picture %} выводит их в srcset с
+настоящей шириной каждой копии, браузер выбирает подходящую по sizes.
+
+Какие копии созданы, записывается в поле <поле фото>_variants того же
+объекта (Dessert.photo_variants и т. д.) фоновой задачей, которая их
+создает. Шаблоны берут список оттуда, не обращаясь к хранилищу; пока
+копий нет или они сделаны для прежнего фото - выводится оригинал.
+"""
+import logging
+import os
+import tempfile
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .cache import bump, dessert_slug
+from .jobs import enqueue_many, task
+from .models import Dessert, Profile, Recipe
+
+
+# Копии фото: (ширины для srcset, высота самой широкой копии, обрезать до точного размера)
+SIZES = {
+    'card': ((300, 600), 500, False),
+    'detail': ((600, 1200), 1200, False),
+    'avatar': ((70, 140), 140, True),
+}
+
+# Атрибут sizes по умолчанию: какую ширину страницы занимает фото
+DISPLAY_SIZES = {
+    'card': '(min-width: 768px) 25vw, 100vw',
+    'detail': '(min-width: 768px) 60vw, 100vw',
+    'avatar': '70px',
+}
+
+# Поля с фото и нужные для них копии
+IMAGE_FIELDS = {
+    Dessert: ('photo', ('card', 'detail')),
+    Recipe: ('image', ('detail',)),
+    Profile: ('photo', ('avatar',)),
+}
+
+FORMATS = ['jpg'] + (['webp'] if features.check('webp') else [])
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+
+# Image.LANCZOS устарел в Pillow 9.1, Image.Resampling нет в старых версиях
+RESAMPLE = getattr(Image, 'Resampling', Image).LANCZOS
+
+EXIF_ORIENTATION = 0x0112
+
+logger = logging.getLogger(__name__)
+
+
+def variants_field(field: str) -> str:
+    return f'{field}_variants'
+
+
+def derivative_name(name: str, kind: str, width: int, ext: str) -> str:
+    root, _ = os.path.splitext(name)
+    return f'{root}.{kind}-{width}.{ext}'
+
+
+def is_derivative(name: str) -> bool:
+    root = os.path.splitext(name)[0]
+    return os.path.splitext(root)[1].lstrip('.').split('-')[0] in SIZES
+
+
+def oriented_size(image) -> tuple:
+    """Размер фото с учетом поворота из EXIF, без декодирования"""
+    width, height = image.size
+    if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def variant_sizes(size, kind) -> dict:
+    """{ширина в имени копии: (ширина, высота)} для фото размера size.
+
+    Фото не увеличиваются, поэтому у небольших фото копии разных ширин
+    могут совпасть - такие повторы пропускаются.
+    """
+    widths, max_height, crop = SIZES[kind]
+    result = {}
+    for width in widths:
+        height = round(max_height * width / widths[-1])
+        if crop:
+            target = (width, height)
+        else:
+            scale = min(width / size[0], height / size[1], 1)
+            target = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+        if target not in result.values():
+            result[width] = target
+    return result
+
+
+def encode(image, ext) -> bytes:
+    buffer = BytesIO()
+    if ext == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name: str, kinds, force=False) -> tuple:
+    """Создает копии фото name для видов kinds.
+
+    Возвращает (описание копий для поля *_variants, число новых файлов).
+    Описание: {'name': name, 'formats': [...], 'card': [[300, 300], [600, 600]]} -
+    для каждого вида ширина в имени файла и настоящая ширина копии.
+    """
+    if not name or is_derivative(name):
+        return {}, 0
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        plan = {kind: variant_sizes(oriented_size(image), kind) for kind in kinds}
+        targets = [
+            (kind, width, ext) for kind in kinds for width in plan[kind] for ext in FORMATS
+            if force or not default_storage.exists(derivative_name(name, kind, width, ext))
+        ]
+        if targets:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+    resized = {}
+    for kind, width, ext in targets:
+        if (kind, width) not in resized:
+            size, crop = plan[kind][width], SIZES[kind][2]
+            resized[kind, width] = ImageOps.fit(image, size, RESAMPLE) if crop else image.resize(size, RESAMPLE)
+        replace_file(derivative_name(name, kind, width, ext), encode(resized[kind, width], ext))
+
+    variants = {'name': name, 'formats': FORMATS}
+    for kind in kinds:
+        variants[kind] = [[width, size[0]] for width, size in plan[kind].items()]
+    return variants, len(targets)
+
+
+def variant_updates(model, variants) -> dict:
+    """Поля для записи копий фото в объекты model"""
+    updates = {variants_field(IMAGE_FIELDS[model][0]): variants}
+    if model is Dessert:
+        # Ключ фрагмента карточки десерта включает time_update
+        updates['time_update'] = timezone.now()
+    return updates
+
+
+def has_variants(instance) -> bool:
+    """Копии текущего фото уже записаны в объект.
+
+    Отложенное поле *_variants (only()) не загружается, тогда считается,
+    что копий нет.
+    """
+    field = IMAGE_FIELDS[type(instance)][0]
+    variants = instance.__dict__.get(variants_field(field)) or {}
+    return variants.get('name') == getattr(instance, field).name
+
+
+def record_variants(instance, variants):
+    """Записывает созданные копии в объект и сбрасывает кэш страниц, где он показан.
+
+    Если в объекте уже те же копии, ничего не пишется и кэш не сбрасывается.
+    """
+    model = type(instance)
+    field = IMAGE_FIELDS[model][0]
+    if instance.__dict__.get(variants_field(field)) == variants:
+        return
+    # Если фото успели заменить, копии старого не записываются
+    if not model.objects.filter(pk=instance.pk, **{field: variants['name']}).update(**variant_updates(model, variants)):
+        return
+    if model is Dessert:
+        bump('desserts', f'dessert:{instance.slug}')
+    elif model is Recipe:
+        bump(f'dessert:{dessert_slug(instance)}')
+    else:
+        bump('profiles', f'user:{instance.user_id}')
+
+
+def process_instance(instance, force=False):
+    field, kinds = IMAGE_FIELDS[type(instance)]
+    file = getattr(instance, field)
+    if not file:
+        return
+    try:
+        variants, _ = generate_derivatives(file.name, kinds, force=force)
+    except (OSError, UnidentifiedImageError) as e:
+        # Без копий шаблоны показывают оригинал, сохранение не должно падать
+        logger.warning('Не удалось обработать фото %s: %s', file.name, e)
+        return
+    if variants:
+        record_variants(instance, variants)
+
+
+def picture_sources(file, kind) -> tuple:
+    """URL самой широкой JPEG-копии и srcset по форматам: ('...card-600.jpg', {'jpg': '... 300w, ... 600w', ...}).
+
+    Копии берутся из поля *_variants объекта фото; если их нет - (None, {}).
+    Отложенное поле (only()) не загружается отдельным запросом.
+    """
+    if not file:
+        return None, {}
+    variants = file.instance.__dict__.get(variants_field(file.field.name))
+    if not variants or variants.get('name') != file.name or not variants.get(kind):
+        return None, {}
+    srcsets = {
+        ext: ', '.join(
+            f'{default_storage.url(derivative_name(file.name, kind, width, ext))} {actual}w'
+            for width, actual in variants[kind]
+        )
+        for ext in variants['formats']
+    }
+    largest = variants[kind][-1][0]
+    return default_storage.url(derivative_name(file.name, kind, largest, 'jpg')), srcsets
+
+
+def replace_file(name: str, content: bytes):
+    """Записывает content в файл хранилища name, заменяя старый.
+
+    В локальном хранилище файл пишется под временным именем и подменяется
+    через os.replace: старое содержимое доступно до последнего момента и
+    остается на месте, если запись не удалась.
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(content))
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(temp_path, default_storage.file_permissions_mode or 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def strip_exif(name: str) -> bool:
+    """Убирает из оригинала EXIF (геолокацию, данные камеры), сохраняя ориентацию.
+
+    Файлы без EXIF не перекодируются.
+    """
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        if not image.getexif() or image.format not in ('JPEG', 'PNG', 'WEBP'):
+            return False
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(buffer, 'JPEG', quality=95)
+    else:
+        image.save(buffer, image_format)
+    replace_file(name, buffer.getvalue())
+    return True
+
+
+@task('images.process')
+def process_image_task(model, pk):
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    file = getattr(instance, IMAGE_FIELDS[type(instance)][0])
+    if not file:
+        return
+    try:
+        strip_exif(file.name)
+    except (OSError, UnidentifiedImageError) as e:
+        # Файла нет или это не изображение: повтор задачи не поможет
+        logger.warning('Не удалось обработать фото %s: %s', file.name, e)
+        return
+    process_instance(instance)
+
+
+def schedule_processing(*instances):
+    """Ставит обработку фото объектов в фоновую очередь.
+
+    Вызывается для новых или замененных фото: сохранение объекта с прежним
+    фото задачу не ставит (image_saved).
+    """
+    calls = []
+    for instance in instances:
+        if getattr(instance, IMAGE_FIELDS[type(instance)][0]):
+            model = instance._meta.label
+            calls.append((f'images.process:{model}:{instance.pk}', {'model': model, 'pk': instance.pk}))
+    enqueue_many('images.process', calls)
+
+
+@receiver(post_save, sender=Dessert)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Profile)
+def image_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    field = IMAGE_FIELDS[sender][0]
+    if raw or (update_fields is not None and field not in update_fields):
+        return
+    # Правка описания или сохранение профиля вместе с User не меняют фото:
+    # повторная обработка только сбросила бы кэш карточек
+    if not getattr(instance, field) or has_variants(instance):
+        return
+    schedule_processing(instance)
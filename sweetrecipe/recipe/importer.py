@@ -0,0 +1,365 @@
+"""Массовый импорт рецептов из NDJSON или CSV.
+
+NDJSON - по рецепту на строку, в том же виде, что отдает выгрузка
+/api/v1/export/desserts.ndjson:
+
+    {"title": "Медовик", "ingredients": "мука - 200 г\\nмед - 3 ст. л.",
+     "description": "...", "cooking_time": 90, "photo": "medovik.jpg",
+     "categories": ["Торты"], "author": "username",
+     "steps": [{"text": "Испечь коржи", "image": "medovik/1.jpg"}]}
+
+CSV - те же колонки; категории и фото шагов перечисляются через ";",
+тексты шагов в колонке steps разделяются пустой строкой.
+
+Пути к фото берутся относительно папки или zip-архива с медиафайлами.
+Фото каждой пачки обрабатываются в пуле процессов (EXIF, уменьшенные
+копии) и сохраняются в photos/import/<путь в архиве>, после чего пачка
+записывается в одной транзакции через bulk_create. Сигналы bulk_create не
+вызывает, поэтому индексы ингредиентов и поиска строятся для пачки явно,
+а счетчики и версии кэша обновляются в конце.
+
+После каждой пачки в файл контрольной точки пишется число обработанных
+строк, прерванный импорт продолжается с него.
+"""
+import csv
+import json
+import os
+import posixpath
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q
+
+from . import categories, counters, ingredients, search
+from .cache import bump
+from .images import IMAGE_FIELDS, generate_derivatives, strip_exif
+from .models import Category, Dessert, Profile, Recipe
+from .slugs import unique_slugs
+
+
+IMPORT_PREFIX = 'photos/import/'
+LIST_SEPARATOR = ';'
+
+
+class RowError(ValueError):
+    """Строку нельзя импортировать"""
+
+
+class MediaSource:
+    """Медиафайлы из папки или zip-архива"""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path) if path and zipfile.is_zipfile(path) else None
+
+    def read(self, name):
+        if self.zip is not None:
+            return self.zip.read(name)
+        if not self.path:
+            raise FileNotFoundError(name)
+        with open(os.path.join(self.path, *name.split('/')), 'rb') as f:
+            return f.read()
+
+
+def media_name(value) -> str:
+    """Путь фото внутри медиафайлов; URL из выгрузки API превращается в путь от MEDIA_URL"""
+    if not value:
+        return ''
+    path = urlparse(value).path if '://' in value else value
+    if path.startswith(settings.MEDIA_URL):
+        path = path[len(settings.MEDIA_URL):]
+    path = posixpath.normpath(path.lstrip('/'))
+    if path.startswith('..'):
+        raise RowError(f'Недопустимый путь к фото: {value}')
+    return path
+
+
+# Источник медиафайлов в процессе пула, открывается один раз
+_source = None
+
+
+def open_source(path):
+    global _source
+    _source = MediaSource(path)
+
+
+def store_image(task):
+    """Сохраняет фото из источника в хранилище и создает копии.
+
+    Возвращает (путь, (имя в хранилище, описание копий), ошибка).
+    """
+    name, kinds = task
+    target = IMPORT_PREFIX + name
+    try:
+        # Фото, сохраненные до прерванного импорта, не перезаписываются
+        if not default_storage.exists(target):
+            saved = default_storage.save(target, ContentFile(_source.read(name)))
+            strip_exif(saved)
+            target = saved
+        variants, _ = generate_derivatives(target, kinds)
+    except Exception as e:
+        return name, None, str(e) or type(e).__name__
+    return name, (target, variants), None
+
+
+def split_list(value):
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in (value or '').split(LIST_SEPARATOR) if item.strip()]
+
+
+def parse_row(raw) -> dict:
+    """Проверяет и приводит строку NDJSON или CSV к полям десерта"""
+    title = (raw.get('title') or '').strip()
+    if not title:
+        raise RowError('Нет названия')
+    try:
+        cooking_time = int(raw.get('cooking_time') or 0)
+    except (TypeError, ValueError):
+        raise RowError(f'Время готовки не число: {raw.get("cooking_time")}')
+    if not 0 < cooking_time < 32768:
+        raise RowError(f'Недопустимое время готовки: {cooking_time}')
+
+    ingredients_text = raw.get('ingredients') or ''
+    if isinstance(ingredients_text, list):
+        ingredients_text = '\n'.join(ingredients_text)
+    if not ingredients.parse_ingredients(ingredients_text):
+        raise RowError('Нет ингредиентов')
+
+    steps = raw.get('steps') or []
+    if isinstance(steps, str):
+        texts = [text.strip() for text in steps.split('\n\n') if text.strip()]
+        images = split_list(raw.get('step_images'))
+        if len(images) != len(texts):
+            raise RowError('Число фото шагов не совпадает с числом шагов')
+        steps = [{'text': text, 'image': image} for text, image in zip(texts, images)]
+    steps = [(step.get('text') or '', media_name(step.get('image'))) for step in steps]
+
+    photo = media_name(raw.get('photo'))
+    if not photo or not all(image for _, image in steps):
+        raise RowError('Нет фото десерта или шага')
+
+    author = raw.get('author') or ''
+    if isinstance(author, dict):
+        author = author.get('slug') or ''
+    published = raw.get('is_published', True)
+    if isinstance(published, str):
+        published = published.strip().lower() not in ('0', 'false', 'no', 'нет')
+
+    return {
+        'title': title[:255],
+        'ingredients': ingredients_text,
+        'description': raw.get('description') or '',
+        'cooking_time': cooking_time,
+        'photo': photo,
+        'categories': [(c.get('slug') or c.get('name')) if isinstance(c, dict) else c for c in split_list(raw.get('categories'))],
+        'author': author,
+        'is_published': bool(published),
+        'steps': steps,
+    }
+
+
+def read_rows(path, format=None):
+    """Строки файла как словари; формат по расширению, если не указан"""
+    format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, encoding='utf-8', newline='') as f:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield RowError(f'Некорректный JSON: {e}')
+                continue
+            yield row if isinstance(row, dict) else RowError('Строка не JSON-объект')
+
+
+def read_checkpoint(path, source):
+    try:
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    return checkpoint['rows'] if checkpoint.get('input') == source else 0
+
+
+def write_checkpoint(path, source, rows):
+    # Запись через временный файл, чтобы прерывание не оставило его пустым
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'input': source, 'rows': rows}, f)
+    os.replace(path + '.tmp', path)
+
+
+class Importer:
+
+    def __init__(self, media=None, workers=None, default_author=None, create_categories=True, index=True):
+        self.media = media
+        self.workers = workers
+        self.default_author = default_author
+        self.create_categories = create_categories
+        self.index = index
+        self.pool = None
+        self.profiles = {}
+        self.categories = None
+        self.errors = []
+
+    def __enter__(self):
+        if self.workers != 0:
+            # Процессы пула создаются fork и не должны наследовать соединения с базой
+            connections.close_all()
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=open_source, initargs=(self.media,))
+            self.pool.submit(int).result()
+        else:
+            open_source(self.media)
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def error(self, number, message):
+        self.errors.append((number, message))
+
+    def store_images(self, rows):
+        """Обрабатывает фото пачки, возвращает {путь: (имя в хранилище, описание копий)} для сохраненных"""
+        kinds = {}
+        for _, row in rows:
+            kinds.setdefault(row['photo'], set()).update(IMAGE_FIELDS[Dessert][1])
+            for _, image in row['steps']:
+                kinds.setdefault(image, set()).update(IMAGE_FIELDS[Recipe][1])
+        tasks = [(name, tuple(sorted(k))) for name, k in kinds.items()]
+        results = self.pool.map(store_image, tasks, chunksize=8) if self.pool else map(store_image, tasks)
+        stored = {}
+        for name, target, error in results:
+            if error:
+                self.error(None, f'{name}: {error}')
+            else:
+                stored[name] = target
+        return stored
+
+    def resolve_profiles(self, rows):
+        names = {row['author'] or self.default_author for _, row in rows} - set(self.profiles) - {None, ''}
+        if names:
+            found = Profile.objects.filter(Q(user__username__in=names) | Q(slug__in=names))
+            for slug, username, pk in found.values_list('slug', 'user__username', 'pk'):
+                self.profiles[slug] = self.profiles[username] = pk
+
+    def resolve_categories(self, rows):
+        if self.categories is None:
+            self.categories = {}
+            for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug'):
+                self.categories[name.lower()] = self.categories[slug.lower()] = pk
+        for _, row in rows:
+            for name in row['categories']:
+                if name.lower() not in self.categories and self.create_categories:
+                    self.categories[name.lower()] = Category.objects.create(name=name[:100]).pk
+
+    def import_batch(self, rows) -> int:
+        """Импортирует пачку [(номер строки, поля)], возвращает число созданных десертов"""
+        stored = self.store_images(rows)
+        self.resolve_profiles(rows)
+        self.resolve_categories(rows)
+
+        valid = []
+        for number, row in rows:
+            profile_id = self.profiles.get(row['author'] or self.default_author)
+            category_ids = [self.categories.get(c.lower()) for c in row['categories']]
+            if profile_id is None:
+                self.error(number, f'Неизвестный автор: {row["author"] or self.default_author}')
+            elif None in category_ids:
+                self.error(number, f'Неизвестные категории: {", ".join(row["categories"])}')
+            elif row['photo'] not in stored or not all(image in stored for _, image in row['steps']):
+                self.error(number, 'Не удалось сохранить фото')
+            else:
+                valid.append((row, profile_id, set(category_ids)))
+        if not valid:
+            return 0
+
+        through = Dessert.category.through
+        with transaction.atomic():
+            desserts = [
+                Dessert(
+                    title=row['title'], slug=slug, ingredients=row['ingredients'], description=row['description'],
+                    photo=stored[row['photo']][0], photo_variants=stored[row['photo']][1],
+                    cooking_time=row['cooking_time'], is_published=row['is_published'], profile_id=profile_id,
+                )
+                for (row, profile_id, _), slug in zip(valid, unique_slugs(Dessert, [row['title'] for row, _, _ in valid]))
+            ]
+            Dessert.objects.bulk_create(desserts)
+            # SQLite не возвращает id из bulk_create, поэтому они читаются по slug
+            ids = dict(Dessert.objects.filter(slug__in=[d.slug for d in desserts]).values_list('slug', 'pk'))
+            for dessert in desserts:
+                dessert.pk = ids[dessert.slug]
+            through.objects.bulk_create([
+                through(dessert_id=dessert.pk, category_id=category_id)
+                for dessert, (_, _, category_ids) in zip(desserts, valid)
+                for category_id in category_ids
+            ])
+            Recipe.objects.bulk_create([
+                Recipe(dessert_id=dessert.pk, recipe_text=text, image=stored[image][0], image_variants=stored[image][1])
+                for dessert, (row, _, _) in zip(desserts, valid)
+                for text, image in row['steps']
+            ])
+            if self.index:
+                ingredients.index_desserts(desserts)
+                for dessert in desserts:
+                    search.index_dessert(dessert.pk)
+        return len(desserts)
+
+
+def import_recipes(path, media=None, format=None, batch_size=500, workers=None, checkpoint=None,
+                   default_author=None, create_categories=True, index=True, progress=None) -> dict:
+    """Импортирует рецепты из файла path, возвращает число созданных, пропущенных строк и скорость.
+
+    progress(rows, created, elapsed) вызывается после каждой пачки.
+    """
+    source = os.path.abspath(path)
+    skip = read_checkpoint(checkpoint, source) if checkpoint else 0
+    started = time.monotonic()
+    rows = created = 0
+    with Importer(media, workers, default_author, create_categories, index) as importer:
+        batch = []
+        for number, raw in enumerate(read_rows(path, format), 1):
+            if number <= skip:
+                continue
+            rows += 1
+            try:
+                if isinstance(raw, RowError):
+                    raise raw
+                batch.append((number, parse_row(raw)))
+            except RowError as e:
+                importer.error(number, str(e))
+            if len(batch) == batch_size:
+                created += importer.import_batch(batch)
+                batch = []
+                if checkpoint:
+                    write_checkpoint(checkpoint, source, number)
+                if progress:
+                    progress(rows, created, time.monotonic() - started)
+        if batch:
+            created += importer.import_batch(batch)
+        if checkpoint:
+            write_checkpoint(checkpoint, source, skip + rows)
+
+    if created:
+        categories.recount()
+        counters.recount()
+        bump('desserts', 'categories', 'profiles')
+    elapsed = time.monotonic() - started
+    return {
+        'rows': rows,
+        'skipped_rows': skip,
+        'created': created,
+        'errors': importer.errors,
+        'elapsed': elapsed,
+        'rows_per_second': rows / elapsed if elapsed else 0,
+    }
@@ -0,0 +1,194 @@
+"""Структурированный индекс ингредиентов.
+
+Каждая строка поля Dessert.ingredients ("сгущенное молоко - 300г") разбирается
+на ингредиент, количество и единицу измерения. Ингредиенты хранятся в таблице
+Ingredient под нормализованным ключом, связи с десертами - в DessertIngredient
+с уникальным индексом (ingredient, dessert), по которому и ищутся десерты.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import (Case, Count, F, FloatField, IntegerField, Max, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Cast
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Dessert, DessertIngredient, Ingredient
+from .search import STOP_WORDS, stem
+
+
+SEPARATOR_RE = re.compile(r'\s+[-–—:]\s*|\s*[–—:]\s+')
+AMOUNT_RE = re.compile(r'^(?P<quantity>\d+(?:[.,]\d+)?(?:/\d+)?)?\s*(?P<unit>[^\d\s].*)?$')
+# Количество в конце строки: "сахар 1,5 ст. л.", "яйца 2 шт", "мука 200г"; единица - до двух слов
+TRAILING_AMOUNT_RE = re.compile(r'^(?P<name>.*?\D)\s+(?P<amount>\d+(?:[.,]\d+)?(?:/\d+)?(?:\s*[^\d\s]+){0,2})$')
+WORD_RE = re.compile(r'[a-zа-яё]+')
+
+UNITS = {
+    'г': 'г', 'гр': 'г', 'грамм': 'г', 'грамма': 'г', 'граммов': 'г',
+    'кг': 'кг', 'килограмм': 'кг',
+    'мл': 'мл', 'миллилитров': 'мл',
+    'л': 'л', 'литр': 'л', 'литра': 'л',
+    'шт': 'шт', 'штук': 'шт', 'штуки': 'шт', 'штука': 'шт',
+    'ст.л': 'ст. л.', 'стл': 'ст. л.', 'столовая ложка': 'ст. л.', 'столовые ложки': 'ст. л.', 'столовых ложек': 'ст. л.',
+    'ч.л': 'ч. л.', 'чл': 'ч. л.', 'чайная ложка': 'ч. л.', 'чайные ложки': 'ч. л.', 'чайных ложек': 'ч. л.',
+    'стакан': 'стакан', 'стакана': 'стакан', 'стаканов': 'стакан',
+    'щепотка': 'щепотка', 'щепотки': 'щепотка', 'щепоток': 'щепотка',
+}
+
+
+def normalize_unit(unit: str) -> str:
+    unit = unit.strip().lower().rstrip('.').replace('. ', '.')
+    return UNITS.get(unit, unit[:20])
+
+
+def parse_quantity(value: str):
+    if not value:
+        return None
+    try:
+        if '/' in value:
+            numerator, denominator = value.split('/')
+            return (Decimal(numerator.replace(',', '.')) / Decimal(denominator)).quantize(Decimal('0.01'))
+        return Decimal(value.replace(',', '.'))
+    except (InvalidOperation, ZeroDivisionError):
+        return None
+
+
+def ingredient_key(name: str) -> str:
+    """Нормализованный ключ ингредиента: основы слов без учета порядка и регистра"""
+    words = WORD_RE.findall(name.lower().replace('ё', 'е'))
+    return ' '.join(sorted(stem(w) for w in words if w not in STOP_WORDS))[:100]
+
+
+def parse_line(line: str):
+    """Разбирает строку "сгущенное молоко - 300г" в (название, количество, единица)"""
+    line = line.strip().strip('-•*').strip()
+    if not line:
+        return None
+
+    parts = SEPARATOR_RE.split(line, 1)
+    if len(parts) == 2:
+        name, amount = parts
+    else:
+        match = TRAILING_AMOUNT_RE.match(line)
+        name, amount = (match.group('name'), match.group('amount')) if match else (line, '')
+
+    quantity, unit = None, ''
+    match = AMOUNT_RE.match(amount.strip())
+    if match:
+        quantity = parse_quantity(match.group('quantity'))
+        unit = normalize_unit(match.group('unit') or '')
+
+    name = name.strip().lower()[:100]
+    if not ingredient_key(name):
+        return None
+    return name, quantity, unit
+
+
+def parse_ingredients(text: str) -> list:
+    """Разбирает все строки поля ингредиентов, пропуская пустые и повторы"""
+    result = {}
+    for line in text.splitlines():
+        parsed = parse_line(line)
+        if parsed is not None:
+            result.setdefault(ingredient_key(parsed[0]), parsed)
+    return list(result.items())
+
+
+def get_or_create_ingredients(names: dict) -> dict:
+    """По словарю {ключ: название} возвращает {ключ: id} за постоянное число запросов"""
+    existing = dict(Ingredient.objects.filter(key__in=names).values_list('key', 'id'))
+    missing = [Ingredient(key=key, name=name) for key, name in names.items() if key not in existing]
+    if missing:
+        Ingredient.objects.bulk_create(missing, ignore_conflicts=True)
+        existing.update(Ingredient.objects.filter(key__in=[i.key for i in missing]).values_list('key', 'id'))
+    return existing
+
+
+def index_desserts(desserts):
+    """Перестраивает строки DessertIngredient для пачки десертов"""
+    parsed = {dessert.pk: parse_ingredients(dessert.ingredients) for dessert in desserts}
+    names = {key: line[0] for lines in parsed.values() for key, line in lines}
+    ids = get_or_create_ingredients(names)
+
+    rows = [
+        DessertIngredient(dessert_id=dessert_id, ingredient_id=ids[key],
+                          quantity=quantity, unit=unit, position=position)
+        for dessert_id, lines in parsed.items()
+        for position, (key, (name, quantity, unit)) in enumerate(lines)
+    ]
+    with transaction.atomic():
+        DessertIngredient.objects.filter(dessert_id__in=parsed).delete()
+        DessertIngredient.objects.bulk_create(rows)
+    return len(rows)
+
+
+def normalize_query(names) -> set:
+    return {key for key in (ingredient_key(name) for name in names) if key}
+
+
+def key_matches(query_key: str, key: str) -> bool:
+    """Каждое слово запроса - начало какого-то слова ключа: "мук" подходит к "мук пшеничн" """
+    words = key.split()
+    return all(any(word.startswith(token) for word in words) for token in query_key.split())
+
+
+def key_condition(query_key: str) -> Q:
+    condition = Q()
+    for token in query_key.split():
+        # Слова ключа разделены пробелами, слово ищется в начале ключа или после пробела
+        condition &= Q(key__startswith=token) | Q(key__contains=' ' + token)
+    return condition
+
+
+def matching_ingredients(keys) -> dict:
+    """{ключ запроса: id ингредиентов, в ключах которых есть все его слова} одним запросом"""
+    condition = Q()
+    for key in keys:
+        condition |= key_condition(key)
+    found = Ingredient.objects.filter(condition).values_list('id', 'key')
+    matches = {key: set() for key in keys}
+    for pk, ingredient in found:
+        for key in keys:
+            if key_matches(key, ingredient):
+                matches[key].add(pk)
+    return matches
+
+
+def desserts_by_ingredients(names, limit=48):
+    """Опубликованные десерты с указанными ингредиентами, по убыванию доли совпадения.
+
+    Ингредиент запроса совпадает с ингредиентом десерта по словам: "мука"
+    находит и "мука пшеничная". matched - сколько ингредиентов запроса
+    нашлось в десерте, total - сколько всего ингредиентов в десерте.
+    Возвращает список словарей с полями dessert (id), matched и total.
+    """
+    matches = {key: ids for key, ids in matching_ingredients(normalize_query(names)).items() if ids}
+    if not matches:
+        return []
+
+    total = (
+        DessertIngredient.objects.filter(dessert=OuterRef('dessert'))
+        .values('dessert').annotate(total=Count('*')).values('total')
+    )
+    # Ингредиент запроса засчитывается один раз, даже если подошли несколько ингредиентов десерта
+    matched = sum(
+        (Max(Case(When(ingredient__in=ids, then=1), default=0, output_field=IntegerField())) for ids in matches.values()),
+        Value(0),
+    )
+    return list(
+        DessertIngredient.objects
+        .filter(ingredient__in=set().union(*matches.values()), dessert__is_published=True)
+        .values('dessert')
+        .annotate(matched=matched, total=Subquery(total))
+        .annotate(coverage=Cast('matched', FloatField()) / Cast(F('total'), FloatField()))
+        .order_by('-coverage', '-matched', 'dessert')[:limit]
+    )
+
+
+@receiver(post_save, sender=Dessert)
+def dessert_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'ingredients' not in update_fields):
+        return
+    index_desserts([instance])
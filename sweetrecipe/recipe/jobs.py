@@ -0,0 +1,139 @@
+"""Очередь фоновых задач в таблице Job.
+
+Задача регистрируется декоратором @task, ставится в очередь через
+enqueue() и выполняется командой manage.py run_worker. Воркер захватывает
+задачу условным UPDATE и держит ее занятой до locked_until (visibility
+timeout): если воркер упал, по истечении времени задачу заберет другой.
+При ошибке задача повторяется с экспоненциальной задержкой.
+
+При JOBS_EAGER = True задачи выполняются сразу после коммита транзакции,
+без воркера - так удобнее при разработке.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .db import first_in_transaction
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name, max_attempts=5):
+    """Регистрирует функцию как фоновую задачу с именем name"""
+    def decorator(func):
+        TASKS[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, key='', delay=0, **kwargs):
+    """Ставит задачу в очередь. Если задача с тем же key еще ждет, новая не создается"""
+    func, max_attempts = TASKS[name]
+
+    if settings.JOBS_EAGER:
+        # Одна задача с ключом выполняется один раз за транзакцию, например
+        # переиндексация десерта после сохранения всех шагов рецепта. Ключ из
+        # откаченного блока atomic() пропадает вместе с его колбэком
+        if key and not first_in_transaction(f'job:{key}'):
+            return None
+        transaction.on_commit(lambda: run_eager(name, func, kwargs))
+        return None
+
+    if key and Job.objects.filter(key=key, status=Job.PENDING).exists():
+        return None
+    return Job.objects.create(
+        task=name, kwargs=kwargs, key=key, max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def run_eager(name, func, kwargs):
+    """Выполняет задачу после коммита; ошибка задачи не должна ломать запрос, уже записавший данные"""
+    try:
+        func(**kwargs)
+    except Exception:
+        logger.exception('Задача %s завершилась с ошибкой', name)
+
+
+def enqueue_many(name, calls):
+    """Ставит в очередь несколько задач name одним INSERT, calls - пары (key, kwargs)"""
+    calls = list(calls)
+    if settings.JOBS_EAGER:
+        for key, kwargs in calls:
+            enqueue(name, key=key, **kwargs)
+        return
+    _, max_attempts = TASKS[name]
+    keys = [key for key, _ in calls if key]
+    waiting = set(Job.objects.filter(key__in=keys, status=Job.PENDING).values_list('key', flat=True)) if keys else set()
+    now = timezone.now()
+    new_jobs = []
+    for key, kwargs in calls:
+        if key and key in waiting:
+            continue
+        waiting.add(key)
+        new_jobs.append(Job(task=name, kwargs=kwargs, key=key, max_attempts=max_attempts, run_at=now))
+    Job.objects.bulk_create(new_jobs)
+
+
+def available(now):
+    """Задачи, которые можно взять: ждущие или брошенные упавшим воркером"""
+    return Job.objects.filter(
+        Q(status=Job.PENDING) | Q(status=Job.RUNNING, locked_until__lt=now),
+        run_at__lte=now,
+    )
+
+
+def claim(limit, visibility_timeout):
+    """Захватывает до limit задач, каждую ровно одним воркером"""
+    now = timezone.now()
+    claimed = []
+    for pk in available(now).order_by('run_at', 'id').values_list('pk', flat=True)[:limit]:
+        # Условный UPDATE: если задачу успел взять другой воркер, обновится 0 строк
+        updated = available(now).filter(pk=pk).update(
+            status=Job.RUNNING,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed))
+
+
+def run(job):
+    """Выполняет захваченную задачу и фиксирует результат"""
+    try:
+        func, _ = TASKS[job.task]
+        func(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Задача %s #%s завершилась с ошибкой (попытка %s)', job.task, job.pk, job.attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, locked_until=None, last_error=error)
+        else:
+            retry_at = timezone.now() + timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING, locked_until=None, run_at=retry_at, last_error=error)
+        return False
+    else:
+        Job.objects.filter(pk=job.pk).delete()
+        return True
+    finally:
+        close_old_connections()
+
+
+@task('mail.send')
+def send_mail(subject, body, from_email, to, html=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html:
+        message.attach_alternative(html, 'text/html')
+    message.send()
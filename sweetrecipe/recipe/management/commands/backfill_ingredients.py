@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipe.ingredients import index_desserts
+from recipe.models import Dessert
+
+
+class Command(BaseCommand):
+    help = 'Заполняет индекс ингредиентов для всех существующих десертов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch, desserts, rows = [], 0, 0
+        for dessert in Dessert.objects.only('id', 'ingredients').iterator(chunk_size=batch_size):
+            batch.append(dessert)
+            if len(batch) == batch_size:
+                rows += index_desserts(batch)
+                desserts += len(batch)
+                batch = []
+        if batch:
+            rows += index_desserts(batch)
+            desserts += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано десертов: {desserts}, строк ингредиентов: {rows}'))
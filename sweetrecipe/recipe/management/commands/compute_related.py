@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipe.related import compute_related
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие десерты для десертов, измененных после прошлого расчета'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать все десерты')
+
+    def handle(self, *args, **options):
+        result = compute_related(full=options['full'])
+        mode = 'полный' if result['full'] else 'частичный'
+        self.stdout.write(self.style.SUCCESS(
+            f'Расчет {mode}: обработано десертов {result["desserts"]}, записано строк {result["rows"]}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipe import trending
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает оценки популярности десертов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', action='store_true',
+                            help='Поставить периодический пересчет в очередь фоновых задач вместо расчета сейчас')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            trending.schedule()
+            self.stdout.write(self.style.SUCCESS('Пересчет популярности поставлен в очередь'))
+            return
+        count = trending.compute_scores()
+        self.stdout.write(self.style.SUCCESS(f'Популярных десертов: {count}'))
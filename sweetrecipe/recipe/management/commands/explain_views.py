@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.benchmark import explain, runner
+
+
+class Command(BaseCommand):
+    help = 'Показывает планы SQL-запросов основных страниц и отмечает полные просмотры таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                            help=f'Сценарии: {", ".join(runner.READ_SCENARIOS)} (по умолчанию все)')
+        parser.add_argument('--all', action='store_true', help='Показать планы всех запросов, а не только отмеченных')
+        parser.add_argument('--strict', action='store_true', help='Завершиться с ошибкой, если есть полные просмотры')
+        parser.add_argument('--output', help='Сохранить планы в JSON-файл')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or runner.READ_SCENARIOS
+        unknown = set(scenarios) - set(runner.READ_SCENARIOS)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        try:
+            results = explain.explain_views(scenarios)
+        except (LookupError, NotImplementedError) as e:
+            raise CommandError(e)
+
+        flagged = 0
+        for name, queries in results.items():
+            scans = sum(1 for q in queries if q['full_scans'])
+            flagged += scans
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: запросов {len(queries)}, с полным просмотром {scans}'))
+            for query in queries:
+                if not (options['all'] or query['full_scans'] or query['temp_sort']):
+                    continue
+                notes = [f'полный просмотр {", ".join(query["full_scans"])}'] if query['full_scans'] else []
+                if query['temp_sort']:
+                    notes.append('сортировка без индекса')
+                style = self.style.WARNING if query['full_scans'] else self.style.NOTICE
+                self.stdout.write(style(f'  x{query["count"]} {"; ".join(notes) or "ok"}'))
+                self.stdout.write(f'    {query["sql"]}')
+                for line in query['plan']:
+                    self.stdout.write(f'      {line}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Планы сохранены в {options["output"]}'))
+        if flagged and options['strict']:
+            raise CommandError(f'Запросов с полным просмотром таблиц: {flagged}')
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe.benchmark import data
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, десертами, шагами и комментариями для замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--desserts', type=int, default=1000)
+        parser.add_argument('--steps', type=int, default=6, help='Наибольшее число шагов рецепта у десерта')
+        parser.add_argument('--comments', type=int, default=5, help='Среднее число комментариев у десерта')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--no-index', action='store_true', help='Не строить индексы поиска и ингредиентов')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        created = data.generate(
+            users=options['users'], desserts=options['desserts'], steps=options['steps'],
+            comments=options['comments'], seed=options['seed'], batch_size=options['batch_size'],
+            index=not options['no_index'],
+        )
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f'{name}: {count}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Создано {summary} за {elapsed:.1f} с'))
@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipe.cache import bump
+from recipe.images import IMAGE_FIELDS, generate_derivatives, variant_updates, variants_field
+
+
+def process(task):
+    model, name, kinds, force = task
+    try:
+        variants, created = generate_derivatives(name, kinds, force=force)
+        return model, name, variants, created, None
+    except Exception as e:
+        return model, name, None, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии и WebP для всех загруженных фото и записывает их в поля *_variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Число процессов (по умолчанию - число ядер)')
+        parser.add_argument('--force', action='store_true', help='Пересоздать уже существующие копии')
+
+    def handle(self, *args, **options):
+        tasks, stored = [], {}
+        models = {model._meta.label: model for model in IMAGE_FIELDS}
+        for label, model in models.items():
+            field, kinds = IMAGE_FIELDS[model]
+            rows = model.objects.exclude(**{field: ''}).values_list(field, variants_field(field))
+            for name, variants in rows.iterator():
+                if (label, name) not in stored:
+                    tasks.append((label, name, kinds, options['force']))
+                stored.setdefault((label, name), []).append(variants)
+
+        # Дочерним процессам соединения с базой не нужны и не должны наследоваться
+        connections.close_all()
+
+        started = time.monotonic()
+        created = errors = updated = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for label, name, variants, count, error in pool.map(process, tasks, chunksize=16):
+                created += count
+                if error:
+                    errors += 1
+                    self.stderr.write(f'{name}: {error}')
+                elif variants and any(old != variants for old in stored[label, name]):
+                    # Для десертов обновляется и time_update: он входит в ключ фрагмента карточки
+                    model = models[label]
+                    field = IMAGE_FIELDS[model][0]
+                    updated += model.objects.filter(**{field: name}).update(**variant_updates(model, variants))
+        if updated:
+            # Карточки и страницы рецептов перерисуются уже с копиями
+            bump('desserts', 'profiles', 'related')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Фото: {len(tasks)}, создано файлов: {created}, обновлено объектов: {updated}, ошибок: {errors}, '
+            f'время: {elapsed:.1f} с'
+        ))
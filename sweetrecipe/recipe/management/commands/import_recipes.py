@@ -0,0 +1,51 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.importer import import_recipes
+
+
+class Command(BaseCommand):
+    help = 'Импортирует рецепты из NDJSON или CSV вместе с фото из папки или zip-архива'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .ndjson, .jsonl или .csv')
+        parser.add_argument('--media', help='Папка или zip-архив с фото')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--author', help='Пользователь (username или slug профиля) для строк без автора')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов для фото (по умолчанию - число ядер, 0 - без пула)')
+        parser.add_argument('--checkpoint', help='Файл контрольной точки (по умолчанию - <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Начать сначала, не учитывая контрольную точку')
+        parser.add_argument('--no-create-categories', action='store_true', help='Пропускать строки с неизвестными категориями')
+        parser.add_argument('--no-index', action='store_true', help='Не строить индексы поиска и ингредиентов')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл не найден: {path}')
+        if options['media'] and not os.path.exists(options['media']):
+            raise CommandError(f'Медиафайлы не найдены: {options["media"]}')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        def progress(rows, created, elapsed):
+            if options['verbosity'] >= 1:
+                self.stdout.write(f'Строк: {rows}, создано десертов: {created}, {rows / elapsed:.0f} строк/с')
+
+        result = import_recipes(
+            path, media=options['media'], format=options['format'], batch_size=options['batch_size'],
+            workers=options['workers'], checkpoint=checkpoint, default_author=options['author'],
+            create_categories=not options['no_create_categories'], index=not options['no_index'],
+            progress=progress,
+        )
+        for number, message in result['errors']:
+            self.stderr.write(f'Строка {number}: {message}' if number else message)
+        if result['skipped_rows']:
+            self.stdout.write(f'Пропущено по контрольной точке: {result["skipped_rows"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {result["rows"]}, создано десертов: {result["created"]}, ошибок: {len(result["errors"])}, '
+            f'время: {result["elapsed"]:.1f} с, {result["rows_per_second"]:.0f} строк/с'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipe import search
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает поисковый индекс десертов'
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index()
+        backend = type(search.get_backend()).__name__
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано десертов: {count} ({backend})'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipe import categories, counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики десертов, профилей и категорий'
+
+    def handle(self, *args, **options):
+        fixed = counters.recount()
+        fixed['category.dessert_count'] = categories.recount()
+        for name, count in fixed.items():
+            self.stdout.write(f'{name}: исправлено {count}')
+        self.stdout.write(self.style.SUCCESS(f'Исправлено строк: {sum(fixed.values())}'))
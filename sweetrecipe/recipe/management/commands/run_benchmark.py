@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.benchmark import runner
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время ответа и число SQL-запросов основных страниц'
+
+    def add_arguments(self, parser):
+        scenarios = runner.READ_SCENARIOS + runner.WRITE_SCENARIOS
+        parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                            help=f'Сценарии: {", ".join(scenarios)} (по умолчанию все)')
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5, help='Запросов на прогрев, не входят в результат')
+        parser.add_argument('--authenticated', action='store_true',
+                            help='Читать страницы авторизованным пользователем, без кэша ответов')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--compare', help='JSON-файл прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or runner.READ_SCENARIOS + runner.WRITE_SCENARIOS
+        unknown = set(scenarios) - set(runner.READ_SCENARIOS + runner.WRITE_SCENARIOS)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        try:
+            results = runner.run_scenarios(
+                scenarios, requests=options['requests'],
+                warmup=options['warmup'], authenticated=options['authenticated'],
+            )
+        except LookupError as e:
+            raise CommandError(e)
+
+        self.stdout.write(f'{"сценарий":<20}{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}{"SQL":>8}{"запр/с":>10}  статусы')
+        for name, r in results['scenarios'].items():
+            statuses = ' '.join(f'{code}x{count}' for code, count in sorted(r['statuses'].items()))
+            self.stdout.write(
+                f'{name:<20}{r["p50_ms"]:>10}{r["p95_ms"]:>10}{r["p99_ms"]:>10}'
+                f'{r["queries_per_request"]:>8}{r["throughput_rps"]:>10}  {statuses}'
+            )
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            self.stdout.write(f'\nСравнение с {baseline.get("commit") or options["compare"]}:')
+            for line in runner.compare(results, baseline):
+                self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.benchmark import concurrency
+
+
+class Command(BaseCommand):
+    help = 'Замеряет пропускную способность базы при параллельном чтении и записи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modes', nargs='*', metavar='mode',
+                            help=f'Режимы: {", ".join(concurrency.MODES)} (по умолчанию оба)')
+        parser.add_argument('--threads', type=int, default=8, help='Число параллельных клиентов')
+        parser.add_argument('--duration', type=float, default=10, help='Длительность режима в секундах')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Доля запросов с записью комментария')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        modes = options['modes'] or concurrency.MODES
+        unknown = set(modes) - set(concurrency.MODES)
+        if unknown:
+            raise CommandError(f'Неизвестные режимы: {", ".join(sorted(unknown))}')
+        try:
+            results = concurrency.run_concurrency(
+                modes, threads=options['threads'], duration=options['duration'],
+                write_ratio=options['write_ratio'],
+            )
+        except LookupError as e:
+            raise CommandError(e)
+
+        self.stdout.write(f'{"режим":<10}{"запр/с":>10}{"ошибок":>8}{"чтение p50":>12}{"p95":>10}{"запись p50":>12}{"p95":>10}')
+        for mode, r in results['modes'].items():
+            reads, writes = r['reads'], r['writes']
+            self.stdout.write(
+                f'{mode:<10}{r["throughput_rps"]:>10}{r["errors"]:>8}'
+                f'{reads.get("p50_ms", "-"):>12}{reads.get("p95_ms", "-"):>10}'
+                f'{writes.get("p50_ms", "-"):>12}{writes.get("p95_ms", "-"):>10}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipe.benchmark import render
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время форматирования карточки десерта в шаблоне'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000, help='Карточек в одном рендере')
+        parser.add_argument('--repeat', type=int, default=20, help='Число рендеров на вариант')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        results = render.run_render(cards=options['cards'], repeat=options['repeat'])
+
+        self.stdout.write(f'{"вариант":<10}{"мкс/карточку":>14}{"мин":>8}{"холодный":>10}')
+        for variant, r in results['variants'].items():
+            cold = r['cold_us_per_card'] if r['cold_us_per_card'] is not None else '-'
+            self.stdout.write(f'{variant:<10}{r["us_per_card"]:>14}{r["min_us_per_card"]:>8}{cold:>10}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
@@ -0,0 +1,32 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipe import jobs
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер очереди фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, в секундах')
+        parser.add_argument('--visibility-timeout', type=int, default=settings.JOBS_VISIBILITY_TIMEOUT)
+        parser.add_argument('--once', action='store_true', help='Выполнить доступные задачи и выйти')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        self.stdout.write(f'Воркер запущен, потоков: {threads}, задачи: {", ".join(sorted(jobs.TASKS))}')
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            while True:
+                claimed = jobs.claim(threads * 2, options['visibility_timeout'])
+                if claimed:
+                    results = list(pool.map(jobs.run, claimed))
+                    self.stdout.write(f'Выполнено: {sum(results)}, с ошибкой: {results.count(False)}')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
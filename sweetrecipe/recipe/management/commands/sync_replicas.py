@@ -0,0 +1,26 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик (DB_REPLICAS) для проверки чтения с реплик локально'
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('Реплики не настроены, задайте DB_REPLICAS')
+        source = connections['default']
+        if source.vendor != 'sqlite':
+            raise CommandError('Репликация PostgreSQL настраивается на серверах базы, команда только для SQLite')
+
+        source.ensure_connection()
+        for alias in settings.REPLICA_DATABASES:
+            connections[alias].close()
+            target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: {settings.DATABASES[alias]["NAME"]}'))
@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.benchmark import startup
+from recipe.warmup import warm_templates
+
+
+class Command(BaseCommand):
+    help = 'Компилирует все шаблоны и сообщает об ошибках; с --measure замеряет первый запрос с прогревом и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--measure', nargs='*', metavar='scenario',
+                            help=f'Замерить первый запрос страниц (по умолчанию {", ".join(startup.SCENARIOS)})')
+        parser.add_argument('--runs', type=int, default=3, help='Процессов на сценарий и режим')
+        parser.add_argument('--output', help='Сохранить результаты замера в JSON-файл')
+        # Используется замером: один первый запрос в отдельном процессе
+        parser.add_argument('--first-request', metavar='scenario', help='Внутренний режим для --measure')
+
+    def handle(self, *args, **options):
+        if options['first_request']:
+            try:
+                result = startup.first_request(options['first_request'])
+            except LookupError as e:
+                raise CommandError(e)
+            self.stdout.write(json.dumps(result))
+            return
+        if options['measure'] is not None:
+            return self.measure(options['measure'] or startup.SCENARIOS, options)
+
+        result = warm_templates()
+        for name, error in result['errors']:
+            self.stderr.write(f'{name}: {error}')
+        if not result['cached']:
+            self.stdout.write('Кэш шаблонов выключен (TEMPLATE_CACHE=False): в рабочем процессе прогрев не сохранится')
+        if result['errors']:
+            raise CommandError(f'Шаблонов с ошибками: {len(result["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Скомпилировано шаблонов: {result["templates"]} за {result["elapsed_ms"]} мс'))
+
+    def measure(self, scenarios, options):
+        try:
+            results = startup.run_startup(scenarios, runs=options['runs'])
+        except Exception as e:
+            raise CommandError(f'Замер не удался: {e}')
+
+        self.stdout.write(f'{"сценарий":<20}{"cold 1-й":>10}{"warm 1-й":>10}{"2-й":>8}{"прогрев":>10}')
+        for name, modes in results['scenarios'].items():
+            cold, warm = modes['cold'], modes['warm']
+            self.stdout.write(
+                f'{name:<20}{cold["first_ms"]:>10}{warm["first_ms"]:>10}'
+                f'{warm["second_ms"]:>8}{warm.get("warmup_ms", "-"):>10}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
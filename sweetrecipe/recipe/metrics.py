@@ -0,0 +1,217 @@
+"""Метрики запросов в формате Prometheus.
+
+MetricsMiddleware для каждого запроса замеряет время ответа, число и время
+SQL-запросов (через connection.execute_wrapper), время рендера шаблонов и
+размер ответа. Метрики накапливаются в памяти процесса с разбивкой по имени
+URL ('home', 'recipe', 'showcategory', ...) и отдаются страницей /metrics.
+При нескольких процессах каждый отдает свои метрики, Prometheus
+суммирует их по instance.
+
+Медленные запросы (дольше METRICS_SLOW_REQUEST_MS) с вероятностью
+METRICS_SLOW_SAMPLE_RATE пишутся в лог вместе с самыми долгими SQL.
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'sweetrecipe_'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+SLOW_QUERIES_LOGGED = 10
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, view, value):
+        counts = self.values.get(view)
+        if counts is None:
+            # Счетчики по корзинам и значений больше последней границы, затем сумма и количество
+            counts = self.values[view] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for view, counts in sorted(self.values.items()):
+            total = 0
+            for le, count in zip(self.buckets, counts):
+                total += count
+                yield f'{self.name}_bucket{{view="{view}",le="{le}"}} {total}'
+            yield f'{self.name}_bucket{{view="{view}",le="+Inf"}} {counts[-1]}'
+            yield f'{self.name}_sum{{view="{view}"}} {counts[-2]:.6f}'
+            yield f'{self.name}_count{{view="{view}"}} {counts[-1]}'
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, labels, value=1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.values.items()):
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            yield f'{self.name}{{{label_text}}} {value:g}'
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter('requests_total', 'Число запросов по view и статусу ответа')
+        self.duration = Histogram('request_duration_seconds', 'Время ответа', DURATION_BUCKETS)
+        self.queries = Histogram('db_queries_per_request', 'Число SQL-запросов на запрос', QUERY_BUCKETS)
+        self.db_time = Histogram('db_duration_seconds', 'Время SQL-запросов на запрос', DURATION_BUCKETS)
+        self.template_time = Histogram('template_render_seconds', 'Время рендера шаблонов на запрос', DURATION_BUCKETS)
+        self.response_size = Histogram('response_size_bytes', 'Размер ответа', SIZE_BUCKETS)
+
+    def record(self, view, status, stats, duration, size):
+        with self.lock:
+            self.requests.inc((('view', view), ('status', status)))
+            self.duration.observe(view, duration)
+            self.queries.observe(view, stats.queries)
+            self.db_time.observe(view, stats.db_time)
+            self.template_time.observe(view, stats.template_time)
+            if size is not None:
+                self.response_size.observe(view, size)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = (self.requests, self.duration, self.queries, self.db_time, self.template_time, self.response_size)
+            return '\n'.join(line for metric in metrics for line in metric.lines()) + '\n'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    """Счетчики текущего запроса"""
+
+    def __init__(self, collect_sql):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.sql = [] if collect_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обертка connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if self.sql is not None:
+                self.sql.append((elapsed, sql))
+
+
+_local = threading.local()
+
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+
+class TimedTemplate:
+    """Шаблон, добавляющий время рендера к счетчикам текущего запроса"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_stats()
+        if stats is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django с замером времени рендера.
+
+    Оборачиваются только шаблоны верхнего уровня, {% include %} и
+    {% extends %} входят в их время.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = settings.METRICS_SLOW_REQUEST_MS
+        self.sample_rate = settings.METRICS_SLOW_SAMPLE_RATE
+
+    def __call__(self, request):
+        if request.path == settings.METRICS_PATH:
+            return self.get_response(request)
+
+        stats = RequestStats(collect_sql=bool(self.slow_ms) and random.random() < self.sample_rate)
+        _local.stats = stats
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        registry.record(view, response.status_code, stats, duration, size)
+
+        if stats.sql is not None and duration * 1000 >= self.slow_ms:
+            log_slow_request(request, view, stats, duration)
+        return response
+
+
+def log_slow_request(request, view, stats, duration):
+    slowest = sorted(stats.sql, reverse=True)[:SLOW_QUERIES_LOGGED]
+    logger.warning(
+        'Медленный запрос %s %s (%s): %.0f мс, SQL: %s за %.0f мс, шаблоны: %.0f мс\n%s',
+        request.method, request.get_full_path(), view, duration * 1000,
+        stats.queries, stats.db_time * 1000, stats.template_time * 1000,
+        '\n'.join(f'{elapsed * 1000:.1f} мс: {sql}' for elapsed, sql in slowest),
+    )
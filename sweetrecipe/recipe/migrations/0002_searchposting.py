@@ -0,0 +1,48 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:56
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+import django.db.models.deletion
+
+
+def create_fts_table(apps, schema_editor):
+    """На SQLite со сборкой FTS5 создает виртуальную таблицу для поиска"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search_fts '
+            'USING fts5(title, ingredients, description, recipe_text)'
+        )
+    except OperationalError:
+        # SQLite собран без FTS5, будет использован индекс SearchPosting
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS recipe_search_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Терм')),
+                ('weight', models.PositiveIntegerField(default=0, verbose_name='Вес')),
+                ('dessert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_posting', to='recipe.dessert')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchposting',
+            constraint=models.UniqueConstraint(fields=('term', 'dessert'), name='recipe_search_term_dessert_uniq'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0002_searchposting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Ингредиент')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Нормализованное название')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DessertIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(blank=True, decimal_places=2, max_digits=9, null=True, verbose_name='Количество')),
+                ('unit', models.CharField(blank=True, max_length=20, verbose_name='Единица измерения')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('dessert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dessert_ingredient', to='recipe.dessert')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dessert_ingredient', to='recipe.ingredient')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dessertingredient',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'dessert'), name='recipe_ingredient_dessert_uniq'),
+        ),
+    ]
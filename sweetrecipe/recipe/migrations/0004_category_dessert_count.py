@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:01
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_dessert_count(apps, schema_editor):
+    Category = apps.get_model('recipe', 'Category')
+    counts = Category.objects.annotate(published=Count('category', filter=Q(category__is_published=True)))
+    for category in counts:
+        Category.objects.filter(pk=category.pk).update(dessert_count=category.published)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0003_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='dessert_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Опубликованных десертов'),
+        ),
+        migrations.RunPython(fill_dessert_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_count(apps, schema_editor):
+    Dessert = apps.get_model('recipe', 'Dessert')
+    Comment = apps.get_model('recipe', 'Comment')
+    counts = (
+        Comment.objects.filter(dessert=OuterRef('pk')).order_by()
+        .values('dessert').annotate(total=Count('pk')).values('total')
+    )
+    Dessert.objects.update(comment_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0005_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dessert',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['dessert', 'time_create'], name='recipe_comment_dessert_idx'),
+        ),
+        migrations.RunPython(fill_comment_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:12
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_profile_counters(apps, schema_editor):
+    Profile = apps.get_model('recipe', 'Profile')
+    Dessert = apps.get_model('recipe', 'Dessert')
+    Comment = apps.get_model('recipe', 'Comment')
+
+    def count(model, **filters):
+        counts = (
+            model.objects.filter(profile=OuterRef('pk'), **filters).order_by()
+            .values('profile').annotate(total=Count('pk')).values('total')
+        )
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    Profile.objects.update(dessert_count=count(Dessert, is_published=True), comment_count=count(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_dessert_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='dessert_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Опубликованных десертов'),
+        ),
+        migrations.RunPython(fill_profile_counters, migrations.RunPython.noop),
+    ]
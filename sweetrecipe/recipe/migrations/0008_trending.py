@@ -0,0 +1,40 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_profile_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DessertViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='День')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотров')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dessert',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_dessert_trending_idx'),
+        ),
+        migrations.AddField(
+            model_name='dessertviewcount',
+            name='dessert',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_count', to='recipe.dessert'),
+        ),
+        migrations.AddConstraint(
+            model_name='dessertviewcount',
+            constraint=models.UniqueConstraint(fields=('dessert', 'day'), name='recipe_view_count_dessert_day_uniq'),
+        ),
+    ]
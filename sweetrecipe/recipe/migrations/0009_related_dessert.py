@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0008_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedDessert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('computed_at', models.DateTimeField(verbose_name='Время расчета')),
+                ('dessert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related', to='recipe.dessert')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_to', to='recipe.dessert')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='relateddessert',
+            constraint=models.UniqueConstraint(fields=('dessert', 'position'), name='recipe_related_position_uniq'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_related_dessert'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='recipe_comment_dessert_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['dessert', 'time_create', 'id'], name='recipe_comment_dessert_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(fields=['is_published', '-time_create', '-id'], name='recipe_dessert_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(fields=['profile', '-time_create', '-id'], name='recipe_dessert_profile_idx'),
+        ),
+        # Десерты категории: у автоматической таблицы связи нет Meta.indexes,
+        # а уникальный индекс (dessert_id, category_id) начинается не с категории
+        migrations.RunSQL(
+            'CREATE INDEX recipe_dessert_category_cat_idx ON recipe_dessert_category (category_id, dessert_id)',
+            reverse_sql='DROP INDEX recipe_dessert_category_cat_idx',
+        ),
+    ]
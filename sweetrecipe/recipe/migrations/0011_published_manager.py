@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0010_index_audit'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dessert',
+            name='recipe_dessert_published_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='dessert',
+            name='recipe_dessert_profile_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['id'], name='recipe_dessert_live_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-time_create', '-id'], name='recipe_dessert_live_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['profile', '-time_create', '-id'], name='recipe_dessert_live_prof_idx'),
+        ),
+    ]
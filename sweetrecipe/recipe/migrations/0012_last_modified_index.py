@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0011_published_manager'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dessert',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['time_update'], name='recipe_dessert_live_upd_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0013_image_variants'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dessert',
+            name='recipe_dessert_live_upd_idx',
+        ),
+    ]
@@ -1,27 +1,98 @@
 from django.db import models
 from django.dispatch import receiver
 from django.urls import reverse
-from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-import time
 
+from . import formatting
+from .slugs import SlugMixin
 
-class Dessert(models.Model):
+
+# Поля, нужные карточке десерта в списках; ingredients и description не загружаются
+DESSERT_CARD_FIELDS = (
+    'id', 'title', 'slug', 'photo', 'photo_variants', 'cooking_time', 'time_create', 'time_update', 'is_published',
+    'comment_count', 'trending_score',
+    'profile__id', 'profile__slug', 'profile__photo', 'profile__photo_variants', 'profile__name',
+    'profile__user__id', 'profile__user__username',
+)
+
+
+class DessertQuerySet(models.QuerySet):
+
+    def cards(self):
+        """Десерты для карточек списка: постоянное число запросов на страницу"""
+        return (
+            self.select_related('profile__user')
+            .prefetch_related(models.Prefetch('category', queryset=Category.objects.only('id', 'name', 'slug')))
+            .only(*DESSERT_CARD_FIELDS)
+        )
+
+
+class PublishedDessertManager(models.Manager.from_queryset(DessertQuerySet)):
+    """Только опубликованные десерты, для публичных страниц.
+
+    Запросы попадают в частичные индексы WHERE is_published, в которых нет
+    снятых с публикации десертов.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_published=True)
+
+
+class CounterFieldsMixin:
+    """Счетчики (counter_fields) меняются только F()-обновлениями из recipe.counters.
+
+    Обычное сохранение загруженного объекта их не пишет, иначе устаревшее
+    значение в памяти перезаписало бы счетчик в базе.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.counter_fields and f.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class Dessert(SlugMixin, CounterFieldsMixin, models.Model):
     """Создание модели десерта"""
     title = models.CharField(max_length=255, verbose_name="Название десерта")
     slug = models.SlugField(max_length=255, unique=True, db_index=True, verbose_name="URL")
     ingredients = models.TextField(verbose_name="Ингредиенты")
     description = models.TextField(verbose_name="Описание")
     photo = models.ImageField(upload_to="photos/%Y/%m/%d", verbose_name="Главное фото")
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Уменьшенные копии фото")
     cooking_time = models.PositiveSmallIntegerField(verbose_name="Время готовки (в минутах)")
     time_create = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
     time_update = models.DateTimeField(auto_now=True, verbose_name="Время изменения")
     is_published = models.BooleanField(default=True, verbose_name="Публикация")
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Комментариев")
+    trending_score = models.FloatField(default=0, editable=False, verbose_name="Популярность")
     category = models.ManyToManyField('Category', related_name="category")
     profile = models.ForeignKey('Profile', on_delete=models.CASCADE, related_name='profile', blank=True, default=None)
-    
+
+    # objects - менеджер по умолчанию со всеми десертами (админка, связи, служебный код)
+    objects = DessertQuerySet.as_manager()
+    published = PublishedDessertManager()
+
+    counter_fields = ('comment_count', 'trending_score')
+
+    class Meta:
+        indexes = [
+            # Лента популярного: ORDER BY trending_score DESC, id DESC
+            models.Index(fields=['-trending_score', '-id'], name='recipe_dessert_trending_idx'),
+            # Частичные индексы для Dessert.published: главная (ORDER BY id),
+            # категории (ORDER BY time_create DESC, id DESC) и десерты пользователя
+            models.Index(fields=['id'], condition=models.Q(is_published=True), name='recipe_dessert_live_id_idx'),
+            models.Index(fields=['-time_create', '-id'], condition=models.Q(is_published=True),
+                         name='recipe_dessert_live_time_idx'),
+            models.Index(fields=['profile', '-time_create', '-id'], condition=models.Q(is_published=True),
+                         name='recipe_dessert_live_prof_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.title
@@ -38,22 +109,12 @@ class Dessert(models.Model):
         """URL удаления рецепта"""
         return reverse('delete_recipe', kwargs={'recipe_slug': self.slug})
 
-    def save(self, *args, **kwargs):
-        self.slug = title_to_slug(self.title)
-        super().save(*args, **kwargs)
+    def slug_source(self) -> str:
+        return self.title
 
     def cooking_time_mod(self) -> str:
-        """Обработчик окончания для минут"""
-        minute = str(self.cooking_time)[-2:]
-
-        if int(minute) % 10 == 1 and int(minute) != 11:
-            minute = 'минута'
-        elif int(minute) % 10 in [2, 3, 4]:
-            minute = 'минуты'
-        else:
-            minute = 'минут'
-
-        return str(self.cooking_time) + ' ' + minute
+        """Время готовки с окончанием для минут"""
+        return formatting.minutes(self.cooking_time)
 
 
 
@@ -61,15 +122,19 @@ class Recipe(models.Model):
     """Создание пошагового рецепта для десерта"""
     recipe_text = models.TextField(verbose_name="Рецепт")
     image = models.ImageField(upload_to="photos/%Y/%m/%d", verbose_name="Фото")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Уменьшенные копии фото")
     dessert = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='recipe', blank=True)
 
     def __str__(self) -> str:
         return self.dessert.title
     
 
-class Category(models.Model):
+class Category(SlugMixin, CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=100, db_index=True, verbose_name="Категория")
     slug = models.SlugField(max_length=255, unique=True, db_index=True, verbose_name="URL")
+    dessert_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Опубликованных десертов")
+
+    counter_fields = ('dessert_count',)
 
     class Meta:
         ordering = ['name']
@@ -80,57 +145,39 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('showcategory', kwargs={'category_slug': self.slug})
 
-    def save(self, *args, **kwargs):
-        self.slug = title_to_slug(self)
-        super().save(*args, **kwargs)
+    def slug_source(self) -> str:
+        return self.name
 
     
 
-def title_to_slug(title: str) -> str:
-    """Преобразует название десерта в slug"""
-    slug = ""
-    dic = {'ь':'', 'ъ':'', 'а':'a', 'б':'b','в':'v',
-       'г':'g', 'д':'d', 'е':'e', 'ё':'yo','ж':'zh',
-       'з':'z', 'и':'i', 'й':'y', 'к':'k', 'л':'l',
-       'м':'m', 'н':'n', 'о':'o', 'п':'p', 'р':'r', 
-       'с':'s', 'т':'t', 'у':'u', 'ф':'f', 'х':'h',
-       'ц':'ts', 'ч':'ch', 'ш':'sh', 'щ':'sch', 'ы':'yi',
-       'э':'e', 'ю':'yu', 'я':'ya'}
-
-    for t in slugify(title, allow_unicode=True):
-        if t in dic:
-            slug += dic[t]
-        else:
-            slug += t
-
-    slug += "-" + str(int(time.time()))
-    return slug
-
-
 CHOICE = [(1,'Женский'),(0, 'Мужской')]
-class Profile(models.Model):
+class Profile(SlugMixin, CounterFieldsMixin, models.Model):
     """Профиль пользователя создающийся по сигналам при создании User"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     slug = models.SlugField(max_length=255, unique=True, db_index=True, verbose_name="URL")
     photo = models.ImageField(upload_to="users_photos/%Y/%m/%d", verbose_name="Фото профиля", blank=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Уменьшенные копии фото")
     photo_base = models.FilePathField(path="users_photos/userphoto.jpg", blank=True)
     name = models.CharField(verbose_name="Имя", max_length=50, blank=True)
     date_of_birth = models.DateField(verbose_name="Дата рождения", blank=True, null=True)
     date_change_pass = models.DateTimeField(verbose_name="Дата изменения пароля", blank=True, null=True)
     sex = models.BooleanField(verbose_name="Пол",choices=CHOICE, blank=True, null=True)
     phone = models.CharField(max_length=20, verbose_name="Телефон", blank=True, null=True)
+    dessert_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Опубликованных десертов")
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Комментариев")
     time_create = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
     time_update = models.DateTimeField(auto_now=True, verbose_name="Время изменения")
 
+    counter_fields = ('dessert_count', 'comment_count')
+
     def __str__(self) -> str:
         return self.user.username
 
     def get_absolute_url(self):
         return reverse('show_user_dessert', kwargs={'username_slug': self.slug})
 
-    def save(self, *args, **kwargs):
-        self.slug = title_to_slug(self)
-        super().save(*args, **kwargs)
+    def slug_source(self) -> str:
+        return self.user.username
 
     def name_or_username(self):
         if not self.name:
@@ -147,8 +194,11 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
     """При сохрании User, Profile также сохраняется"""
+    # Вход пользователя обновляет только last_login, профиль при этом не меняется
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
     instance.profile.save()
 
 
@@ -158,5 +208,114 @@ class Comment(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='profile_comment', blank=True, default=None)
     dessert = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='dessert_comment', blank=True, default=None) 
 
+    class Meta:
+        indexes = [
+            # Страница комментариев десерта: WHERE dessert_id = ... ORDER BY time_create DESC, id DESC
+            models.Index(fields=['dessert', 'time_create', 'id'], name='recipe_comment_dessert_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.text[:50]
+
+class SearchPosting(models.Model):
+    """Запись инвертированного индекса поиска: нормализованный терм -> десерт"""
+    term = models.CharField(max_length=64, verbose_name="Терм")
+    dessert = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='search_posting')
+    weight = models.PositiveIntegerField(default=0, verbose_name="Вес")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'dessert'], name='recipe_search_term_dessert_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return self.term
+
+
+class Ingredient(models.Model):
+    """Нормализованный ингредиент, общий для всех десертов"""
+    name = models.CharField(max_length=100, verbose_name="Ингредиент")
+    key = models.CharField(max_length=100, unique=True, verbose_name="Нормализованное название")
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class DessertIngredient(models.Model):
+    """Строка ингредиентов десерта, разобранная на ингредиент, количество и единицу"""
+    dessert = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='dessert_ingredient')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='dessert_ingredient')
+    quantity = models.DecimalField(max_digits=9, decimal_places=2, blank=True, null=True, verbose_name="Количество")
+    unit = models.CharField(max_length=20, blank=True, verbose_name="Единица измерения")
+    position = models.PositiveSmallIntegerField(default=0, verbose_name="Порядок")
+
+    class Meta:
+        constraints = [
+            # Обратный индекс: ингредиент -> десерты
+            models.UniqueConstraint(fields=['ingredient', 'dessert'], name='recipe_ingredient_dessert_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return self.ingredient.name
+
+
+class Job(models.Model):
+    """Фоновая задача очереди, выполняется командой manage.py run_worker"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Ожидает'), (RUNNING, 'Выполняется'), (FAILED, 'Ошибка')]
+
+    task = models.CharField(max_length=100, verbose_name="Задача")
+    kwargs = models.JSONField(default=dict, verbose_name="Аргументы")
+    key = models.CharField(max_length=255, blank=True, db_index=True, verbose_name="Ключ дедупликации")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(verbose_name="Запустить после")
+    locked_until = models.DateTimeField(blank=True, null=True, verbose_name="Занята до")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    time_create = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='recipe_job_status_run_at_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.task
+
+
+class DessertViewCount(models.Model):
+    """Просмотры десерта за день, пишутся пачками из буфера recipe.trending"""
+    dessert = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='view_count')
+    day = models.DateField(db_index=True, verbose_name="День")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотров")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dessert', 'day'], name='recipe_view_count_dessert_day_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.dessert_id} {self.day}: {self.views}'
+
+
+class RelatedDessert(models.Model):
+    """Похожий десерт: top-K соседей каждого десерта, считаются командой compute_related"""
+    dessert = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='related')
+    related = models.ForeignKey('Dessert', on_delete=models.CASCADE, related_name='related_to')
+    position = models.PositiveSmallIntegerField(verbose_name="Место")
+    score = models.FloatField(verbose_name="Сходство")
+    computed_at = models.DateTimeField(verbose_name="Время расчета")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dessert', 'position'], name='recipe_related_position_uniq'),
+        ]
+
     def __str__(self) -> str:
-        return self.user.username
\ No newline at end of file
+        return f'{self.dessert_id} -> {self.related_id}: {self.score:.3f}'
@@ -0,0 +1,129 @@
+"""Курсорная (keyset) пагинация.
+
+Вместо OFFSET и COUNT(*) страница выбирается условием по ключу сортировки
+последней показанной записи: WHERE (time_create, id) < (..., ...) LIMIT n+1.
+Поэтому время ответа не зависит от номера страницы и размера таблицы.
+Позиция передается в непрозрачном токене ?cursor=...
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+class CursorPage:
+    """Страница курсорной пагинации с интерфейсом, похожим на django Page"""
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(values, direction='n') -> str:
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    data = json.dumps({'d': direction, 'v': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, fields):
+    """Возвращает (направление, значения ключа) или поднимает Http404.
+
+    Значения приводятся к типам полей ключа fields (field.to_python), так
+    что подделанный токен не доходит до запроса.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction, values = data['d'], data['v']
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise Http404('Неверный курсор')
+    if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(fields):
+        raise Http404('Неверный курсор')
+    try:
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise Http404('Неверный курсор')
+    if any(value is None for value in values):
+        raise Http404('Неверный курсор')
+    return direction, values
+
+
+def keyset_filter(ordering, values, reverse=False) -> Q:
+    """Условие "строго после позиции" для сортировки из нескольких полей"""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def paginate_by_cursor(queryset, ordering, page_size, token=None) -> CursorPage:
+    """Выбирает страницу queryset, отсортированного по уникальному ключу ordering"""
+    ordering = tuple(ordering)
+    if token:
+        fields = [queryset.model._meta.get_field(f.lstrip('-')) for f in ordering]
+        direction, values = decode_cursor(token, fields)
+    else:
+        direction, values = 'n', None
+
+    if direction == 'p':
+        reversed_ordering = [f[1:] if f.startswith('-') else '-' + f for f in ordering]
+        qs = queryset.order_by(*reversed_ordering)
+        qs = qs.filter(keyset_filter(ordering, values, reverse=True))
+    else:
+        qs = queryset.order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(keyset_filter(ordering, values))
+
+    # Одна лишняя запись показывает, есть ли следующая страница, без COUNT(*)
+    rows = list(qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'p':
+        rows.reverse()
+
+    def position(obj):
+        return [getattr(obj, f.lstrip('-')) for f in ordering]
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or direction == 'p':
+            next_cursor = encode_cursor(position(rows[-1]), 'n')
+        if (has_more and direction == 'p') or (values is not None and direction == 'n'):
+            previous_cursor = encode_cursor(position(rows[0]), 'p')
+    return CursorPage(rows, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """Курсорная пагинация для ListView вместо OFFSET-пагинации"""
+    cursor_ordering = ('id',)
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        token = self.request.GET.get(self.cursor_query_param)
+        page = paginate_by_cursor(queryset, self.cursor_ordering, page_size, token)
+        return None, page, page.object_list, page.has_other_pages()
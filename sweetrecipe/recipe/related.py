@@ -0,0 +1,183 @@
+"""Похожие десерты.
+
+Десерт описывается разреженным вектором признаков: его категории и
+нормализованные ингредиенты (ключи Ingredient из индекса recipe.ingredients).
+Вес признака - IDF, чтобы сахар и мука, которые есть почти везде, значили
+меньше редких ингредиентов, у категорий он дополнительно умножается на
+RELATED_CATEGORY_WEIGHT. Сходство - косинус между векторами.
+
+Векторы хранятся как массивы NumPy (номер десерта, номер признака) и
+инвертированный индекс признак -> десерты. Скалярные произведения одного
+десерта со всеми остальными считает np.bincount по спискам десертов его
+признаков, без матрицы n x n.
+
+Команда compute_related сохраняет RELATED_DESSERTS_COUNT лучших соседей
+каждого опубликованного десерта в RelatedDessert. Повторный запуск
+пересчитывает только десерты, измененные после прошлого расчета, и те,
+в чьих списках они были; остальным списки дополняются измененными
+десертами. Веса IDF при этом берутся текущие, поэтому время от времени
+стоит делать полный пересчет (--full).
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .cache import bump
+from .models import Dessert, DessertIngredient, RelatedDessert
+
+
+RELATED_CARD_FIELDS = ('id', 'title', 'slug', 'photo', 'photo_variants', 'cooking_time')
+
+
+class Vectors:
+    """Векторы признаков всех опубликованных десертов"""
+
+    def __init__(self):
+        self.ids = np.array(
+            Dessert.published.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+        self.n = len(self.ids)
+
+        through = Dessert.category.through
+        categories = np.array(
+            through.objects.filter(dessert__is_published=True).values_list('dessert_id', 'category_id'),
+            dtype=np.int64).reshape(-1, 2)
+        ingredients = np.array(
+            DessertIngredient.objects.filter(dessert__is_published=True).values_list('dessert_id', 'ingredient_id'),
+            dtype=np.int64).reshape(-1, 2)
+
+        # Признаки нумеруются подряд: сначала категории, затем ингредиенты
+        category_ids, category_cols = np.unique(categories[:, 1], return_inverse=True)
+        ingredient_ids, ingredient_cols = np.unique(ingredients[:, 1], return_inverse=True)
+        rows = np.searchsorted(self.ids, np.concatenate([categories[:, 0], ingredients[:, 0]]))
+        cols = np.concatenate([category_cols, ingredient_cols + len(category_ids)])
+        features = len(category_ids) + len(ingredient_ids)
+
+        df = np.bincount(cols, minlength=features)
+        weights = np.log((1 + self.n) / (1 + df)) + 1
+        weights[:len(category_ids)] *= settings.RELATED_CATEGORY_WEIGHT
+        self.squared = weights ** 2
+        self.norms = np.sqrt(np.bincount(rows, weights=self.squared[cols], minlength=self.n))
+
+        # Признаки каждого десерта и десерты каждого признака
+        order = np.argsort(rows, kind='stable')
+        self.dessert_features = cols[order]
+        self.feature_start = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=self.n))])
+        order = np.argsort(cols, kind='stable')
+        self.feature_desserts = rows[order]
+        self.dessert_start = np.concatenate([[0], np.cumsum(df)])
+
+    def index(self, dessert_ids):
+        """Номера опубликованных десертов из dessert_ids"""
+        dessert_ids = np.fromiter(dessert_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, dessert_ids)
+        found = positions < self.n
+        found[found] = self.ids[positions[found]] == dessert_ids[found]
+        return positions[found]
+
+    def similarity(self, i):
+        """Косинусное сходство десерта номер i со всеми десертами, себя - 0"""
+        features = self.dessert_features[self.feature_start[i]:self.feature_start[i + 1]]
+        if not len(features) or not self.norms[i]:
+            return np.zeros(self.n)
+        neighbours = np.concatenate([self.feature_desserts[self.dessert_start[f]:self.dessert_start[f + 1]] for f in features])
+        counts = self.dessert_start[features + 1] - self.dessert_start[features]
+        dots = np.bincount(neighbours, weights=np.repeat(self.squared[features], counts), minlength=self.n)
+        dots[i] = 0
+        return np.divide(dots, self.norms * self.norms[i], out=np.zeros(self.n), where=dots > 0)
+
+
+def top(candidates, count):
+    """Лучшие count пар (сходство, id десерта): по убыванию сходства, при равенстве новее"""
+    return sorted(candidates, key=lambda c: (-c[0], -c[1]))[:count]
+
+
+def neighbours(vectors, scores, count):
+    found = np.flatnonzero(scores)
+    if len(found) > count:
+        found = found[np.argpartition(-scores[found], count - 1)[:count]]
+    return top(((round(float(scores[j]), 6), int(vectors.ids[j])) for j in found), count)
+
+
+def write(lists, computed_at, full):
+    """Заменяет списки соседей {id десерта: [(сходство, id соседа), ...]}, при full - все"""
+    rows = [
+        RelatedDessert(dessert_id=dessert_id, related_id=related_id, position=position,
+                       score=score, computed_at=computed_at)
+        for dessert_id, items in lists.items()
+        for position, (score, related_id) in enumerate(items)
+    ]
+    with transaction.atomic():
+        if full:
+            RelatedDessert.objects.all().delete()
+        else:
+            RelatedDessert.objects.filter(dessert__is_published=False).delete()
+            dessert_ids = list(lists)
+            for start in range(0, len(dessert_ids), 500):
+                RelatedDessert.objects.filter(dessert_id__in=dessert_ids[start:start + 500]).delete()
+        RelatedDessert.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def compute_related(full=False) -> dict:
+    """Пересчитывает похожие десерты, возвращает число обработанных десертов и записанных строк"""
+    computed_at = timezone.now()
+    count = settings.RELATED_DESSERTS_COUNT
+    since = None if full else RelatedDessert.objects.aggregate(last=Max('computed_at'))['last']
+    vectors = Vectors()
+
+    full = since is None
+    changed = set()
+    if not full:
+        changed = set(Dessert.objects.filter(time_update__gte=since).values_list('pk', flat=True))
+        # Списки, где есть измененные или снятые с публикации десерты, и
+        # неполные списки (из них могли удалить десерт) считаются заново
+        stale = set(
+            RelatedDessert.objects.filter(Q(related_id__in=changed) | Q(related__is_published=False))
+            .values_list('dessert_id', flat=True)
+        )
+        stale.update(
+            RelatedDessert.objects.values('dessert_id').annotate(total=Count('pk'))
+            .filter(total__lt=count).values_list('dessert_id', flat=True)
+        )
+        recompute = vectors.index(changed | stale)
+        # Когда изменилась большая часть десертов, проще посчитать все
+        full = len(recompute) * 2 > vectors.n
+    if full:
+        changed = set()
+        recompute = range(vectors.n)
+
+    lists = {}
+    additions = {}
+    for i in recompute:
+        scores = vectors.similarity(i)
+        dessert_id = int(vectors.ids[i])
+        lists[dessert_id] = neighbours(vectors, scores, count)
+        if dessert_id in changed:
+            # Сходство симметрично: измененный десерт - кандидат в соседи всех остальных
+            for j in np.flatnonzero(scores):
+                additions.setdefault(int(vectors.ids[j]), []).append((round(float(scores[j]), 6), dessert_id))
+
+    merged = {dessert_id: items for dessert_id, items in additions.items() if dessert_id not in lists}
+    stored = {}
+    for row in RelatedDessert.objects.filter(dessert_id__in=merged).values_list('dessert_id', 'score', 'related_id'):
+        stored.setdefault(row[0], []).append(row[1:])
+    for dessert_id, items in merged.items():
+        current = top(stored.get(dessert_id, []), count)
+        updated = top(current + items, count)
+        if updated != current:
+            lists[dessert_id] = updated
+
+    rows = write(lists, computed_at, full)
+    bump('related')
+    return {'desserts': len(lists), 'rows': rows, 'full': full}
+
+
+def related_desserts(dessert):
+    """Похожие десерты для страницы рецепта: один запрос по индексу (dessert, position)"""
+    return list(
+        Dessert.published.filter(related_to__dessert=dessert)
+        .order_by('related_to__position').only(*RELATED_CARD_FIELDS)
+    )
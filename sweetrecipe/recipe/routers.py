@@ -0,0 +1,96 @@
+"""Чтение с реплик.
+
+Представления с атрибутом replica_reads = True (страницы списков и
+рецептов) на GET-запросах читают со случайной реплики из
+REPLICA_DATABASES, все записи и остальные представления идут в основную
+базу default.
+
+Реплика может отставать, поэтому после записи пользователь должен видеть
+свои изменения: если в POST-запросе была запись, ответ ставит cookie
+REPLICA_PIN_COOKIE на REPLICA_PIN_SECONDS секунд, и пока она действует,
+все запросы этого пользователя читают из основной базы. Внутри запроса
+после первой записи чтение тоже идет в основную базу.
+
+Версии кэша (cache.bump) растут сразу при записи, а реплика может еще
+отставать. Страница, прочитанная с нее, попала бы в кэш ответов и
+фрагментов и в ETag уже под новой версией и отдавалась бы устаревшей до
+следующего изменения. Поэтому представление читает с реплики, только если
+пространства имен из его cache_namespaces (и версия пользователя) не
+менялись последние REPLICA_PIN_SECONDS секунд - за это время реплика
+успевает догнать основную базу.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+
+
+REPLICA_PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if settings.REPLICA_DATABASES and getattr(_state, 'replicas', False) and not getattr(_state, 'wrote', False):
+            return random.choice(settings.REPLICA_DATABASES)
+        # Явно, иначе объект, прочитанный с реплики, тянул бы связанные объекты оттуда же
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе
+        return True
+
+
+def recently_changed(view_class, view_kwargs, request) -> bool:
+    """Менялись ли данные страницы за последние REPLICA_PIN_SECONDS секунд"""
+    # cache импортирует модели, а роутер загружается вместе с настройками базы
+    from .cache import changed_within
+    names = [name.format(**view_kwargs) for name in getattr(view_class, 'cache_namespaces', ())]
+    if request.user.is_authenticated:
+        names.append(f'user:{request.user.pk}')
+    return changed_within(names, settings.REPLICA_PIN_SECONDS)
+
+
+def pinned(request) -> bool:
+    try:
+        return int(request.COOKIES.get(REPLICA_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replicas = _state.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _state.wrote
+        finally:
+            _state.replicas = _state.wrote = False
+
+        if wrote and request.method not in SAFE_METHODS and settings.REPLICA_DATABASES:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, int(time.time()) + seconds, max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if (
+            request.method in SAFE_METHODS
+            and getattr(view_class, 'replica_reads', False)
+            and not pinned(request)
+            and not recently_changed(view_class, view_kwargs, request)
+        ):
+            _state.replicas = True
@@ -0,0 +1,279 @@
+"""Полнотекстовый поиск по десертам.
+
+Текст десерта (название, ингредиенты, описание и шаги рецепта) разбивается
+на слова, слова приводятся к основе русским стеммером и транслитерируются
+той же таблицей, что и slug. Поэтому запросы "торты", "торт" и "tort"
+находят одни и те же десерты.
+
+Индекс обновляется по сигналам сохранения и удаления. На SQLite с FTS5
+используется виртуальная таблица, на остальных базах - собственный
+инвертированный индекс в таблице SearchPosting.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .jobs import enqueue, task
+from .models import Dessert, Recipe, SearchPosting
+from .slugs import TRANSLIT_TABLE
+
+
+FTS_TABLE = 'recipe_search_fts'
+
+# Поля документа и их вес при ранжировании
+FIELD_WEIGHTS = {
+    'title': 10,
+    'ingredients': 4,
+    'description': 2,
+    'recipe_text': 1,
+}
+
+MAX_QUERY_TERMS = 10
+MAX_RESULTS = 500
+
+WORD_RE = re.compile(r'[0-9a-zа-яё]+')
+
+STOP_WORDS = frozenset((
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а',
+    'то', 'все', 'она', 'так', 'его', 'но', 'да', 'ты', 'к', 'у', 'же',
+    'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от',
+    'меня', 'еще', 'нет', 'о', 'из', 'ему', 'для', 'при', 'или', 'до',
+    'это', 'этот', 'эта', 'эти', 'мы', 'их', 'чем', 'без', 'под', 'над',
+))
+
+
+# Стеммер Портера для русского языка (алгоритм Snowball)
+# ↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓↓
+
+RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE_RE = re.compile(r'(с[яь])$')
+ADJECTIVE_RE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB_RE = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+I_RE = re.compile(r'и$')
+DERIVATIONAL_RE = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DER_RE = re.compile(r'ость?$')
+SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+SOFT_SIGN_RE = re.compile(r'ь$')
+NN_RE = re.compile(r'нн$')
+
+
+def stem(word: str) -> str:
+    """Возвращает основу русского слова"""
+    match = RV_RE.match(word)
+    if not match:
+        return word
+    pre, rv = match.groups()
+
+    temp = PERFECTIVE_GERUND_RE.sub('', rv, 1)
+    if temp == rv:
+        rv = REFLEXIVE_RE.sub('', rv, 1)
+        temp = ADJECTIVE_RE.sub('', rv, 1)
+        if temp != rv:
+            rv = PARTICIPLE_RE.sub('', temp, 1)
+        else:
+            temp = VERB_RE.sub('', rv, 1)
+            if temp == rv:
+                rv = NOUN_RE.sub('', rv, 1)
+            else:
+                rv = temp
+    else:
+        rv = temp
+
+    rv = I_RE.sub('', rv, 1)
+    if DERIVATIONAL_RE.match(rv):
+        rv = DER_RE.sub('', rv, 1)
+
+    temp = SOFT_SIGN_RE.sub('', rv, 1)
+    if temp == rv:
+        rv = SUPERLATIVE_RE.sub('', rv, 1)
+        rv = NN_RE.sub('н', rv, 1)
+    else:
+        rv = temp
+
+    return pre + rv
+
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# Стеммер Портера для русского языка (алгоритм Snowball)
+
+
+def transliterate(word: str) -> str:
+    return word.translate(TRANSLIT_TABLE)
+
+
+def normalize_terms(text: str) -> list:
+    """Разбивает текст на нормализованные термы: основа слова в латинице"""
+    terms = []
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        if word in STOP_WORDS:
+            continue
+        term = transliterate(stem(word))[:64]
+        if len(term) > 1 or term.isdigit():
+            terms.append(term)
+    return terms
+
+
+def document_fields(dessert_id: int):
+    """Собирает термы всех полей десерта, None если десерт удален"""
+    dessert = Dessert.objects.filter(pk=dessert_id).values('title', 'ingredients', 'description').first()
+    if dessert is None:
+        return None
+    steps = Recipe.objects.filter(dessert_id=dessert_id).values_list('recipe_text', flat=True)
+    dessert['recipe_text'] = '\n'.join(steps)
+    return {field: normalize_terms(dessert[field]) for field in FIELD_WEIGHTS}
+
+
+class IndexBackend:
+    """Инвертированный индекс в таблице SearchPosting, работает на любой базе"""
+
+    def index(self, dessert_id, fields):
+        weights = Counter()
+        for field, terms in fields.items():
+            for term in terms:
+                weights[term] += FIELD_WEIGHTS[field]
+
+        with transaction.atomic():
+            SearchPosting.objects.filter(dessert_id=dessert_id).delete()
+            SearchPosting.objects.bulk_create(
+                SearchPosting(term=term, dessert_id=dessert_id, weight=weight)
+                for term, weight in weights.items()
+            )
+
+    def remove(self, dessert_id):
+        SearchPosting.objects.filter(dessert_id=dessert_id).delete()
+
+    def clear(self):
+        SearchPosting.objects.all().delete()
+
+    def search(self, terms, limit):
+        # Сначала десерты, совпавшие с большим числом слов запроса, затем по сумме весов
+        postings = (
+            SearchPosting.objects.filter(term__in=terms, dessert__is_published=True)
+            .values('dessert')
+            .annotate(matched=Count('term'), score=Sum('weight'))
+            .order_by('-matched', '-score', '-dessert')
+        )
+        return [p['dessert'] for p in postings[:limit]]
+
+
+class Fts5Backend:
+    """Виртуальная таблица SQLite FTS5, ранжирование через bm25"""
+
+    def index(self, dessert_id, fields):
+        columns = list(FIELD_WEIGHTS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [dessert_id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(columns)}) VALUES (%s{", %s" * len(columns)})',
+                [dessert_id] + [' '.join(fields[column]) for column in columns],
+            )
+
+    def remove(self, dessert_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [dessert_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, terms, limit):
+        # Термы состоят только из латиницы и цифр, поэтому кавычек достаточно
+        match = ' OR '.join(f'"{term}"' for term in terms)
+        weights = ', '.join(str(float(w)) for w in FIELD_WEIGHTS.values())
+        desserts = Dessert._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} JOIN {desserts} ON {desserts}.id = {FTS_TABLE}.rowid '
+                f'WHERE {FTS_TABLE} MATCH %s AND {desserts}.is_published = %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [match, True, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def fts5_available() -> bool:
+    if connection.vendor != 'sqlite':
+        return False
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+_backend = None
+
+
+def get_backend():
+    """Бэкенд поиска по настройке SEARCH_BACKEND: auto, fts5 или index"""
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if name == 'fts5' or (name == 'auto' and fts5_available()):
+            _backend = Fts5Backend()
+        else:
+            _backend = IndexBackend()
+    return _backend
+
+
+def index_dessert(dessert_id: int):
+    """Переиндексирует десерт или удаляет его из индекса"""
+    fields = document_fields(dessert_id)
+    if fields is None:
+        get_backend().remove(dessert_id)
+    else:
+        get_backend().index(dessert_id, fields)
+
+
+def rebuild_index():
+    """Полностью перестраивает индекс, возвращает число десертов"""
+    backend = get_backend()
+    backend.clear()
+    count = 0
+    for dessert_id in Dessert.objects.values_list('pk', flat=True).iterator():
+        index_dessert(dessert_id)
+        count += 1
+    return count
+
+
+def search(query: str, limit: int = MAX_RESULTS) -> list:
+    """Возвращает id опубликованных десертов по запросу, отсортированные по релевантности.
+
+    Снятые с публикации десерты остаются в индексе, но отсекаются в самом
+    запросе, чтобы не занимать места в выдаче и не искажать число страниц.
+    """
+    terms = list(dict.fromkeys(normalize_terms(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    return get_backend().search(terms, limit)
+
+
+@task('search.index')
+def index_dessert_task(dessert_id):
+    index_dessert(dessert_id)
+
+
+def schedule_index(dessert_id: int):
+    """Ставит переиндексацию десерта в фоновую очередь"""
+    enqueue('search.index', key=f'search.index:{dessert_id}', dessert_id=dessert_id)
+
+
+@receiver(post_save, sender=Dessert)
+@receiver(post_delete, sender=Dessert)
+def dessert_changed(sender, instance, **kwargs):
+    schedule_index(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    if instance.dessert_id:
+        schedule_index(instance.dessert_id)
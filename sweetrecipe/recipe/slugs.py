@@ -0,0 +1,124 @@
+"""slug для URL десертов, категорий и профилей.
+
+slug создается один раз, при первом сохранении, и потом не меняется,
+даже если изменилось название: URL страниц остаются постоянными, а с
+ними ключи кэша и ссылки. Основа slug - название в латинице
+("Медовый торт" -> "medovyiy-tort"), при совпадении добавляется номер:
+medovyiy-tort-2, medovyiy-tort-3.
+
+Свободный номер находится одним запросом: из slug с той же основой
+выбираются только вида <основа>-<число>, остальные ("tort-s-vishney" для
+основы "tort") не читаются.
+Два одновременных сохранения могут выбрать один и тот же номер; тогда
+второе получит IntegrityError от уникального индекса и повторит выбор
+(SlugMixin), блокировки не нужны.
+"""
+import re
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+
+# Таблица транслитерации, общая для slug и поискового индекса
+TRANSLIT = {'ь':'', 'ъ':'', 'а':'a', 'б':'b','в':'v',
+       'г':'g', 'д':'d', 'е':'e', 'ё':'yo','ж':'zh',
+       'з':'z', 'и':'i', 'й':'y', 'к':'k', 'л':'l',
+       'м':'m', 'н':'n', 'о':'o', 'п':'p', 'р':'r',
+       'с':'s', 'т':'t', 'у':'u', 'ф':'f', 'х':'h',
+       'ц':'ts', 'ч':'ch', 'ш':'sh', 'щ':'sch', 'ы':'yi',
+       'э':'e', 'ю':'yu', 'я':'ya'}
+TRANSLIT_TABLE = str.maketrans(TRANSLIT)
+
+# Место под "-<номер>" в пределах SlugField(max_length=255)
+MAX_BASE_LENGTH = 240
+# Сколько раз сохранение повторяется, если slug занял параллельный запрос
+SAVE_ATTEMPTS = 5
+
+
+def base_slug(text: str, default: str = 'item') -> str:
+    """Основа slug: текст в нижнем регистре латиницей через дефис"""
+    slug = slugify(text, allow_unicode=True).translate(TRANSLIT_TABLE)[:MAX_BASE_LENGTH].strip('-')
+    return slug or default
+
+
+def numbered(base: str, n: int) -> str:
+    return base if n == 1 else f'{base}-{n}'
+
+
+def numbered_query(bases) -> Q:
+    """Условие на slug вида <основа>-<число> для любой из основ.
+
+    Префикс позволяет базе использовать индекс slug, регулярное выражение
+    отсекает slug с той же основой, но без номера в конце.
+    """
+    query = Q()
+    for base in bases:
+        query |= Q(slug__startswith=base + '-', slug__regex=rf'^{re.escape(base)}-[0-9]+$')
+    return query
+
+
+def unique_slugs(model, texts, default=None) -> list:
+    """Свободные slug для списка названий, не совпадающие и между собой.
+
+    Один запрос проверяет основы всех названий; для занятых основ и основ,
+    повторяющихся в списке, второй запрос находит занятые номера.
+    """
+    default = default or model._meta.model_name
+    bases = [base_slug(text, default) for text in texts]
+    manager = model._default_manager
+    counts = Counter(bases)
+    unique_bases = list(counts)
+    taken = set()
+    for start in range(0, len(unique_bases), 500):
+        taken.update(manager.filter(slug__in=unique_bases[start:start + 500]).values_list('slug', flat=True))
+
+    # Занятые номера каждой основы: 1 - сама основа, n - <основа>-n
+    numbers = {base: {1} if base in taken else set() for base in unique_bases}
+    busy = [base for base in unique_bases if base in taken or counts[base] > 1]
+    for start in range(0, len(busy), 100):
+        for slug in manager.filter(numbered_query(busy[start:start + 100])).values_list('slug', flat=True):
+            base, _, suffix = slug.rpartition('-')
+            if base in numbers:
+                numbers[base].add(int(suffix))
+
+    slugs = []
+    next_number = dict.fromkeys(unique_bases, 1)
+    for base in bases:
+        n = next_number[base]
+        while n in numbers[base]:
+            n += 1
+        numbers[base].add(n)
+        next_number[base] = n + 1
+        slugs.append(numbered(base, n))
+    return slugs
+
+
+def unique_slug(model, text, default=None) -> str:
+    return unique_slugs(model, [text], default)[0]
+
+
+class SlugMixin:
+    """Заполняет пустой slug при сохранении; заданный slug не меняется.
+
+    slug_source() возвращает текст, из которого строится slug.
+    """
+
+    def slug_source(self) -> str:
+        raise NotImplementedError
+
+    def save(self, *args, **kwargs):
+        if self.slug:
+            return super().save(*args, **kwargs)
+        model = type(self)
+        for attempt in range(SAVE_ATTEMPTS):
+            self.slug = unique_slug(model, self.slug_source())
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Повторяем, только если slug успел занять параллельный запрос
+                if attempt == SAVE_ATTEMPTS - 1 or not model._default_manager.filter(slug=self.slug).exists():
+                    self.slug = ''
+                    raise
@@ -2,7 +2,11 @@ from xml.dom import ValidationErr
 from django import template
 from django.contrib.auth.models import User
 from django.forms import ValidationError
+from django.utils.html import format_html, format_html_join
 
+from recipe import formatting
+from recipe.categories import registry as category_registry
+from recipe.images import DISPLAY_SIZES, picture_sources
 from recipe.models import *
 
 
@@ -11,4 +15,48 @@ register = template.Library()
 
 @register.simple_tag(name='order_by_name')
 def get_order_categories():
-    return Category.objects.order_by('name')
+    return category_registry.all()
+
+
+
+@register.filter
+def thumbnail(file, kind):
+    """URL уменьшенной копии фото, если ее еще нет - оригинала"""
+    if not file:
+        return ''
+    src, _ = picture_sources(file, kind)
+    return src or file.url
+
+
+@register.simple_tag
+def picture(file, kind, sizes=None, **attrs):
+    """<picture> с WebP и JPEG копиями фото в srcset: {% picture dessert.photo 'card' class="card-img-top" %}
+
+    sizes - какую ширину страницы занимает фото, по умолчанию DISPLAY_SIZES вида.
+    """
+    if not file:
+        return ''
+    src, srcsets = picture_sources(file, kind)
+    img_attrs = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    if src is None:
+        return format_html('<img src="{}" {} alt="">', file.url, img_attrs)
+    sizes = sizes or DISPLAY_SIZES[kind]
+    img = format_html('<img src="{}" srcset="{}" sizes="{}" {} alt="">', src, srcsets['jpg'], sizes, img_attrs)
+    if 'webp' not in srcsets:
+        return img
+    return format_html(
+        '<picture><source srcset="{}" sizes="{}" type="image/webp">{}</picture>', srcsets['webp'], sizes, img)
+
+
+# Форматирование: {{ dessert.cooking_time|minutes }}, {{ comment.time_create|short_date }}
+register.filter('minutes', formatting.minutes)
+register.filter('comments', formatting.comments)
+register.filter('recipes', formatting.recipes)
+register.filter('short_date', formatting.format_date)
+register.filter('short_datetime', formatting.format_datetime)
+
+
+@register.filter
+def plural(n, forms):
+    """Число со словом в нужной форме: {{ count|plural:"десерт,десерта,десертов" }}"""
+    return formatting.pluralize(int(n or 0), formatting.parse_forms(forms))
@@ -1,3 +1,1169 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from PIL import Image
+
+from . import counters, db, formatting, images, ingredients, jobs, metrics, routers, search, trending, warmup
+from .benchmark import explain
+from .cache import bump, get_versions
+from .categories import registry as category_registry
+from .models import *
+from .pagination import encode_cursor
+from .related import compute_related, related_desserts
+from .slugs import base_slug, numbered_query, unique_slug, unique_slugs
+
+
+class SearchTest(TestCase):
+    """Нормализация слов, ранжирование и выдача только опубликованных десертов"""
+
+    def setUp(self):
+        self.profile = User.objects.create(username='author').profile
+
+    def create(self, title, description='Описание', published=True):
+        dessert = Dessert.objects.create(
+            title=title, ingredients='мука - 200г', description=description, photo='photos/dessert.jpg',
+            cooking_time=30, profile=self.profile, is_published=published,
+        )
+        search.index_dessert(dessert.pk)
+        return dessert
+
+    def test_normalize_terms(self):
+        self.assertEqual(search.stem('торты'), 'торт')
+        self.assertEqual(search.normalize_terms('торты'), ['tort'])
+        self.assertEqual(search.normalize_terms('Торт'), ['tort'])
+        self.assertEqual(search.normalize_terms('tort'), ['tort'])
+        self.assertEqual(search.normalize_terms('Медовый торт и пирог'), search.normalize_terms('медовые торты, пироги'))
+
+    def test_index_backend(self):
+        backend = search.IndexBackend()
+        honey_cake = self.create('Медовый торт')
+        chocolate = self.create('Шоколадный торт', description='Можно добавить мед')
+        pie = self.create('Пирог', description='Похож на торт')
+        hidden = self.create('Медовый торт', published=False)
+        for dessert in (honey_cake, chocolate, pie, hidden):
+            backend.index(dessert.pk, search.document_fields(dessert.pk))
+        # Сначала совпадения с обоими словами, затем по весу поля: название важнее описания
+        self.assertEqual(backend.search(search.normalize_terms('медовый торт'), 10), [honey_cake.pk, chocolate.pk, pie.pk])
+        # При равном весе новые десерты выше
+        self.assertEqual(backend.search(['tort'], 2), [chocolate.pk, honey_cake.pk])
+
+    def test_pages(self):
+        desserts = [self.create(f'Торт {i}') for i in range(13)]
+        for i in range(3):
+            self.create(f'Скрытый торт {i}', published=False)
+        self.assertEqual(set(search.search('торты')), {d.pk for d in desserts})
+
+        response = self.client.get(reverse('search'), {'q': 'торты'})
+        self.assertEqual(response.context['paginator'].count, 13)
+        response = self.client.get(reverse('search'), {'q': 'торты', 'page': 2})
+        self.assertEqual(len(response.context['desserts']), 1)
+
+
+class IngredientsTest(TestCase):
+    """Разбор строк ингредиентов и поиск десертов по ингредиентам"""
+
+    def create(self, title, text, published=True):
+        return Dessert.objects.create(
+            title=title, ingredients=text, description='Описание', photo='photos/dessert.jpg',
+            cooking_time=30, profile=self.profile, is_published=published,
+        )
+
+    def setUp(self):
+        self.profile = User.objects.create(username='author').profile
+
+    def test_parse_line(self):
+        for line, expected in (
+            ('сгущенное молоко - 300г', ('сгущенное молоко', Decimal('300'), 'г')),
+            ('сахар 1,5 ст. л.', ('сахар', Decimal('1.5'), 'ст. л.')),
+            ('ванилин 1/2 ч.л.', ('ванилин', Decimal('0.50'), 'ч. л.')),
+            ('яйца 2 шт', ('яйца', Decimal('2'), 'шт')),
+            ('Мука пшеничная: 2 стакана', ('мука пшеничная', Decimal('2'), 'стакан')),
+            ('соль', ('соль', None, '')),
+        ):
+            with self.subTest(line=line):
+                self.assertEqual(ingredients.parse_line(line), expected)
+        keys = [key for key, _ in ingredients.parse_ingredients('Сахар - 100г\nсахар 1,5 ст. л.\nяйца 2 шт')]
+        self.assertEqual(keys, ['сахар', 'яйц'])
+        self.assertIsNone(ingredients.parse_line(' - '))
+
+    def test_desserts_by_ingredients(self):
+        medovik = self.create('Медовик', 'мука пшеничная - 300г\nмед - 3 ст. л.\nяйца - 2 шт')
+        biscuit = self.create('Бисквит', 'мука - 200г\nяйца - 4 шт\nсахар - 200г\nмука рисовая - 50г')
+        self.create('Черновик', 'мука - 100г', published=False)
+
+        matches = ingredients.desserts_by_ingredients(['Мука', 'яйцо'])
+        self.assertEqual(
+            [(m['dessert'], m['matched'], m['total']) for m in matches],
+            [(medovik.pk, 2, 3), (biscuit.pk, 2, 4)],
+        )
+        self.assertEqual([m['dessert'] for m in ingredients.desserts_by_ingredients(['мед'])], [medovik.pk])
+        self.assertEqual(ingredients.desserts_by_ingredients(['шоколад']), [])
+
+        response = self.client.get(reverse('what_can_i_bake'), {'ingredients': 'мука, сахар'})
+        self.assertEqual([r['dessert'].pk for r in response.context['results']], [biscuit.pk, medovik.pk])
+
+
+class DessertCardQueriesTest(TestCase):
+    """Число запросов на страницах со списком карточек не зависит от числа десертов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Торты')
+        cls.other_category = Category.objects.create(name='Пироги')
+        cls.profiles = []
+        for i in range(3):
+            user = User.objects.create(username=f'user{i}')
+            cls.profiles.append(user.profile)
+
+    def create_desserts(self, count):
+        for i in range(count):
+            dessert = Dessert.objects.create(
+                title=f'Десерт {Dessert.objects.count()}',
+                ingredients='мука - 200г',
+                description='Описание',
+                photo='photos/dessert.jpg',
+                cooking_time=30,
+                profile=self.profiles[i % len(self.profiles)],
+            )
+            dessert.category.add(self.category, self.other_category)
+
+    def assertConstantQueries(self, url, num):
+        for count in (3, 9):
+            self.create_desserts(count)
+            # Реестр категорий перезагружается один раз после изменения счетчиков
+            category_registry.all()
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_home(self):
+        # Десерты и категории к ним
+        self.assertConstantQueries(reverse('home'), 2)
+
+    def test_show_category(self):
+        # Категория берется из реестра, запросы только за десертами и категориями к ним
+        response = self.assertConstantQueries(reverse('showcategory', kwargs={'category_slug': self.category.slug}), 2)
+        self.assertEqual(len(response.context['desserts']), 12)
+
+    def test_show_user_dessert(self):
+        # Профиль, десерты и категории к ним
+        profile = self.profiles[0]
+        self.assertConstantQueries(reverse('show_user_dessert', kwargs={'username_slug': profile.slug}), 3)
+
+    def test_cards_skip_text_fields(self):
+        self.create_desserts(1)
+        dessert = Dessert.objects.cards().get()
+        self.assertEqual(dessert.get_deferred_fields(), {'ingredients', 'description'})
+
+
+def image_upload(name='step.png', size=(10, 10)):
+    buffer = BytesIO()
+    Image.new('RGB', size).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+def jpeg_bytes(**kwargs):
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, 'JPEG', **kwargs)
+    return buffer.getvalue()
+
+
+def failing_task():
+    raise RuntimeError('сбой')
+
+
+@override_settings(JOBS_EAGER=True)
+class ImageVariantsTest(TestCase):
+    """Копии фото записываются в *_variants и выводятся в srcset без обращений к хранилищу"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.profile = User.objects.create(username='author').profile
+
+    def create(self, size):
+        with self.captureOnCommitCallbacks(execute=True):
+            dessert = Dessert.objects.create(
+                title='Торт', ingredients='мука - 200г', description='Описание', cooking_time=30,
+                photo=image_upload('cake.png', size), profile=self.profile,
+            )
+        dessert.refresh_from_db()
+        return dessert
+
+    def render(self, dessert):
+        template = engines['django'].from_string('{% load recipe_tags %}{% picture dessert.photo "card" class="card-img-top" %}')
+        with mock.patch.object(images.default_storage, 'exists', side_effect=AssertionError('exists() при рендере')):
+            return template.render({'dessert': dessert})
+
+    def test_variants(self):
+        dessert = self.create((800, 400))
+        variants = dessert.photo_variants
+        self.assertEqual(variants['name'], dessert.photo.name)
+        self.assertEqual(variants['card'], [[300, 300], [600, 600]])
+        # Фото не увеличиваются: копия шириной 1200 - это оригинал 800 пикселей
+        self.assertEqual(variants['detail'], [[600, 600], [1200, 800]])
+        with default_storage.open(images.derivative_name(dessert.photo.name, 'detail', 1200, 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (800, 400))
+
+        html = self.render(Dessert.objects.cards().get())
+        root = settings.MEDIA_URL + os.path.splitext(dessert.photo.name)[0]
+        self.assertIn(f'srcset="{root}.card-300.jpg 300w, {root}.card-600.jpg 600w"', html)
+        self.assertIn(f'src="{root}.card-600.jpg"', html)
+        self.assertIn(f'sizes="{images.DISPLAY_SIZES["card"]}"', html)
+        if 'webp' in images.FORMATS:
+            self.assertIn(f'<source srcset="{root}.card-300.webp 300w, {root}.card-600.webp 600w"', html)
+
+    def test_small_photo(self):
+        dessert = self.create((200, 100))
+        self.assertEqual(dessert.photo_variants['card'], [[300, 200]])
+
+    def test_save_without_new_photo(self):
+        dessert = self.create((800, 400))
+        versions = get_versions('desserts', f'dessert:{dessert.slug}')
+        # Те же копии повторно не записываются и кэш не сбрасывают
+        images.process_instance(dessert)
+        self.assertEqual(Dessert.objects.get().time_update, dessert.time_update)
+        self.assertEqual(get_versions('desserts', f'dessert:{dessert.slug}'), versions)
+        # Правка описания фото не меняет: обработка не ставится
+        with mock.patch.object(images, 'schedule_processing') as schedule:
+            dessert.description = 'Новое описание'
+            dessert.save()
+            self.profile.user.save()
+        schedule.assert_not_called()
+
+    def test_generate_thumbnails(self):
+        with override_settings(JOBS_EAGER=False):
+            dessert = Dessert.objects.create(
+                title='Торт', ingredients='мука - 200г', description='Описание', cooking_time=30,
+                photo=image_upload('cake.png', (800, 400)), profile=self.profile,
+            )
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        updated = Dessert.objects.get()
+        self.assertEqual(updated.photo_variants['card'], [[300, 300], [600, 600]])
+        # time_update входит в ключ фрагмента карточки
+        self.assertGreater(updated.time_update, dessert.time_update)
+
+        versions = get_versions('desserts')
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        self.assertEqual(Dessert.objects.get().time_update, updated.time_update)
+        self.assertEqual(get_versions('desserts'), versions)
+
+    def test_without_variants(self):
+        dessert = self.create((800, 400))
+        # Копии сделаны для прежнего фото: выводится оригинал нового
+        dessert.photo.name = 'photos/other.jpg'
+        html = self.render(dessert)
+        self.assertEqual(html, f'<img src="{settings.MEDIA_URL}photos/other.jpg" class="card-img-top" alt="">')
+
+
+@override_settings(JOBS_EAGER=False, JOBS_RETRY_DELAY=30)
+class JobQueueTest(TestCase):
+    """Захват задач, повтор с задержкой, возврат брошенных задач и ошибки в режиме JOBS_EAGER"""
+
+    def setUp(self):
+        tasks = mock.patch.dict(jobs.TASKS, {'tests.fail': (failing_task, 2), 'tests.noop': (lambda: None, 5)})
+        tasks.start()
+        self.addCleanup(tasks.stop)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def test_claim(self):
+        first = jobs.enqueue('tests.noop', key='a')
+        self.assertIsNone(jobs.enqueue('tests.noop', key='a'))
+        second = jobs.enqueue('tests.noop', key='b')
+        self.assertEqual([job.pk for job in jobs.claim(1, 60)], [first.pk])
+        self.assertEqual([job.pk for job in jobs.claim(5, 60)], [second.pk])
+        self.assertEqual(jobs.claim(5, 60), [])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (Job.RUNNING, 1))
+
+    def test_retry(self):
+        jobs.enqueue('tests.fail')
+        job, = jobs.claim(1, 60)
+        with self.assertLogs('recipe.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIn('сбой', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=20))
+        self.assertEqual(jobs.claim(1, 60), [])
+
+        Job.objects.update(run_at=timezone.now())
+        job, = jobs.claim(1, 60)
+        with self.assertLogs('recipe.jobs', 'WARNING'):
+            jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_visibility_timeout(self):
+        jobs.enqueue('tests.noop')
+        job, = jobs.claim(1, 60)
+        self.assertEqual(jobs.claim(1, 60), [])
+        # Воркер упал, не завершив задачу: после locked_until ее забирает другой
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed, = jobs.claim(1, 60)
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (job.pk, 2))
+        self.assertTrue(jobs.run(reclaimed))
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_failure(self):
+        with self.assertLogs('recipe.jobs', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue('tests.fail')
+        # Фото нет в хранилище: обработка пишет предупреждение, сохранение не падает
+        with self.assertLogs('recipe.images', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Dessert.objects.create(
+                    title='Торт', ingredients='мука - 200г', description='Описание',
+                    photo='photos/missing.jpg', cooking_time=30,
+                    profile=User.objects.create(username='author').profile,
+                )
+        self.assertTrue(Dessert.objects.exists())
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_key_after_rollback(self):
+        calls = []
+        with mock.patch.dict(jobs.TASKS, {'tests.record': (lambda value: calls.append(value), 5)}):
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        jobs.enqueue('tests.record', key='k', value=1)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                # Ключ из откатившейся транзакции не мешает поставить задачу снова
+                jobs.enqueue('tests.record', value=0)
+                jobs.enqueue('tests.record', key='k', value=2)
+                jobs.enqueue('tests.record', key='k', value=3)
+        self.assertEqual(calls, [0, 2])
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_key_after_savepoint_rollback(self):
+        calls = []
+        with mock.patch.dict(jobs.TASKS, {'tests.record': (lambda value: calls.append(value), 5)}):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue('tests.record', key='a', value=0)
+                try:
+                    with transaction.atomic():
+                        jobs.enqueue('tests.record', key='k', value=1)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                # Задача из откаченного блока не выполнится, ее ключ снова свободен,
+                # а ключи внешнего блока остаются
+                jobs.enqueue('tests.record', key='k', value=2)
+                jobs.enqueue('tests.record', key='a', value=3)
+                with transaction.atomic():
+                    jobs.enqueue('tests.record', key='k', value=4)
+        self.assertEqual(calls, [0, 2])
+
+    def test_strip_exif(self):
+        plain = default_storage.save('photos/plain.jpg', ContentFile(jpeg_bytes()))
+        with open(default_storage.path(plain), 'rb') as f:
+            content = f.read()
+        self.assertFalse(images.strip_exif(plain))
+        with open(default_storage.path(plain), 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        name = default_storage.save('photos/exif.jpg', ContentFile(jpeg_bytes(exif=exif)))
+        self.assertTrue(images.strip_exif(name))
+        with default_storage.open(name) as f:
+            self.assertFalse(Image.open(f).getexif())
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'photos'))), ['exif.jpg', 'plain.jpg'])
+
+
+@override_settings(JOBS_EAGER=False)
+class RecipeWritePathTest(TestCase):
+    """Число запросов при сохранении рецепта не зависит от числа шагов"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create(username='author')
+        self.category = Category.objects.create(name='Торты')
+        self.client.force_login(self.user)
+
+    def dessert_data(self, title, steps, initial=0):
+        data = {
+            'title': title, 'ingredients': 'мука - 200г', 'description': 'Описание', 'cooking_time': 30,
+            'category': [self.category.pk], 'profile': self.user.profile.pk,
+            'form-TOTAL_FORMS': len(steps), 'form-INITIAL_FORMS': initial, 'form-MAX_NUM_FORMS': 20,
+        }
+        for i, step in enumerate(steps):
+            data.update({f'form-{i}-{name}': value for name, value in step.items()})
+        return data
+
+    def add_dessert(self, title, count):
+        steps = [{'recipe_text': f'Шаг {i}', 'image': image_upload()} for i in range(count)]
+        data = self.dessert_data(title, steps)
+        data['photo'] = image_upload('dessert.png')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('addrecipe'), data)
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_add_recipe(self):
+        # Первый десерт еще создает ингредиенты
+        self.add_dessert('Кекс', 1)
+        self.assertEqual(self.add_dessert('Торт', 1), self.add_dessert('Пирог', 20))
+        dessert = Dessert.objects.get(title='Пирог')
+        self.assertEqual(dessert.recipe.count(), 20)
+        self.assertEqual(list(dessert.category.all()), [self.category])
+
+    def test_edit_recipe_writes_only_changed_steps(self):
+        self.add_dessert('Торт', 5)
+        dessert = Dessert.objects.get()
+        steps = list(dessert.recipe.order_by('pk'))
+        data = self.dessert_data(dessert.title, [{'id': s.pk, 'recipe_text': s.recipe_text} for s in steps], len(steps))
+        data['form-2-recipe_text'] = 'Новый текст'
+        writes = self.edit(dessert, data)
+        # Измененный шаг и один UPDATE time_update десерта
+        self.assertEqual(len(writes), 2)
+        self.assertIn('recipe_recipe', writes[0])
+        self.assertIn('"time_update"', writes[1])
+        self.assertEqual(Recipe.objects.get(pk=steps[2].pk).recipe_text, 'Новый текст')
+        self.assertGreater(Dessert.objects.get().time_update, dessert.time_update)
+
+    def test_edit_categories(self):
+        self.add_dessert('Торт', 1)
+        dessert = Dessert.objects.get()
+        other = Category.objects.create(name='Пироги')
+        step = dessert.recipe.get()
+        data = self.dessert_data(dessert.title, [{'id': step.pk, 'recipe_text': step.recipe_text}], 1)
+        data['category'] = [other.pk]
+        versions = get_versions('desserts', f'dessert:{dessert.slug}')
+        # set() удаляет старую связь и добавляет новую, десерт обновляется один раз
+        with mock.patch('recipe.cache.bump', wraps=bump) as bump_mock:
+            writes = self.edit(dessert, data)
+        self.assertEqual(len([sql for sql in writes if sql.startswith('UPDATE "recipe_dessert"')]), 1)
+        self.assertEqual(bump_mock.call_count, 1)
+        self.assertNotEqual(get_versions('desserts', f'dessert:{dessert.slug}'), versions)
+        self.assertEqual(list(Dessert.objects.get().category.all()), [other])
+        self.assertGreater(Dessert.objects.get().time_update, dessert.time_update)
+
+    def test_set_categories(self):
+        dessert = Dessert.objects.create(
+            title='Торт', ingredients='мука - 200г', description='Описание',
+            photo='photos/tort.jpg', cooking_time=30, profile=self.user.profile,
+        )
+        dessert.category.add(self.category)
+        other = Category.objects.create(name='Пироги')
+        with mock.patch('recipe.cache.bump', wraps=bump) as bump_mock, CaptureQueriesContext(connection) as queries:
+            # set() удаляет старую связь и добавляет новую, десерт обновляется один раз
+            with transaction.atomic():
+                dessert.category.set([other])
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "recipe_dessert"')]
+        self.assertEqual(len(updates), 1)
+        bump_mock.assert_called_once_with('desserts', 'dessert:tort')
+        self.assertGreater(Dessert.objects.get().time_update, dessert.time_update)
+
+    def edit(self, dessert, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('edit_recipe', kwargs={'recipe_slug': dessert.slug}), data)
+        self.assertEqual(response.status_code, 302)
+        return [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+
+class MetricsTest(TestCase):
+    """Гистограммы в формате Prometheus"""
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'Тест', (1, 2))
+        for value in (5, 1, 1.5):
+            histogram.observe('home', value)
+        self.assertEqual(list(histogram.lines())[2:], [
+            'sweetrecipe_test_seconds_bucket{view="home",le="1"} 1',
+            'sweetrecipe_test_seconds_bucket{view="home",le="2"} 2',
+            'sweetrecipe_test_seconds_bucket{view="home",le="+Inf"} 3',
+            'sweetrecipe_test_seconds_sum{view="home"} 7.500000',
+            'sweetrecipe_test_seconds_count{view="home"} 3',
+        ])
+
+    def test_endpoint(self):
+        self.client.get(reverse('about'))
+        text = self.client.get(settings.METRICS_PATH).content.decode()
+        self.assertIn('sweetrecipe_requests_total{view="about",status="200"}', text)
+        self.assertIn('sweetrecipe_request_duration_seconds_count{view="about"}', text)
+
+
+class CursorPaginationTest(TestCase):
+    """Курсор листает вперед и назад, подделанный курсор дает 404 (400 в API)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = User.objects.create(username='author').profile
+        cls.category = Category.objects.create(name='Торты')
+        cls.desserts = []
+        for i in range(5):
+            dessert = Dessert.objects.create(
+                title=f'Десерт {i}', ingredients='мука - 200г', description='Описание',
+                photo='photos/dessert.jpg', cooking_time=30, profile=cls.profile,
+            )
+            dessert.category.add(cls.category)
+            cls.desserts.append(dessert)
+
+    def page(self, url, cursor=None):
+        response = self.client.get(url, {'cursor': cursor} if cursor else {})
+        page = response.context['page_obj']
+        return [d.pk for d in page], page
+
+    def test_round_trip(self):
+        ids = [d.pk for d in self.desserts]
+        url = reverse('home')
+        first, page = self.page(url)
+        self.assertEqual(first, ids[:2])
+        self.assertIsNone(page.previous_cursor)
+        second, page = self.page(url, page.next_cursor)
+        self.assertEqual(second, ids[2:4])
+        self.assertEqual(self.page(url, page.previous_cursor)[0], ids[:2])
+        last, page = self.page(url, page.next_cursor)
+        self.assertEqual(last, ids[4:])
+        self.assertIsNone(page.next_cursor)
+        self.assertEqual(self.page(url, page.previous_cursor)[0], ids[2:4])
+
+    def test_tampered(self):
+        home = reverse('home')
+        category = self.category.get_absolute_url()
+        for url, values in (
+            (home, ['abc']),
+            (home, [None]),
+            (home, [{'id': 1}]),
+            (home, [1, 2]),
+            (category, ['не дата', 1]),
+            (category, [timezone.now().isoformat(), 'abc']),
+        ):
+            with self.subTest(url=url, values=values):
+                response = self.client.get(url, {'cursor': encode_cursor(values)})
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(home, {'cursor': 'не base64'}).status_code, 404)
+
+        response = self.client.get(reverse('api_dessert_list'), {'cursor': encode_cursor(['abc', 'abc'])})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Неверный курсор'})
+
+
+class CommentPaginationTest(TestCase):
+    """Комментарии отдаются страницами, счетчик комментариев поддерживается сигналами"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = User.objects.create(username='reader').profile
+        cls.dessert = Dessert.objects.create(
+            title='Торт', ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=cls.profile,
+        )
+        for i in range(25):
+            Comment.objects.create(text=f'Комментарий {i}', profile=cls.profile, dessert=cls.dessert)
+
+    def test_comment_count(self):
+        self.dessert.refresh_from_db()
+        self.assertEqual(self.dessert.comment_count, 25)
+        Comment.objects.filter(dessert=self.dessert).first().delete()
+        self.dessert.refresh_from_db()
+        self.assertEqual(self.dessert.comment_count, 24)
+
+    def test_pages(self):
+        response = self.client.get(self.dessert.get_absolute_url())
+        first_page = response.context['comments']
+        self.assertEqual(len(first_page), 20)
+        response = self.client.get(
+            reverse('recipe_comments', kwargs={'recipe_slug': self.dessert.slug}),
+            {'cursor': first_page.next_cursor, 'format': 'json'},
+        )
+        data = response.json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(data['comments'][-1]['text'], 'Комментарий 0')
+
+
+class FragmentCacheTest(TestCase):
+    """Закэшированные фрагменты обновляются при изменении данных, которые они показывают"""
+
+    def test_comment_author_rename(self):
+        author = User.objects.create(username='author')
+        reader = User.objects.create(username='reader')
+        dessert = Dessert.objects.create(
+            title='Торт', ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=author.profile,
+        )
+        Comment.objects.create(text='Вкусно', profile=reader.profile, dessert=dessert)
+        # Страницы вошедших пользователей не кэшируются целиком, только фрагменты
+        self.client.force_login(author)
+        self.assertContains(self.client.get(dessert.get_absolute_url()), 'reader')
+
+        profile = Profile.objects.get(user=reader)
+        profile.name = 'Читатель'
+        profile.save()
+        response = self.client.get(dessert.get_absolute_url())
+        self.assertContains(response, 'Читатель')
+
+
+class CountersTest(TestCase):
+    """Счетчики профиля обновляются сигналами и не перезаписываются сохранением"""
+
+    def test_profile_counters(self):
+        profile = User.objects.create(username='author').profile
+        dessert = Dessert.objects.create(
+            title='Торт', ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=profile,
+        )
+        stale = Profile.objects.get(pk=profile.pk)
+        Comment.objects.create(text='Вкусно', profile=profile, dessert=dessert)
+        stale.name = 'Автор'
+        stale.save()
+        profile.refresh_from_db()
+        self.assertEqual((profile.dessert_count, profile.comment_count), (1, 1))
+
+        dessert.is_published = False
+        dessert.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.dessert_count, 0)
+
+        Profile.objects.update(comment_count=10)
+        self.assertEqual(counters.recount()['profile.comment_count'], 1)
+        profile.refresh_from_db()
+        self.assertEqual(profile.comment_count, 1)
+
+
+class TrendingTest(TestCase):
+    """Просмотры пишутся пачкой, лента популярного сортируется по оценке"""
+
+    @override_settings(TRENDING_FLUSH_SIZE=3)
+    def test_trending(self):
+        profile = User.objects.create(username='author').profile
+        desserts = [
+            Dessert.objects.create(
+                title=f'Торт {i}', ingredients='мука - 200г', description='Описание',
+                photo='photos/dessert.jpg', cooking_time=30, profile=profile,
+            )
+            for i in range(3)
+        ]
+        # Буфер общий для процесса, в нем могут остаться просмотры других тестов
+        trending.buffer.flush()
+        for dessert in (desserts[0], desserts[0], desserts[1]):
+            self.client.get(dessert.get_absolute_url())
+        trending.write_views({desserts[0].slug: 1, 'missing': 5})
+        views = dict(DessertViewCount.objects.values_list('dessert_id', 'views'))
+        self.assertEqual(views, {desserts[0].pk: 3, desserts[1].pk: 1})
+
+        DessertViewCount.objects.create(
+            dessert=desserts[2], day=timezone.localdate() - timedelta(days=3), views=100)
+        self.assertEqual(trending.compute_scores(), 3)
+        response = self.client.get(reverse('trending'))
+        self.assertEqual([d.pk for d in response.context['desserts']], [desserts[2].pk, desserts[0].pk, desserts[1].pk])
+
+
+@override_settings(RELATED_DESSERTS_COUNT=2)
+class RelatedDessertsTest(TestCase):
+    """Похожие десерты по общим категориям и ингредиентам, повторный расчет - только по изменениям"""
+
+    def setUp(self):
+        self.profile = User.objects.create(username='author').profile
+        self.cakes = Category.objects.create(name='Торты')
+        self.pies = Category.objects.create(name='Пироги')
+
+    def create(self, title, ingredients, category):
+        dessert = Dessert.objects.create(
+            title=title, ingredients=ingredients, description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=self.profile,
+        )
+        dessert.category.add(category)
+        return dessert
+
+    def related_titles(self, dessert):
+        return [d.title for d in related_desserts(dessert)]
+
+    def test_related(self):
+        honey = self.create('Медовик', 'мед - 100г\nмука - 300г\nсметана - 400г', self.cakes)
+        napoleon = self.create('Наполеон', 'мука - 300г\nмасло - 200г\nсметана - 200г', self.cakes)
+        apple = self.create('Шарлотка', 'яблоки - 5 шт\nмука - 200г', self.pies)
+        self.create('Желе', 'желатин - 20г', self.pies)
+
+        self.assertEqual(compute_related(), {'desserts': 4, 'rows': 7, 'full': True})
+        self.assertEqual(self.related_titles(honey), ['Наполеон', 'Шарлотка'])
+        with self.assertNumQueries(1):
+            related_desserts(honey)
+
+        # Новый десерт попадает в списки старых без их полного пересчета
+        sour = self.create('Сметанник', 'мед - 100г\nсметана - 400г', self.cakes)
+        result = compute_related()
+        self.assertFalse(result['full'])
+        self.assertEqual(self.related_titles(honey), ['Сметанник', 'Наполеон'])
+        self.assertEqual(self.related_titles(sour), ['Медовик', 'Наполеон'])
+
+        # Снятый с публикации десерт пропадает из списков
+        sour.is_published = False
+        sour.save()
+        compute_related()
+        self.assertEqual(self.related_titles(honey), ['Наполеон', 'Шарлотка'])
+        self.assertEqual(compute_related(full=True)['rows'], 7)
+
+        response = self.client.get(honey.get_absolute_url())
+        self.assertContains(response, 'Похожие десерты')
+        self.assertContains(response, apple.get_absolute_url())
+
+
+class DatabaseSettingsTest(TestCase):
+    """PRAGMA для новых соединений с SQLite, проверка переиспользуемых соединений и отметки в транзакциях"""
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            # 1 - NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_health_checks(self):
+        self.assertNotIn('CONN_HEALTH_CHECKS', settings.DATABASES['default'])
+        dead = mock.Mock(connection=object(), vendor='postgresql', in_atomic_block=False, **{'is_usable.return_value': False})
+        alive = mock.Mock(connection=object(), vendor='postgresql', in_atomic_block=False, **{'is_usable.return_value': True})
+        unopened = mock.Mock(connection=None, vendor='postgresql', in_atomic_block=False)
+        with mock.patch.object(db.connections, 'all', return_value=[dead, alive, unopened]):
+            with override_settings(DB_CONN_HEALTH_CHECKS=False):
+                db.check_reused_connections()
+            dead.is_usable.assert_not_called()
+
+            db.check_reused_connections()
+        dead.close.assert_called_once()
+        alive.close.assert_not_called()
+        # Еще не открытое соединение не проверяется и не открывается
+        unopened.is_usable.assert_not_called()
+
+    def test_atomic_marks(self):
+        with transaction.atomic():
+            self.assertTrue(db.first_in_atomic_block('a'))
+            self.assertFalse(db.first_in_atomic_block('a'))
+            try:
+                with transaction.atomic():
+                    # Вложенный блок отмечает ключи отдельно
+                    self.assertTrue(db.first_in_atomic_block('a'))
+                    self.assertTrue(db.first_in_transaction('b'))
+                    self.assertFalse(db.first_in_transaction('b'))
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            # Отметки откаченного блока пропали вместе с ним
+            self.assertTrue(db.first_in_transaction('b'))
+            self.assertFalse(db.first_in_transaction('a'))
+            with transaction.atomic(savepoint=False):
+                self.assertFalse(db.first_in_atomic_block('a'))
+        with transaction.atomic():
+            self.assertTrue(db.first_in_atomic_block('a'))
+
+
+@override_settings(REPLICA_DATABASES=['default'])
+class ReplicaRoutingTest(TestCase):
+    """Чтение с реплик только в представлениях replica_reads и не после записи"""
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        with override_settings(REPLICA_DATABASES=['replica1']):
+            self.assertEqual(router.db_for_read(Dessert), 'default')
+            routers._state.replicas, routers._state.wrote = True, False
+            try:
+                self.assertEqual(router.db_for_read(Dessert), 'replica1')
+                self.assertEqual(router.db_for_write(Dessert), 'default')
+                self.assertEqual(router.db_for_read(Dessert), 'default')
+            finally:
+                routers._state.replicas = routers._state.wrote = False
+
+    @override_settings(REPLICA_PIN_SECONDS=10)
+    def test_recent_change_reads_primary(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with mock.patch('recipe.cache.time') as clock:
+            clock.time.return_value = 1000.0
+            dessert = Dessert.objects.create(
+                title='Торт', ingredients='мука - 200г', description='Описание',
+                photo='photos/dessert.jpg', cooking_time=30, profile=User.objects.create(username='author').profile,
+            )
+            with mock.patch('recipe.routers.random.choice', side_effect=lambda aliases: aliases[0]) as choice:
+                # Версии уже новые, реплика может отставать: страница строится по основной базе
+                clock.time.return_value = 1005.0
+                self.assertEqual(self.client.get(dessert.get_absolute_url()).status_code, 200)
+                choice.assert_not_called()
+                # Изменений дольше REPLICA_PIN_SECONDS нет - реплика догнала основную базу.
+                # Время еще не менявшихся категорий было записано первым запросом
+                clock.time.return_value = 1016.0
+                self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+                choice.assert_called()
+
+    def test_pin_after_write(self):
+        user = User.objects.create(username='author')
+        dessert = Dessert.objects.create(
+            title='Торт', ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=user.profile,
+        )
+        self.client.force_login(user)
+        response = self.client.get(dessert.get_absolute_url())
+        self.assertNotIn(routers.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.post(dessert.get_absolute_url(), {'text': 'Вкусно'})
+        self.assertIn(routers.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.get(dessert.get_absolute_url())
+        self.assertTrue(routers.pinned(response.wsgi_request))
+
+
+class ExplainTest(TestCase):
+    """Полные просмотры таблиц в планах запросов"""
+
+    def test_analyze_plan(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        plan = [
+            'SCAN recipe_dessert',
+            'SEARCH recipe_profile USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN recipe_category',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(explain.analyze_plan(plan), (['recipe_dessert'], True))
+        plan = ['SCAN recipe_dessert USING INDEX recipe_dessert_published_idx']
+        self.assertEqual(explain.analyze_plan(plan), ([], False))
+
+    def test_category_join_uses_index(self):
+        category = Category.objects.create(name='Торты')
+        sql = str(Dessert.objects.filter(category=category).only('id').query)
+        plan = explain.explain(sql)
+        self.assertTrue(any('recipe_dessert_category_cat_idx' in line for line in plan), plan)
+
+
+class PublishedDessertsTest(TestCase):
+    """Публичные страницы показывают только опубликованные десерты"""
+
+    def test_hidden(self):
+        author = User.objects.create(username='author')
+        category = Category.objects.create(name='Торты')
+        live, hidden = [
+            Dessert.objects.create(
+                title=title, ingredients='мука - 200г', description='Описание',
+                photo='photos/dessert.jpg', cooking_time=30, profile=author.profile, is_published=published,
+            )
+            for title, published in (('Медовик', True), ('Черновик', False))
+        ]
+        live.category.add(category)
+        hidden.category.add(category)
+
+        for url in (reverse('home'), category.get_absolute_url(), author.profile.get_absolute_url()):
+            desserts = list(self.client.get(url).context['desserts'])
+            self.assertEqual(desserts, [live], url)
+        self.assertEqual(self.client.get(hidden.get_absolute_url()).status_code, 404)
+        self.assertEqual(list(Dessert.objects.order_by('pk')), [live, hidden])
+
+        self.client.force_login(author)
+        self.assertEqual(self.client.get(hidden.get_absolute_url()).status_code, 200)
+
+    def test_partial_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        sql = str(Dessert.published.order_by('-time_create', '-id').only('id')[:12].query)
+        plan = explain.explain(sql)
+        self.assertTrue(any('recipe_dessert_live_time_idx' in line for line in plan), plan)
+
+
+class ConditionalResponseTest(TestCase):
+    """ETag и Last-Modified страниц: 304 без рендера, пока данные не изменились"""
+
+    def setUp(self):
+        # Время изменений в кэше задается тестом, прошлые тесты его не сдвигают
+        cache.clear()
+        self.addCleanup(cache.clear)
+        clock = mock.patch('recipe.cache.time')
+        self.clock = clock.start().time
+        self.addCleanup(clock.stop)
+        self.clock.return_value = 1000.5
+        self.author = User.objects.create(username='author')
+        self.dessert = Dessert.objects.create(
+            title='Торт', ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=self.author.profile,
+        )
+
+    def test_recipe(self):
+        url = self.dessert.get_absolute_url()
+        # В секунду изменения Last-Modified не отдается, только ETag
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        self.clock.return_value = 1001.2
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # Без запросов к базе
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Comment.objects.create(text='Вкусно', profile=self.author.profile, dessert=self.dessert)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unpublish(self):
+        latest = Dessert.objects.create(
+            title='Наполеон', ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=self.author.profile,
+        )
+        url = reverse('home')
+        # Время еще не менявшихся категорий неизвестно и считается текущим
+        self.clock.return_value = 1001.5
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        self.clock.return_value = 1002.0
+        response = self.client.get(url)
+        self.assertContains(response, 'Наполеон')
+        last_modified = response['Last-Modified']
+
+        # MAX(time_update) после снятия с публикации ушел бы назад, время изменения - нет
+        self.clock.return_value = 1002.4
+        latest.is_published = False
+        latest.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Наполеон')
+        self.clock.return_value = 1003.1
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(last_modified))
+
+    def test_home_comment_count(self):
+        url = reverse('home')
+        response = self.client.get(url)
+        self.assertContains(response, '0 комментариев')
+        etag = response['ETag']
+
+        Comment.objects.create(text='Вкусно', profile=self.author.profile, dessert=self.dessert)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '1 комментарий')
+
+    def test_authenticated(self):
+        url = reverse('home')
+        anonymous_etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotEqual(response['ETag'], anonymous_etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class ApiTest(TestCase):
+    """JSON API: выбор полей, курсор, gzip и потоковая выгрузка"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.category = Category.objects.create(name='Торты')
+        self.desserts = []
+        for title, published in (('Медовик', True), ('Наполеон', True), ('Черновик', False)):
+            dessert = Dessert.objects.create(
+                title=title, ingredients='мука - 200г', description='Описание',
+                photo='photos/dessert.jpg', cooking_time=30, profile=self.author.profile, is_published=published,
+            )
+            dessert.category.add(self.category)
+            self.desserts.append(dessert)
+        Recipe.objects.create(recipe_text='Испечь коржи', image='photos/step.jpg', dessert=self.desserts[0])
+
+    def test_list(self):
+        response = self.client.get(reverse('api_dessert_list'), {'limit': 1, 'fields': 'title,categories'})
+        data = response.json()
+        self.assertEqual(data['results'], [{'title': 'Наполеон', 'categories': [{'slug': self.category.slug, 'name': 'Торты'}]}])
+        self.assertIsNone(data['previous'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([d['title'] for d in data['results']], ['Медовик'])
+        self.assertIsNone(data['next'])
+
+        self.assertEqual(self.client.get(reverse('api_dessert_list'), {'fields': 'password'}).status_code, 400)
+        url = reverse('api_user_desserts', kwargs={'username_slug': self.author.profile.slug})
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+
+    def test_detail(self):
+        dessert = self.desserts[0]
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api_dessert_detail', kwargs={'recipe_slug': dessert.slug}))
+        data = response.json()
+        self.assertEqual(data['author']['slug'], self.author.profile.slug)
+        self.assertEqual([s['text'] for s in data['steps']], ['Испечь коржи'])
+        hidden = reverse('api_dessert_detail', kwargs={'recipe_slug': self.desserts[2].slug})
+        self.assertEqual(self.client.get(hidden).status_code, 404)
+
+        response = self.client.get(reverse('api_dessert_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_export(self):
+        with self.settings(API_EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(reverse('api_export_desserts'), {'fields': 'id,steps'})
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [d.pk for d in self.desserts[:2]])
+        self.assertEqual(len(json.loads(lines[0])['steps']), 1)
+
+
+@override_settings(JOBS_EAGER=False)
+class ImportRecipesTest(TestCase):
+    """Импорт из NDJSON с фото из zip и продолжение с контрольной точки"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=os.path.join(self.tmp, 'media'))
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.author = User.objects.create(username='author')
+        Category.objects.create(name='Торты')
+
+        self.media = os.path.join(self.tmp, 'media.zip')
+        with zipfile.ZipFile(self.media, 'w') as archive:
+            for name in ('medovik.png', 'medovik/1.png'):
+                archive.writestr(name, image_upload().read())
+        row = {
+            'title': 'Медовик', 'ingredients': 'мука - 200 г\nмед - 3 ст. л.', 'description': 'Описание',
+            'cooking_time': 90, 'photo': 'medovik.png', 'categories': ['Торты', 'Праздничные'],
+            'steps': [{'text': 'Испечь коржи', 'image': 'medovik/1.png'}],
+        }
+        self.path = os.path.join(self.tmp, 'recipes.ndjson')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for line in (row, row, dict(row, photo='missing.png'), dict(row, cooking_time='долго')):
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+    def run_import(self):
+        call_command('import_recipes', self.path, media=self.media, author='author', workers=0, batch_size=2,
+                     stdout=StringIO(), stderr=StringIO())
+
+    def test_import(self):
+        self.run_import()
+        desserts = list(Dessert.objects.order_by('pk'))
+        self.assertEqual([d.title for d in desserts], ['Медовик', 'Медовик'])
+        self.assertEqual(len({d.slug for d in desserts}), 2)
+        self.assertEqual(desserts[0].photo.name, 'photos/import/medovik.png')
+        self.assertEqual([s.recipe_text for s in desserts[0].recipe.all()], ['Испечь коржи'])
+        self.assertEqual(sorted(desserts[0].category.values_list('name', flat=True)), ['Праздничные', 'Торты'])
+        self.assertEqual(DessertIngredient.objects.filter(dessert=desserts[0]).count(), 2)
+        self.assertEqual(Category.objects.get(name='Торты').dessert_count, 2)
+        self.assertEqual(Profile.objects.get(user=self.author).dessert_count, 2)
+
+        # Повторный запуск продолжает с контрольной точки и ничего не дублирует
+        self.run_import()
+        self.assertEqual(Dessert.objects.count(), 2)
+
+
+class SlugsTest(TestCase):
+    """slug без отметки времени: постоянные, уникальные, в том числе для пачки"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='Повар')
+        self.category = Category.objects.create(name='Торты')
+
+    def create(self, title):
+        return Dessert.objects.create(
+            title=title, ingredients='мука - 200г', description='Описание',
+            photo='photos/dessert.jpg', cooking_time=30, profile=self.author.profile,
+        )
+
+    def test_slugs(self):
+        self.assertEqual(base_slug('Щербет «Ёжик»!'), 'scherbet-yozhik')
+        self.assertEqual(self.category.slug, 'tortyi')
+        self.assertEqual(self.author.profile.slug, 'povar')
+
+        first, second = self.create('Медовый торт'), self.create('Медовый торт')
+        self.assertEqual([first.slug, second.slug], ['medovyiy-tort', 'medovyiy-tort-2'])
+        first.title = 'Медовик'
+        first.save()
+        first.refresh_from_db()
+        self.assertEqual(first.slug, 'medovyiy-tort')
+
+        self.create('Медовый торт 4')
+        with self.assertNumQueries(2):
+            slugs = unique_slugs(Dessert, ['Медовый торт', 'Медовый торт', 'Наполеон'])
+        self.assertEqual(slugs, ['medovyiy-tort-3', 'medovyiy-tort-5', 'napoleon'])
+
+    def test_numbered_query(self):
+        for title in ('Торт', 'Торт', 'Торт с вишней', 'Торт 2 слоя', 'Торт 2024'):
+            self.create(title)
+        # Slug с той же основой, но без номера в конце, не загружаются
+        slugs = Dessert.objects.filter(numbered_query(['tort'])).values_list('slug', flat=True)
+        self.assertEqual(sorted(slugs), ['tort-2', 'tort-2024'])
+        self.assertEqual(unique_slug(Dessert, 'Торт'), 'tort-3')
+
+    def test_concurrent_save(self):
+        taken = self.create('Наполеон')
+        # Параллельный запрос занял slug между выбором и сохранением
+        with mock.patch('recipe.slugs.unique_slug', side_effect=[taken.slug, 'napoleon-2']):
+            dessert = self.create('Наполеон')
+        self.assertEqual(dessert.slug, 'napoleon-2')
+
+
+class FormattingTest(TestCase):
+    """Окончания после чисел и фильтры форматирования"""
+
+    def test_pluralize(self):
+        expected = {
+            0: '0 минут', 1: '1 минута', 2: '2 минуты', 5: '5 минут', 11: '11 минут', 12: '12 минут',
+            14: '14 минут', 21: '21 минута', 22: '22 минуты', 111: '111 минут', 122: '122 минуты',
+        }
+        self.assertEqual({n: formatting.minutes(n) for n in expected}, expected)
+        self.assertEqual(Dessert(cooking_time=13).cooking_time_mod(), '13 минут')
+        self.assertEqual(formatting.format_phone('9161234567'), '8 (916) 123-45-67')
+
+    def test_filters(self):
+        template = engines['django'].from_string(
+            '{% load recipe_tags %}{{ 3|comments }}; {{ 1|recipes }}; {{ 25|plural:"десерт,десерта,десертов" }}; {{ day|short_date }}')
+        day = timezone.make_aware(datetime(2022, 11, 28, 12, 0))
+        self.assertEqual(template.render({'day': day}), '3 комментария; 1 рецепт; 25 десертов; 28-11-2022')
+
+
+class TemplateWarmupTest(TestCase):
+    """Все шаблоны компилируются без ошибок и после прогрева берутся из кэша загрузчика"""
+
+    def test_warm_templates(self):
+        engine = engines['django'].engine
+        names = warmup.template_names(engine)
+        self.assertIn('recipe/base.html', names)
+        self.assertIn('recipe/home.html', names)
+
+        result = warmup.warm_templates()
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['templates'], len(names))
+        if not warmup.is_cached(engine):
+            self.skipTest('Кэш шаблонов выключен (TEMPLATE_CACHE=False)')
+        self.assertIn('recipe/base.html', engine.template_loaders[0].get_template_cache)
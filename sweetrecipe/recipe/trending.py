@@ -0,0 +1,151 @@
+"""Популярные десерты.
+
+Просмотры страниц рецептов копятся в памяти процесса и пачкой пишутся в
+DessertViewCount (строка на десерт и день), когда в буфере набирается
+TRENDING_FLUSH_SIZE просмотров или проходит TRENDING_FLUSH_INTERVAL секунд.
+Одна запись в базу приходится на пачку, а не на каждый просмотр.
+
+Фоновая задача 'trending.compute' раз в TRENDING_INTERVAL секунд считает
+Dessert.trending_score: просмотры и комментарии за последние
+TRENDING_WINDOW_DAYS дней с затуханием вдвое за TRENDING_HALF_LIFE_DAYS.
+Лента популярного читает готовый индекс по trending_score.
+"""
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import bump
+from .jobs import enqueue, task
+from .models import Comment, Dessert, DessertViewCount
+
+
+# Не храним просмотры дольше, чем нужно для расчета
+RETENTION_DAYS = 90
+
+
+class ViewBuffer:
+    """Просмотры по slug десерта, ожидающие записи в базу"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = Counter()
+        self._size = 0
+        self._flushed_at = time.monotonic()
+
+    def add(self, slug):
+        with self._lock:
+            self._views[slug] += 1
+            self._size += 1
+            due = (
+                self._size >= settings.TRENDING_FLUSH_SIZE
+                or time.monotonic() - self._flushed_at >= settings.TRENDING_FLUSH_INTERVAL
+            )
+            if not due:
+                return
+            views = self._take()
+        write_views(views)
+
+    def _take(self):
+        views, self._views = self._views, Counter()
+        self._size = 0
+        self._flushed_at = time.monotonic()
+        return views
+
+    def flush(self):
+        with self._lock:
+            views = self._take()
+        write_views(views)
+
+
+buffer = ViewBuffer()
+
+
+def record_view(slug):
+    """Учитывает просмотр страницы рецепта"""
+    buffer.add(slug)
+
+
+def write_views(views):
+    """Прибавляет просмотры к счетчикам за сегодня: INSERT пачкой и UPDATE на каждое число просмотров"""
+    if not views:
+        return
+    day = timezone.localdate()
+    ids = dict(Dessert.objects.filter(slug__in=views).values_list('slug', 'pk'))
+    by_count = defaultdict(list)
+    for slug, count in views.items():
+        if slug in ids:
+            by_count[count].append(ids[slug])
+    with transaction.atomic():
+        DessertViewCount.objects.bulk_create(
+            [DessertViewCount(dessert_id=pk, day=day) for pk in ids.values()], ignore_conflicts=True)
+        for count, dessert_ids in by_count.items():
+            DessertViewCount.objects.filter(day=day, dessert_id__in=dessert_ids).update(views=F('views') + count)
+
+
+@atexit.register
+def flush_on_exit():
+    try:
+        buffer.flush()
+    except Exception:
+        # База при завершении процесса может быть уже недоступна
+        pass
+
+
+def compute_scores(now=None) -> int:
+    """Пересчитывает trending_score всех десертов, возвращает число десертов с ненулевым значением"""
+    today = timezone.localdate(now)
+    since = today - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = settings.TRENDING_HALF_LIFE_DAYS
+
+    activity = defaultdict(float)
+    views = DessertViewCount.objects.filter(day__gt=since).values_list('dessert_id', 'day', 'views')
+    for dessert_id, day, count in views.iterator():
+        activity[dessert_id] += count * 0.5 ** ((today - day).days / half_life)
+
+    comments = (
+        Comment.objects.filter(time_create__date__gt=since)
+        .annotate(day=TruncDate('time_create')).order_by()
+        .values_list('dessert_id', 'day').annotate(total=Count('pk'))
+    )
+    for dessert_id, day, count in comments.iterator():
+        activity[dessert_id] += settings.TRENDING_COMMENT_WEIGHT * count * 0.5 ** ((today - day).days / half_life)
+
+    scored = [Dessert(pk=pk, trending_score=round(score, 4)) for pk, score in activity.items() if score > 0]
+    with transaction.atomic():
+        Dessert.objects.filter(trending_score__gt=0).update(trending_score=0)
+        Dessert.objects.bulk_update(scored, ['trending_score'], batch_size=500)
+        DessertViewCount.objects.filter(day__lt=today - timedelta(days=RETENTION_DAYS)).delete()
+    bump('trending')
+    return len(scored)
+
+
+@task('trending.compute')
+def compute_task():
+    compute_scores()
+    # Задача планирует сама себя, пока работает воркер. Без воркера
+    # (JOBS_EAGER) пересчет запускают командой compute_trending
+    if not settings.JOBS_EAGER:
+        schedule(delay=settings.TRENDING_INTERVAL)
+
+
+def schedule(delay=0):
+    enqueue('trending.compute', key='trending.compute', delay=delay)
+
+
+class ViewTrackingMixin:
+    """Считает просмотры страницы десерта, в том числе отданные из кэша ответов"""
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        # 304 - тоже просмотр, страница просто уже есть у клиента
+        if request.method == 'GET' and response.status_code in (200, 304):
+            record_view(self.kwargs[self.slug_url_kwarg])
+        return response
@@ -1,5 +1,6 @@
 from django.urls import path
 
+from .api import *
 from .views import *
 
 
@@ -8,8 +9,12 @@ urlpatterns = [
     path('about/', About.as_view(), name='about'),
     path('addrecipe/', AddRecipe.as_view(), name='addrecipe'),
     path('recipe/<slug:recipe_slug>/', ShowRecipe.as_view(), name='recipe'),
+    path('recipe/<slug:recipe_slug>/comments/', RecipeComments.as_view(), name='recipe_comments'),
     path('category-list/', CategoryList.as_view(), name='category_list'),
+    path('trending/', Trending.as_view(), name='trending'),
     path('category/<slug:category_slug>/', ShowCategory.as_view(), name='showcategory'),
+    path('search/', Search.as_view(), name='search'),
+    path('what-can-i-bake/', WhatCanIBake.as_view(), name='what_can_i_bake'),
     path('register/', RegisterUser.as_view(), name='register'),
     path('login/', LoginUser.as_view(), name='login'),
     path('logout/', logout_user, name='logout'),
@@ -32,4 +37,11 @@ urlpatterns = [
     path('reset/<uidb64>/<token>', PasswordResetConfirmView.as_view(template_name = "recipe/password_reset_confirm.html"), name ='password_reset_confirm'),
     path('reset_password_complete/', PasswordResetCompleteView.as_view(), name ='password_reset_complete'),
     path('add-category/', AddCategory.as_view(), name='add_category'),
+    path('metrics', Metrics.as_view(), name='metrics'),
+    path('api/v1/desserts/', DessertListApi.as_view(), name='api_dessert_list'),
+    path('api/v1/desserts/<slug:recipe_slug>/', DessertDetailApi.as_view(), name='api_dessert_detail'),
+    path('api/v1/desserts/<slug:recipe_slug>/comments/', DessertCommentsApi.as_view(), name='api_dessert_comments'),
+    path('api/v1/categories/', CategoryListApi.as_view(), name='api_category_list'),
+    path('api/v1/users/<str:username_slug>/desserts/', UserDessertsApi.as_view(), name='api_user_desserts'),
+    path('api/v1/export/desserts.ndjson', DessertExportApi.as_view(), name='api_export_desserts'),
 ]
@@ -1,11 +1,11 @@
-from django.db.models import Count
-
 from .models import *
 
 
 
 menu_left = [
     {'title': "Категории", 'url_name': 'category_list'},
+    {'title': "Популярное", 'url_name': 'trending'},
+    {'title': "Что испечь?", 'url_name': 'what_can_i_bake'},
     {'title': "О нас", 'url_name': 'about'},
 ]
 menu_right = [
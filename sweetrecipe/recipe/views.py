@@ -1,31 +1,44 @@
 from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import (LoginView, PasswordResetConfirmView,
                                        PasswordResetView)
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.db.models import Q
 from django.forms import modelformset_factory
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   TemplateView, View)
 
+from . import ingredients, metrics, search
+from .authoring import save_dessert
+from .cache import CachedResponseMixin, get_versions
+from .categories import registry as category_registry
 from .forms import *
+from .pagination import CursorPaginationMixin, paginate_by_cursor
+from .related import related_desserts
+from .trending import ViewTrackingMixin
 from .models import *
 from .utils import *
 
 
-class Home(DataMixin, ListView):
+class Home(CachedResponseMixin, DataMixin, CursorPaginationMixin, ListView):
     """Главная страница"""
+    cache_namespaces = ('desserts', 'categories', 'profiles')
+    replica_reads = True
     model = Dessert
     template_name = 'recipe/home.html'
     context_object_name = 'desserts'
     paginate_by = 2
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
-        return Dessert.objects.get_queryset().order_by('id').select_related('profile')
+        return Dessert.published.cards()
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -47,7 +60,7 @@ class AddRecipe(LoginRequiredMixin ,DataMixin, View):
     template_name = 'recipe/addrecipe.html'
     login_url = 'login'
     # Здесь используются формсеты для динамического добавления формы, с текстом и фото рецепта
-    AddRecipeFormSet = modelformset_factory(Recipe, form=AddRecipeForm, max_num=20, extra=1)
+    AddRecipeFormSet = modelformset_factory(Recipe, form=AddRecipeForm, formset=BaseRecipeFormSet, max_num=20, extra=1)
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_user_context()
@@ -69,16 +82,7 @@ class AddRecipe(LoginRequiredMixin ,DataMixin, View):
         formset = self.AddRecipeFormSet(request.POST, request.FILES)
         
         if main_form.is_valid() and formset.is_valid():
-            main_form_comf = main_form.save(commit=False)
-            
-            for form in formset.save(commit=False):
-                form.dessert = main_form_comf
-
-            main_form_comf.profile = request.user.profile
-            main_form.save()
-            formset.save()
-            
-
+            save_dessert(main_form, formset, request.user.profile)
             return redirect(reverse_lazy('home'))
  
         return render(
@@ -93,18 +97,38 @@ class AddRecipe(LoginRequiredMixin ,DataMixin, View):
         )
 
 
-class ShowRecipe(DataMixin, View):
+COMMENTS_PER_PAGE = 20
+COMMENT_ORDERING = ('-time_create', '-id')
+
+
+def comment_page(dessert, cursor=None):
+    """Страница комментариев десерта, новые сверху"""
+    comments = Comment.objects.filter(dessert=dessert).select_related('profile__user')
+    return paginate_by_cursor(comments, COMMENT_ORDERING, COMMENTS_PER_PAGE, cursor)
+
+
+class ShowRecipe(ViewTrackingMixin, CachedResponseMixin, DataMixin, View):
     """Страница с десертом и его рецептом"""
+    cache_namespaces = ('dessert:{recipe_slug}', 'categories', 'profiles', 'related')
+    replica_reads = True
     template_name = 'recipe/recipe.html'
     slug_url_kwarg = 'recipe_slug'
 
+    def get_queryset(self):
+        """Опубликованные десерты, автору - и свои снятые с публикации"""
+        if self.request.user.is_authenticated:
+            desserts = Dessert.objects.filter(Q(is_published=True) | Q(profile__user=self.request.user))
+        else:
+            desserts = Dessert.published.all()
+        return desserts.select_related('profile__user')
+
     def get(self, request, *args, **kwargs):
         self.object = self.get_user_context()
         try:
-            dessert = Dessert.objects.select_related('profile').get(slug = self.kwargs['recipe_slug'])
+            dessert = self.get_queryset().get(slug = self.kwargs['recipe_slug'])
         except ObjectDoesNotExist:
             raise Http404
-        comments = Comment.objects.filter(dessert = dessert).select_related('profile')
+        comments = SimpleLazyObject(lambda: comment_page(dessert, request.GET.get('cursor')))
         return render(
             request,
             template_name=self.template_name,
@@ -114,14 +138,16 @@ class ShowRecipe(DataMixin, View):
                 'title': 'Рецепт' + ' ' + dessert.title,
                 'dessert': dessert,
                 'comments': comments,
+                'comments_version': get_versions(f'comments:{dessert.pk}')[f'comments:{dessert.pk}'],
+                'related': SimpleLazyObject(lambda: related_desserts(dessert)),
                 'form': CommentForm,
             }
         )
  
     def post(self, request, *args, **kwargs):
         form = CommentForm(request.POST)
-        dessert = Dessert.objects.select_related('profile').get(slug = self.kwargs['recipe_slug'])
-        comments = Comment.objects.filter(dessert = dessert).select_related('profile')
+        dessert = get_object_or_404(self.get_queryset(), slug = self.kwargs['recipe_slug'])
+        comments = SimpleLazyObject(lambda: comment_page(dessert, request.GET.get('cursor')))
 
         if form.is_valid():
             form_comf = form.save(commit=False)
@@ -140,17 +166,46 @@ class ShowRecipe(DataMixin, View):
                 'title': 'Рецепт' + ' ' + dessert.title,
                 'dessert': dessert,
                 'comments': comments,
+                'comments_version': get_versions(f'comments:{dessert.pk}')[f'comments:{dessert.pk}'],
+                'related': SimpleLazyObject(lambda: related_desserts(dessert)),
                 'form': form
             }
         )
 
 
+class RecipeComments(CachedResponseMixin, View):
+    """Следующая страница комментариев для кнопки "Показать еще": HTML-фрагмент или JSON (?format=json)"""
+    cache_namespaces = ('dessert:{recipe_slug}', 'profiles')
+    replica_reads = True
+    template_name = 'recipe/comment_list.html'
+
+    def get(self, request, *args, **kwargs):
+        dessert = get_object_or_404(Dessert.published.only('pk', 'slug', 'comment_count'), slug=self.kwargs['recipe_slug'])
+        comments = comment_page(dessert, request.GET.get('cursor'))
+        if request.GET.get('format') != 'json':
+            return render(request, self.template_name, {'dessert': dessert, 'comments': comments})
+        return JsonResponse({
+            'comment_count': dessert.comment_count,
+            'next_cursor': comments.next_cursor,
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'text': comment.text,
+                    'time_create': comment.time_create.isoformat(),
+                    'author': comment.profile.name_or_username(),
+                    'author_url': comment.profile.get_absolute_url(),
+                }
+                for comment in comments
+            ],
+        })
+
+
 class EditRecipe(LoginRequiredMixin, DataMixin, View):
     """Страница изменения десерта"""
     template_name = 'recipe/addrecipe.html'
     login_url = 'login'
     slug_url_kwarg = 'recipe_slug'
-    AddRecipeFormSet = modelformset_factory(Recipe, form=AddRecipeForm, max_num=20, extra=1)
+    AddRecipeFormSet = modelformset_factory(Recipe, form=AddRecipeForm, formset=BaseRecipeFormSet, max_num=20, extra=1)
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_user_context()
@@ -176,21 +231,15 @@ class EditRecipe(LoginRequiredMixin, DataMixin, View):
             raise PermissionDenied
     
     def post(self, request, *args, **kwargs):
-        dessert = Dessert.objects.get(slug = self.kwargs['recipe_slug'])
+        dessert = get_object_or_404(Dessert.objects.select_related('profile'), slug = self.kwargs['recipe_slug'])
+        if dessert.profile.user_id != request.user.pk:
+            raise PermissionDenied
         main_form = AddRecipeMainForm(request.POST, request.FILES, instance=dessert)
-        formset = self.AddRecipeFormSet(request.POST, request.FILES)
+        # Формсет меняет только шаги этого десерта
+        formset = self.AddRecipeFormSet(request.POST, request.FILES, queryset=Recipe.objects.filter(dessert=dessert))
 
         if main_form.is_valid() and formset.is_valid():
-            
-            main_form_comf = main_form.save(commit=False)
-            
-            for form in formset.save(commit=False):
-                form.dessert = main_form_comf
-
-            main_form_comf.user = request.user
-            formset.save()
-            main_form_comf.save()
-            
+            save_dessert(main_form, formset, dessert.profile)
             return redirect(reverse_lazy('home'))
  
         return render(
@@ -234,37 +283,108 @@ class ConfirmDeleteRecipe(LoginRequiredMixin, DataMixin, TemplateView):
         return dict(list(context.items()) + list(c_def.items()))
 
 
-class CategoryList(DataMixin, ListView):
+class Trending(CachedResponseMixin, DataMixin, CursorPaginationMixin, ListView):
+    """Популярные десерты по trending_score"""
+    cache_namespaces = ('trending', 'desserts', 'categories', 'profiles')
+    replica_reads = True
+    paginate_by = 12
+    template_name = 'recipe/home.html'
+    context_object_name = 'desserts'
+    cursor_ordering = ('-trending_score', '-id')
+
+    def get_queryset(self):
+        return Dessert.published.filter(trending_score__gt=0).cards()
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(**kwargs)
+        c_def = self.get_user_context(title='Популярное', heading='Популярные десерты')
+        return dict(list(context.items()) + list(c_def.items()))
+
+
+class CategoryList(CachedResponseMixin, DataMixin, ListView):
     """Страница со списком категорий"""
+    cache_namespaces = ('categories', 'category_counts')
+    replica_reads = True
     model = Category
     template_name = 'recipe/category_list.html'
     context_object_name = 'categorys'
 
+    def get_queryset(self):
+        return category_registry.all()
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
         c_def = self.get_user_context(title="Категории")
         return dict(list(context.items()) + list(c_def.items()))
 
     
-class ShowCategory(DataMixin, ListView):
+class ShowCategory(CachedResponseMixin, DataMixin, CursorPaginationMixin, ListView):
     """Главная страница с десертами только выбранной категории"""
+    cache_namespaces = ('desserts', 'categories', 'profiles')
+    replica_reads = True
     paginate_by = 12
     template_name = 'recipe/home.html'
     model = Dessert
     context_object_name = 'desserts'
     slug_url_kwarg = 'category_slug'
+    cursor_ordering = ('-time_create', '-id')
 
     def get_queryset(self):
-        return Dessert.objects.filter(category__slug=self.kwargs['category_slug']).prefetch_related('category')
+        self.category = category_registry.get(self.kwargs['category_slug'])
+        if self.category is None:
+            raise Http404
+        return Dessert.published.filter(category=self.category).cards()
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = Category.objects.get(slug=self.kwargs['category_slug'])
+        category = self.category
         c_def = self.get_user_context(title="Категория - " +  str(category.name), category_name = category.name)
 
         return dict(list(context.items()) + list(c_def.items()))
 
 
+class Search(DataMixin, ListView):
+    """Страница с результатами поиска десертов"""
+    paginate_by = 12
+    template_name = 'recipe/home.html'
+    context_object_name = 'desserts'
+
+    def get_queryset(self):
+        # В пагинатор попадают только id опубликованных десертов, сами десерты загружаются для текущей страницы
+        return search.search(self.request.GET.get('q', ''))
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, ids, is_paginated = super().paginate_queryset(queryset, page_size)
+        desserts = Dessert.published.cards().in_bulk(ids)
+        page.object_list = [desserts[pk] for pk in ids if pk in desserts]
+        return paginator, page, page.object_list, is_paginated
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '')
+        c_def = self.get_user_context(title="Поиск - " + query, search_query=query)
+        return dict(list(context.items()) + list(c_def.items()))
+
+
+class WhatCanIBake(DataMixin, TemplateView):
+    """Поиск десертов по ингредиентам, которые есть у пользователя"""
+    template_name = 'recipe/what_can_i_bake.html'
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = IngredientSearchForm(self.request.GET or None)
+        results = []
+        if form.is_valid():
+            matches = ingredients.desserts_by_ingredients(form.cleaned_data['ingredients'])
+            desserts = Dessert.published.cards().in_bulk([m['dessert'] for m in matches])
+            results = [
+                {'dessert': desserts[m['dessert']], 'matched': m['matched'], 'total': m['total']}
+                for m in matches if m['dessert'] in desserts
+            ]
+        c_def = self.get_user_context(title="Что испечь?", form=form, results=results)
+        return dict(list(context.items()) + list(c_def.items()))
+
+
 class RegisterUser(DataMixin, CreateView):
     form_class = RegisterUserForm
     template_name = 'recipe/register.html'
@@ -324,7 +444,9 @@ class UserProfile(LoginRequiredMixin, DataMixin, DetailView):
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        c_def = self.get_user_context(title = 'Аккаунт',)
+        desserts = Dessert.objects.filter(profile__user=self.request.user).only(
+            'id', 'title', 'slug', 'photo', 'photo_variants', 'time_create').order_by('-time_create', '-id')
+        c_def = self.get_user_context(title = 'Аккаунт', desserts = desserts)
         return dict(list(context.items()) + list(c_def.items()))
 
 
@@ -652,19 +774,24 @@ class UpdateUserPass(LoginRequiredMixin,DataMixin, View):
         )
 
 
-class ShowUserDessert(DataMixin, ListView):
+class ShowUserDessert(DataMixin, CursorPaginationMixin, ListView):
     """Главная страница с десертами только выбранного пользователя"""
+    # Ответ не кэшируется, но фрагменты карточек зависят от этих версий (routers.recently_changed)
+    cache_namespaces = ('desserts', 'categories', 'profiles')
+    replica_reads = True
     paginate_by = 12
     template_name = 'recipe/home.html'
     model = Dessert
     context_object_name = 'desserts'
+    cursor_ordering = ('-time_create', '-id')
     
     def get_queryset(self):
-        return Dessert.objects.filter(profile__slug=self.kwargs['username_slug']).select_related('profile')
+        self.profile = get_object_or_404(Profile.objects.select_related('user'), slug=self.kwargs['username_slug'])
+        return Dessert.published.filter(profile=self.profile).cards()
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        profile = Profile.objects.get(slug=self.kwargs['username_slug'])
+        profile = self.profile
         c_def = self.get_user_context(title="Рецепты от " + str(profile.user.username), username_dessert = profile)
         return dict(list(context.items()) + list(c_def.items()))
 
@@ -725,4 +852,13 @@ class AddCategory(DataMixin, CreateView):
         if not self.request.user.is_staff:
             raise PermissionDenied
         c_def = self.get_user_context(title="Добавление категории")
-        return dict(list(context.items()) + list(c_def.items()))
\ No newline at end of file
+        return dict(list(context.items()) + list(c_def.items()))
+
+
+class Metrics(View):
+    """Метрики процесса в формате Prometheus"""
+
+    def get(self, request, *args, **kwargs):
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+            raise Http404
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
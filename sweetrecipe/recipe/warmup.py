@@ -0,0 +1,78 @@
+"""Предварительная компиляция шаблонов.
+
+С cached.Loader шаблон разбирается при первом обращении к нему в процессе,
+и первый запрос каждой страницы в новом воркере платит за разбор
+base.html и всех шаблонов страницы. warm_templates находит все шаблоны в
+папках загрузчиков и компилирует их заранее: при запуске процесса
+(RecipeConfig.ready, TEMPLATE_WARMUP=True) или командой warm_templates,
+которая заодно проверяет, что все шаблоны разбираются без ошибок.
+"""
+import logging
+import os
+import time
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt', '.xml')
+
+# Результат последнего прогрева в этом процессе
+last_result = None
+
+
+def template_names(engine) -> list:
+    """Имена всех шаблонов в папках загрузчиков движка, в порядке поиска"""
+    names = {}
+    for loader in engine.template_loaders:
+        for child in getattr(loader, 'loaders', [loader]):
+            for directory in child.get_dirs():
+                for root, _, files in os.walk(directory):
+                    for filename in sorted(files):
+                        if filename.endswith(TEMPLATE_EXTENSIONS):
+                            path = os.path.relpath(os.path.join(root, filename), directory)
+                            names.setdefault(path.replace(os.sep, '/'), None)
+    return list(names)
+
+
+def is_cached(engine) -> bool:
+    return any(isinstance(loader, CachedLoader) for loader in engine.template_loaders)
+
+
+def warm_templates() -> dict:
+    """Компилирует все шаблоны движков DjangoTemplates, возвращает их число, ошибки и время"""
+    global last_result
+    started = time.perf_counter()
+    compiled, errors, cached = 0, [], True
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        engine = backend.engine
+        cached = cached and is_cached(engine)
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+                compiled += 1
+            except (TemplateSyntaxError, TemplateDoesNotExist) as e:
+                errors.append((name, str(e)))
+    last_result = {
+        'templates': compiled,
+        'errors': errors,
+        'cached': cached,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    return last_result
+
+
+def warm_on_startup():
+    """Прогрев при запуске процесса; без cached.Loader он бесполезен и пропускается"""
+    if not all(is_cached(b.engine) for b in engines.all() if isinstance(b, DjangoTemplates)):
+        logger.warning('TEMPLATE_WARMUP без cached.Loader (TEMPLATE_CACHE=False) не имеет смысла, пропущен')
+        return
+    result = warm_templates()
+    for name, error in result['errors']:
+        logger.error('Шаблон %s не компилируется: %s', name, error)
+    logger.info('Скомпилировано шаблонов: %s за %s мс', result['templates'], result['elapsed_ms'])
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'recipe.metrics.MetricsMiddleware',
+    'recipe.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -44,36 +46,146 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'sweetrecipe.urls'
 
+# Шаблоны разбираются один раз и хранятся в памяти процесса (cached.Loader).
+# По умолчанию включено без DEBUG; с DEBUG runserver сбрасывает кэш при
+# изменении файлов шаблонов. TEMPLATE_WARMUP=True компилирует все шаблоны
+# при запуске процесса, чтобы первый запрос не тратил время на разбор
+TEMPLATE_CACHE = os.getenv('TEMPLATE_CACHE', str(not DEBUG)) == 'True'
+TEMPLATE_WARMUP = os.getenv('TEMPLATE_WARMUP', 'False') == 'True'
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if TEMPLATE_CACHE:
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендера для /metrics
+        'BACKEND': 'recipe.metrics.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'recipe.context_processors.cache_versions',
             ],
         },
     },
 ]
 
+# debug_toolbar ищет app_directories.Loader только на верхнем уровне
+# loaders, а не внутри cached.Loader
+SILENCED_SYSTEM_CHECKS = ['debug_toolbar.W006']
+
 WSGI_APPLICATION = 'sweetrecipe.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (по умолчанию) или postgresql. Соединения живут
+# DB_CONN_MAX_AGE секунд и переиспользуются между запросами, при
+# DB_CONN_HEALTH_CHECKS=True в начале запроса проверяется, что переиспользуемое
+# соединение живо (recipe.db; не ключ DATABASES - Django 3.2 его не знает)
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'sweetrecipe'),
+            'USER': os.getenv('DB_USER', 'sweetrecipe'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        }
+    }
+
+# Реплики для чтения: DB_REPLICAS - через пробел пути к файлам SQLite или
+# хосты PostgreSQL (host или host:port, остальные параметры как у default).
+# После записи пользователь REPLICA_PIN_SECONDS секунд читает из default
+
+DB_REPLICAS = os.getenv('DB_REPLICAS', '').split()
+REPLICA_DATABASES = []
+
+for number, replica in enumerate(DB_REPLICAS, 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DB_ENGINE == 'postgresql':
+        host, _, port = replica.partition(':')
+        DATABASES[alias].update(HOST=host, PORT=port or DATABASES['default']['PORT'])
+    else:
+        DATABASES[alias]['NAME'] = replica
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['recipe.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+# PRAGMA для каждого нового соединения с SQLite (recipe.db): WAL, чтобы
+# чтение не ждало записи, ожидание блокировки вместо ошибки
+# "database is locked" и чтение файла базы через mmap
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
 }
 
 
+# Cache: locmem для одного процесса, file или db для нескольких процессов
+# (для db нужно выполнить python manage.py createcachetable)
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', 'recipe_cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sweetrecipe',
+        }
+    }
+
+# Время жизни закэшированных страниц и фрагментов (в секундах)
+CACHE_PAGE_TIMEOUT = int(os.getenv('CACHE_PAGE_TIMEOUT', 600))
+
+# Сколько секунд браузер и обратный прокси могут отдавать анонимную
+# страницу без проверки (после - условный GET с ETag/Last-Modified)
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -125,4 +237,50 @@ MEDIA_URL = '/media/'
 
 REST_FRAMEWORK = {
     'DATETIME_FORMAT': "%d.%m.%y %H:%M:%S",
-}
\ No newline at end of file
+}
+
+# Search: auto (FTS5 на SQLite, иначе SearchPosting), fts5 или index
+
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+
+# Фоновые задачи: при JOBS_EAGER задачи выполняются сразу после коммита,
+# иначе их выполняет manage.py run_worker
+
+JOBS_EAGER = os.getenv('JOBS_EAGER', str(DEBUG)) == 'True'
+JOBS_VISIBILITY_TIMEOUT = int(os.getenv('JOBS_VISIBILITY_TIMEOUT', 300))
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 30))
+
+# Метрики: /metrics доступна только с адресов METRICS_ALLOWED_IPS.
+# Запросы дольше METRICS_SLOW_REQUEST_MS (0 - выключено) с вероятностью
+# METRICS_SLOW_SAMPLE_RATE пишутся в лог вместе с SQL
+
+METRICS_PATH = '/metrics'
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', 0))
+METRICS_SLOW_SAMPLE_RATE = float(os.getenv('METRICS_SLOW_SAMPLE_RATE', 0.1))
+
+# Популярное: буфер просмотров пишется в базу каждые TRENDING_FLUSH_SIZE
+# просмотров или TRENDING_FLUSH_INTERVAL секунд, оценки пересчитываются
+# задачей раз в TRENDING_INTERVAL секунд
+
+TRENDING_FLUSH_SIZE = int(os.getenv('TRENDING_FLUSH_SIZE', 100))
+TRENDING_FLUSH_INTERVAL = int(os.getenv('TRENDING_FLUSH_INTERVAL', 30))
+TRENDING_INTERVAL = int(os.getenv('TRENDING_INTERVAL', 600))
+TRENDING_WINDOW_DAYS = 14
+TRENDING_HALF_LIFE_DAYS = 3
+TRENDING_COMMENT_WEIGHT = 5
+
+
+# Похожие десерты: сколько соседей хранить для каждого десерта и вес
+# совпадения категории относительно совпадения ингредиента
+
+RELATED_DESSERTS_COUNT = 6
+RELATED_CATEGORY_WEIGHT = 2.0
+
+
+# JSON API (/api/v1/): размер страницы по умолчанию и наибольший (?limit=),
+# сколько десертов читается из базы за раз при потоковой выгрузке
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_EXPORT_CHUNK_SIZE = int(os.getenv('API_EXPORT_CHUNK_SIZE', 500))